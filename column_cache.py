@@ -0,0 +1,167 @@
+# Columnar version of the per-branch csv files in cycletimes_cache.
+#
+# Each <branch>_<repository>.csv gets a <branch>_<repository>.columns
+# directory holding one .npy file per CSV_FIELD_ORDER column, which
+# numpy can memory-map.  Dates are int64 seconds since the epoch (UTC),
+# counts and revisions are int64, and strings are int32 indexes into a
+# newline separated <field>.strings dictionary.  Loading one of these
+# avoids a strptime per date per row.
+
+import numpy
+import os
+import shutil
+
+
+COLUMNS_EXTENSION = '.columns'
+
+# Stands in for None in the integer columns.
+MISSING = numpy.iinfo(numpy.int64).min
+
+INT_FIELDS = [
+    'svn_revision',
+    'review_id',
+    'lgtms',
+    'cq_starts',
+]
+
+EPOCH = numpy.datetime64(0, 's')
+
+RECORD_BLOCK_SIZE = 4096
+
+
+def is_date_field(field):
+    return field.endswith('_date')
+
+
+def is_string_field(field):
+    return not is_date_field(field) and field not in INT_FIELDS
+
+
+def table_path_for(csv_path):
+    return os.path.splitext(csv_path)[0] + COLUMNS_EXTENSION
+
+
+def is_current(table_path, csv_path):
+    """True if table_path exists and is at least as new as csv_path."""
+    if not os.path.isdir(table_path):
+        return False
+    return os.path.getmtime(table_path) >= os.path.getmtime(csv_path)
+
+
+def _date_to_seconds(date):
+    if date is None:
+        return MISSING
+    return int((numpy.datetime64(date, 's') - EPOCH).astype(numpy.int64))
+
+
+def _int_or_missing(value):
+    return MISSING if value is None else int(value)
+
+
+def _encode_strings(values):
+    strings = []
+    codes = {}
+    encoded = numpy.empty(len(values), dtype=numpy.int32)
+    for index, value in enumerate(values):
+        if value is None:
+            encoded[index] = -1
+            continue
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(strings)
+            strings.append(value)
+        encoded[index] = code
+    return encoded, strings
+
+
+def write_table(table_path, records, fields):
+    # Written next to table_path and renamed into place, so an interrupted
+    # write never leaves a partial table for is_current to accept.
+    temp_path = table_path + '.tmp'
+    if os.path.exists(temp_path):
+        shutil.rmtree(temp_path)
+    os.makedirs(temp_path)
+    for field in fields:
+        values = [record[field] for record in records]
+        column_path = os.path.join(temp_path, field + '.npy')
+        if is_date_field(field):
+            numpy.save(column_path, numpy.array(map(_date_to_seconds, values), dtype=numpy.int64))
+        elif field in INT_FIELDS:
+            numpy.save(column_path, numpy.array(map(_int_or_missing, values), dtype=numpy.int64))
+        else:
+            encoded, strings = _encode_strings(values)
+            numpy.save(column_path, encoded)
+            with open(os.path.join(temp_path, field + '.strings'), 'w') as strings_file:
+                strings_file.write('\n'.join(strings))
+    # A directory can't be renamed over a non-empty one.
+    if os.path.exists(table_path):
+        shutil.rmtree(table_path)
+    os.rename(temp_path, table_path)
+
+
+def read_table(table_path, fields, mmap=True):
+    """Returns {field: array} and {field: strings} for a table."""
+    mmap_mode = 'r' if mmap else None
+    columns = {}
+    dictionaries = {}
+    for field in fields:
+        columns[field] = numpy.load(os.path.join(table_path, field + '.npy'), mmap_mode=mmap_mode)
+        if is_string_field(field):
+            with open(os.path.join(table_path, field + '.strings')) as strings_file:
+                text = strings_file.read()
+            # ''.split('\n') is [''], which is also what we want for one empty string.
+            dictionaries[field] = text.split('\n')
+    return columns, dictionaries
+
+
+def _decode_column(field, column, dictionary):
+    missing = column == (-1 if dictionary is not None else MISSING)
+    if is_date_field(field):
+        values = (EPOCH + column.astype('timedelta64[s]')).astype(object)
+    elif dictionary is not None:
+        values = [dictionary[code] for code in column]
+    else:
+        values = map(str, column)
+    return [None if is_missing else value for value, is_missing in zip(values, missing)]
+
+
+def iter_records(table_path, fields, row_filter=None):
+    """Yields the records read_csv would return for the csv the table came from.
+
+    row_filter(columns, dictionaries) may return a boolean array selecting
+    rows, so unwanted rows are never decoded.  Rows are decoded
+    RECORD_BLOCK_SIZE at a time from the memory-mapped columns, so only
+    one block is ever in memory.
+    """
+    columns, dictionaries = read_table(table_path, fields)
+    if row_filter:
+        rows = numpy.flatnonzero(row_filter(columns, dictionaries))
+    else:
+        rows = numpy.arange(len(columns[fields[0]]))
+    for start in xrange(0, len(rows), RECORD_BLOCK_SIZE):
+        block = rows[start:start + RECORD_BLOCK_SIZE]
+        decoded = [_decode_column(field, columns[field][block], dictionaries.get(field)) for field in fields]
+        for row in zip(*decoded):
+            yield dict(zip(fields, row))
+
+
+def read_records(table_path, fields, row_filter=None):
+    return list(iter_records(table_path, fields, row_filter))
+
+
+def read_columns(table_path, fields, row_filter=None):
+    """Like read_records, but returns {field: array}.
+
+    Dates and ints stay int64 (with MISSING for None), which is what
+    the stats want anyway.  Strings are decoded into object arrays.
+    """
+    columns, dictionaries = read_table(table_path, fields)
+    selected = row_filter(columns, dictionaries) if row_filter else slice(None)
+    decoded = {}
+    for field in fields:
+        column = columns[field][selected]
+        if field in dictionaries:
+            # Code -1 picks the trailing None.
+            column = numpy.array(dictionaries[field] + [None], dtype=object)[column]
+        decoded[field] = numpy.array(column)
+    return decoded
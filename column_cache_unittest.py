@@ -0,0 +1,109 @@
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import datetime
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import column_cache
+import numpy
+
+
+FIELDS = ['repository', 'svn_revision', 'commit_author', 'commit_date']
+
+# What read_csv returns: dates are parsed, everything else is a string.
+RECORDS = [
+    {'repository': 'chrome', 'svn_revision': '100', 'commit_author': 'a@chromium.org',
+        'commit_date': datetime.datetime(2014, 5, 1, 12, 30, 5)},
+    {'repository': 'chrome', 'svn_revision': None, 'commit_author': None, 'commit_date': None},
+    {'repository': 'chrome', 'svn_revision': '102', 'commit_author': 'b@chromium.org',
+        'commit_date': datetime.datetime(1969, 12, 31, 23, 59, 59)},
+    {'repository': 'chrome', 'svn_revision': '103', 'commit_author': 'a@chromium.org',
+        'commit_date': datetime.datetime(2014, 5, 3)},
+]
+
+
+class ColumnCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.csv_path = os.path.join(self.temp_dir, '2000_chrome.csv')
+        with open(self.csv_path, 'w') as csv_file:
+            csv_file.write(','.join(FIELDS) + '\n')
+        self.table_path = column_cache.table_path_for(self.csv_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_round_trip(self):
+        self.assertFalse(column_cache.is_current(self.table_path, self.csv_path))
+        column_cache.write_table(self.table_path, RECORDS, FIELDS)
+        self.assertTrue(column_cache.is_current(self.table_path, self.csv_path))
+        self.assertEquals(self.table_path, os.path.join(self.temp_dir, '2000_chrome.columns'))
+        self.assertEquals(column_cache.read_records(self.table_path, FIELDS), RECORDS)
+        self.assertEquals(column_cache.read_records(self.table_path, ['commit_author']),
+            [{'commit_author': record['commit_author']} for record in RECORDS])
+
+    def test_iter_records_in_blocks(self):
+        records = [dict(RECORDS[index % len(RECORDS)], repository=str(index)) for index in range(10)]
+        column_cache.write_table(self.table_path, records, FIELDS)
+        original_block_size = column_cache.RECORD_BLOCK_SIZE
+        column_cache.RECORD_BLOCK_SIZE = 3
+        try:
+            self.assertEquals(list(column_cache.iter_records(self.table_path, FIELDS)), records)
+        finally:
+            column_cache.RECORD_BLOCK_SIZE = original_block_size
+
+    def test_row_filter(self):
+        column_cache.write_table(self.table_path, RECORDS, FIELDS)
+        row_filters = []
+
+        def by_a(columns, dictionaries):
+            row_filters.append(sorted(columns.keys()))
+            a_code = dictionaries['commit_author'].index('a@chromium.org')
+            return columns['commit_author'] == a_code
+
+        self.assertEquals(column_cache.read_records(self.table_path, FIELDS, by_a), [RECORDS[0], RECORDS[3]])
+        self.assertEquals(row_filters, [sorted(FIELDS)])
+
+        columns = column_cache.read_columns(self.table_path, FIELDS, by_a)
+        self.assertEquals(list(columns['svn_revision']), [100, 103])
+        self.assertEquals(list(columns['commit_author']), ['a@chromium.org', 'a@chromium.org'])
+        self.assertEquals(list(columns['commit_date']), [1398947405, 1399075200])
+
+    def test_read_columns_missing_values(self):
+        column_cache.write_table(self.table_path, RECORDS, FIELDS)
+        columns = column_cache.read_columns(self.table_path, FIELDS)
+        self.assertEquals(columns['svn_revision'].dtype, numpy.int64)
+        self.assertEquals(columns['svn_revision'][1], column_cache.MISSING)
+        self.assertEquals(columns['commit_date'][1], column_cache.MISSING)
+        self.assertEquals(columns['commit_date'][2], -1)
+        self.assertEquals(columns['commit_author'][1], None)
+
+    def test_stale_and_interrupted_tables(self):
+        column_cache.write_table(self.table_path, RECORDS, FIELDS)
+        # The csv was rewritten after the table.
+        later = time.time() + 10
+        os.utime(self.csv_path, (later, later))
+        self.assertFalse(column_cache.is_current(self.table_path, self.csv_path))
+
+        # A write which died partway leaves its temp directory, not a table.
+        earlier = time.time() - 10
+        os.utime(self.csv_path, (earlier, earlier))
+        shutil.rmtree(self.table_path)
+        os.makedirs(self.table_path + '.tmp')
+        self.assertFalse(column_cache.is_current(self.table_path, self.csv_path))
+        column_cache.write_table(self.table_path, RECORDS[:1], FIELDS)
+        self.assertTrue(column_cache.is_current(self.table_path, self.csv_path))
+        self.assertFalse(os.path.exists(self.table_path + '.tmp'))
+        self.assertEquals(column_cache.read_records(self.table_path, FIELDS), RECORDS[:1])
+
+        # Rewriting replaces the whole table.
+        column_cache.write_table(self.table_path, RECORDS, FIELDS)
+        self.assertEquals(column_cache.read_records(self.table_path, FIELDS), RECORDS)
+
+
+if __name__ == '__main__':
+    unittest.main()
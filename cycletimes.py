@@ -4,16 +4,27 @@ import argparse
 import datetime
 import glob
 import fileinput
+import hashlib
 import itertools
+import json
 import numpy
 import operator
 import re
 import requests
 import requests_cache
+import shutil
 import subprocess
 import sys
 import os
 
+from multiprocessing.pool import ThreadPool
+
+import column_cache
+import git_reader
+import host_throttle
+import review_store
+import rollups
+
 
 import logging
 
@@ -33,6 +44,8 @@ log, logging_handler = setup_logging()
 
 
 CACHE_NAME = 'cycletimes_cache'
+MANIFEST_PATH = os.path.join(CACHE_NAME, 'manifest.json')
+REVIEW_STORE_PATH = os.path.join(CACHE_NAME, 'reviews.sqlite')
 CACHE_FILE_REGEXP = re.compile(r'(?P<branch>\d+)_(?P<repository>\w+)\.csv')
 
 # Default date format when stringifying python dates.
@@ -133,6 +146,10 @@ REPOSITORIES = [
 # FIXME: This may need to be repository-relative for Skia, etc.
 REVIEW_REGEXPS = [re.compile(r"Review URL: (?P<review_base_url>%s)/(?P<review_id>\d+)" % url) for url in RIETVELD_URLS]
 
+# Limits for 'update --jobs N', so we don't hammer any one Rietveld instance.
+MAX_REQUESTS_PER_HOST = 4
+MIN_SECONDS_BETWEEN_REQUESTS = 0.1
+
 
 def fetch_recent_branches(repository):
     args = [
@@ -224,18 +241,35 @@ def svn_revision_from_lines(lines, repository):
             return int(match.group('svn_revision'))
 
 
-def fetch_review(review_base_url, review_id):
+review_throttle = host_throttle.HostThrottle(MAX_REQUESTS_PER_HOST, MIN_SECONDS_BETWEEN_REQUESTS)
+
+# Created before main() installs requests_cache, so this one always hits
+# the network.  (requests_cache.disabled() isn't safe with update --jobs.)
+uncached_session = review_throttle.mount(requests.Session())
+
+_review_store = None
+
+def get_review_store():
+    global _review_store
+    if not _review_store:
+        _review_store = review_store.ReviewStore(REVIEW_STORE_PATH)
+    return _review_store
+
+
+def fetch_review(review_base_url, review_id, use_http_cache=True):
     review_url = "%s/api/%s?messages=true" % (review_base_url, review_id)
+    session = requests if use_http_cache else uncached_session
     try:
-        response = requests.get(review_url, timeout=10)
-        if not getattr(response, 'from_cache', False):
+        response = review_throttle.get(review_url, session=session, timeout=10)
+        from_cache = getattr(response, 'from_cache', False)
+        if not from_cache:
             log.debug("Hit network: %s" % review_url)
     except (requests.exceptions.Timeout, requests.exceptions.SSLError) as e:
         log.error('Timeout fetching %s' % review_url)
         return None
 
     try:
-        return response.json()
+        review = response.json()
     except ValueError, e:
         if "Sign in" in response.text:
             log.warn("%s is restricted" % review_url)
@@ -245,18 +279,78 @@ def fetch_review(review_base_url, review_id):
             log.warn("%s was deleted" % review_url)
         else:
             log.error("Unknown error parsing %s (%s)" % (review_url, e))
+        return None
 
+    # The http cache never expires, so only trust it for closed reviews.
+    if from_cache and not review.get('closed'):
+        return fetch_review(review_base_url, review_id, use_http_cache=False)
+    return review
 
-def commit_times(commit_id, repository):
+
+def fetch_compact_review(review_base_url, review_id):
+    store = get_review_store()
+    review = store.get(review_base_url, review_id)
+    if review:
+        return review
+    review = fetch_review(review_base_url, review_id)
+    if not review:
+        return None
+    return store.set(review_base_url, review_id, review)
+
+
+# One record per commit, records separated by NUL (git log -z).
+COMMIT_LOG_FORMAT = '%h%n%ct%n%cn%n%b'
+
+
+def _commit_times_from_fields(commit_id, commit_timestamp, author, body_lines, repository):
     change = {}
-    args = ['git', 'log', '-1', '--pretty=format:%ct%n%cn%n%b', commit_id]
-    log_text = subprocess.check_output(args, cwd=repository['relative_path'])
+    change['commit_id'] = commit_id
+    change['commit_date'] = datetime.datetime.utcfromtimestamp(int(commit_timestamp))
+    change['commit_author'] = author
+    change['svn_revision'] = svn_revision_from_lines(body_lines, repository)
+    change['review_base_url'], change['review_id'] = review_url_and_id_from_lines(body_lines, commit_id)
+    return change
 
+
+def _commit_times_from_log_text(log_text, repository):
     lines = log_text.split("\n")
-    change['commit_date'] = datetime.datetime.utcfromtimestamp(int(lines.pop(0)))
-    change['commit_author'] = lines.pop(0)
-    change['svn_revision'] = svn_revision_from_lines(lines, repository)
-    change['review_base_url'], change['review_id'] = review_url_and_id_from_lines(lines, commit_id)
+    return _commit_times_from_fields(lines[0], lines[1], lines[2], lines[3:], repository)
+
+
+def _split_stream(stream, separator, chunk_size=64 * 1024):
+    pending = ''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        records = (pending + chunk).split(separator)
+        pending = records.pop()
+        for record in records:
+            yield record
+    if pending:
+        yield pending
+
+
+def commit_log(repository, revision_args):
+    """Yields commit_times dicts for every commit git log lists for revision_args.
+
+    Uses a single git process for the whole range rather than one per commit.
+    """
+    args = ['git', 'log', '-z', '--pretty=format:' + COMMIT_LOG_FORMAT] + revision_args
+    process = subprocess.Popen(args, cwd=repository['relative_path'], stdout=subprocess.PIPE)
+    for log_text in _split_stream(process.stdout, '\0'):
+        yield _commit_times_from_log_text(log_text, repository)
+    if process.wait():
+        raise subprocess.CalledProcessError(process.returncode, args)
+
+
+def commit_times(commit_id, repository):
+    commit = git_reader.reader_for(repository['relative_path']).commit(commit_id)
+    if not commit:
+        raise KeyError('%s not found in %s' % (commit_id, repository['name']))
+    change = _commit_times_from_fields(commit_id, commit['committer_date'],
+        commit['committer_name'], commit['body'].split('\n'), repository)
+    del change['commit_id']
     return change
 
 
@@ -264,27 +358,24 @@ def review_times(review_base_url, review_id, commit_id):
     change = {}
     if not review_id:
         return change
-    review = fetch_review(review_base_url, review_id)
+    review = fetch_compact_review(review_base_url, review_id)
     if not review:
         log.debug('Skipping %s, failed to fetch/parse review JSON.' % commit_id)
         return change
 
     change['review_create_date'] = parse_rietveld_date(review['created'])
 
-    messages = review['messages']
-    if not messages:
+    if not review['message_count']:
         log.error('Review %s from %s has 0 messages??' % (review_id, commit_id))
 
-    change['review_sent_date'] = parse_rietveld_date(messages[0]['date']) if messages else None
+    change['review_sent_date'] = parse_rietveld_date(review['sent']) if review['sent'] else None
 
-    lgtms = [parse_rietveld_date(m['date']) for m in messages if m['approval']]
+    lgtms = map(parse_rietveld_date, review['lgtms'])
     change['lgtms'] = len(lgtms)
     change['first_lgtm_date'] = lgtms[0] if lgtms else None
     change['last_lgtm_date'] = lgtms[-1] if lgtms else None
 
-    # We could also look for "The CQ bit was checked by" instead
-    # but I'm not sure how long rietveld has been adding that.
-    cq_starts = [parse_rietveld_date(m['date']) for m in messages if m['text'].startswith('CQ is trying da patch.')]
+    cq_starts = map(parse_rietveld_date, review['cq_starts'])
     change['cq_starts'] = len(cq_starts)
     change['first_cq_start_date'] = cq_starts[0] if cq_starts else None
     change['last_cq_start_date'] = cq_starts[-1] if cq_starts else None
@@ -293,19 +384,33 @@ def review_times(review_base_url, review_id, commit_id):
 
 default_fields = dict(zip(CSV_FIELD_ORDER, [None] * len(CSV_FIELD_ORDER)))
 
-def change_times(commit_id, branch, repository, branch_release_times):
+# commit is a dict from commit_log.
+def change_times(commit, branch, repository, branch_release_times):
     change = default_fields.copy()
     change.update({
-        'commit_id': commit_id,
         'repository': repository['name'],
         'branch': branch,
         'branch_release_date': branch_release_times.get(branch),
     })
-    change.update(commit_times(commit_id, repository))
-    change.update(review_times(change['review_base_url'], change['review_id'], commit_id))
+    change.update(commit)
+    change.update(review_times(change['review_base_url'], change['review_id'], change['commit_id']))
     return change
 
 
+def harvest_changes(commits, branch, repository, branch_release_times, jobs=1):
+    harvest = lambda commit: change_times(commit, branch, repository, branch_release_times)
+    if jobs <= 1:
+        return map(harvest, commits)
+    # ThreadPool.map returns results in input order, so the csv rows
+    # come out exactly as they would from the serial path.
+    pool = ThreadPool(jobs)
+    try:
+        return pool.map(harvest, commits)
+    finally:
+        pool.close()
+        pool.join()
+
+
 def _convert_key(change, key):
     value = change[key]
     if value and key.endswith('_date'):
@@ -326,27 +431,25 @@ def csv_line(change, fields):
     return ",".join(map(lambda field: _convert_key(change, field), fields))
 
 
+# Each branch is both the new and the old end of a range, so
+# update would otherwise ask for every merge-base twice.
+_merge_bases = {}
+
 def merge_base(repository_path, commit_one, commit_two=None):
     if commit_two is None:
         commit_two = 'origin/master'
-    args = ['git', 'merge-base', commit_one, commit_two]
-    return subprocess.check_output(args, cwd=repository_path).strip('\n')
+    cache_key = (repository_path, commit_one, commit_two)
+    if cache_key not in _merge_bases:
+        args = ['git', 'merge-base', commit_one, commit_two]
+        _merge_bases[cache_key] = subprocess.check_output(args, cwd=repository_path).strip('\n')
+    return _merge_bases[cache_key]
 
 
-def commits_new_in_branch(branch, previous_branch, repository):
+def commit_range_for_branch(branch, previous_branch, repository):
     repository_path = repository['relative_path']
     base_new = merge_base(repository_path, path_for_branch(repository, branch))
     base_old = merge_base(repository_path, path_for_branch(repository, previous_branch))
-    args = [
-        'git', 'rev-list',
-        '--abbrev-commit', '%s..%s' % (base_old, base_new)
-    ]
-    rev_list_output = subprocess.check_output(args, cwd=repository_path)
-    stripped_output = rev_list_output.strip('\n')
-    # "".split("\n") returns [''] which will confuse callers.
-    if not stripped_output:
-        return []
-    return stripped_output.split('\n')
+    return '%s..%s' % (base_old, base_new)
 
 
 def check_for_stale_checkout(repository, branch_names, branch_release_times):
@@ -359,12 +462,76 @@ def check_for_stale_checkout(repository, branch_names, branch_release_times):
             (latest_local_branch, latest_released_branch,
                 repository['relative_path'], repository['name']))
         subprocess.check_call(['git', 'fetch'], cwd=repository_path)
+        git_reader.reader_for(repository_path).clear()
 
 
 def csv_path(branch, repository):
     return os.path.join(CACHE_NAME, '%s_%s.csv' % (branch, repository['name']))
 
 
+# The manifest records, per cache file, what it was generated from,
+# a hash of its contents and its row count and commit date range.
+# update uses it to skip unchanged branches without asking git or
+# parsing the csv, and loads use it as an index of the cache directory.
+def load_manifest():
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+    try:
+        with open(MANIFEST_PATH) as manifest_file:
+            return json.load(manifest_file)
+    except ValueError, e:
+        log.warn('%s is invalid (%s), ignoring.' % (MANIFEST_PATH, e))
+        return {}
+
+
+def save_manifest(manifest):
+    temp_path = MANIFEST_PATH + '.tmp'
+    with open(temp_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+    os.rename(temp_path, MANIFEST_PATH)
+
+
+def _file_sha1(path):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as hashed_file:
+        for chunk in iter(lambda: hashed_file.read(64 * 1024), ''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def manifest_entry(cache_path, branch, previous_branch, repository, commit_range, commit_count, changes):
+    stat = os.stat(cache_path)
+    commit_dates = [change['commit_date'] for change in changes if change['commit_date']]
+    return {
+        'branch': branch,
+        'previous_branch': previous_branch,
+        'repository': repository['name'],
+        'merge_bases': commit_range.split('..'),
+        'commits': commit_count,
+        'rows': len(changes),
+        'first_commit_date': min(commit_dates).strftime(PYTHON_DATE_FORMAT) if commit_dates else None,
+        'last_commit_date': max(commit_dates).strftime(PYTHON_DATE_FORMAT) if commit_dates else None,
+        'sha1': _file_sha1(cache_path),
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+    }
+
+
+def manifest_entry_is_current(entry, cache_path, previous_branch):
+    if not entry or entry['previous_branch'] != previous_branch:
+        return False
+    if not os.path.exists(cache_path):
+        return False
+    stat = os.stat(cache_path)
+    if stat.st_size == entry['size'] and stat.st_mtime == entry['mtime']:
+        return True
+    # Touched but maybe not changed, only hashing can tell.
+    if stat.st_size != entry['size'] or _file_sha1(cache_path) != entry['sha1']:
+        return False
+    entry['mtime'] = stat.st_mtime
+    return True
+
+
 def validate_checkouts_and_fetch_branch_names(branch_release_times):
     branch_names = None
     for repository in REPOSITORIES:
@@ -385,35 +552,53 @@ def validate_checkouts_and_fetch_branch_names(branch_release_times):
     return branch_names
 
 
+def cache_index(repository=None):
+    """Returns (path, branch, repository name, manifest entry) per cache file.
+
+    The directory listing is the list of cache files, the manifest only
+    adds what it knows about them: entry is None for files it doesn't
+    have yet (e.g. after update --branch or an interrupted update).
+    """
+    manifest = load_manifest()
+    index = []
+    for path in sorted(glob.glob(os.path.join(CACHE_NAME, '*.csv'))):
+        filename = os.path.basename(path)
+        match = CACHE_FILE_REGEXP.match(filename)
+        if not match:
+            log.warn('%s does not match cache pattern, ignoring.' % path)
+            continue
+        index.append((path, match.group('branch'), match.group('repository'), manifest.get(filename)))
+    if repository:
+        index = [item for item in index if item[2] == repository]
+    return index
+
+
 def load_cached_branches(args, branch_release_times):
-    cache_paths = glob.glob(os.path.join(CACHE_NAME, '*.csv'))
+    """Returns the cached branch names and how many files --prune removed."""
+    index = cache_index()
     cached_branches = set()
-    for cache_path in cache_paths:
-        name = os.path.basename(cache_path)
-        match = CACHE_FILE_REGEXP.match(name)
-        if not match:
-            log.warn('%s does not match cache pattern, ignoring.' % cache_path)
-        else:
-            branch = match.group('branch')
-            if not branch_release_times.get(branch):
-                if args.prune:
-                    log.info('cached branch %s (from %s) is not in released branches, removing.' % (branch, cache_path))
-                    os.unlink(cache_path)
-                    continue
-                else:
-                    log.warn('cached branch %s (from %s) is not in released branches! (pass --prune to remove)' % (branch, cache_path))
-            cached_branches.add(branch)
-    log.info("%s files for %s branches in cache." % (len(cache_paths), len(cached_branches)))
-    return cached_branches
+    pruned_count = 0
+    for cache_path, branch, _, _ in index:
+        if not branch_release_times.get(branch):
+            if args.prune:
+                log.info('cached branch %s (from %s) is not in released branches, removing.' % (branch, cache_path))
+                os.unlink(cache_path)
+                table_path = column_cache.table_path_for(cache_path)
+                if os.path.exists(table_path):
+                    shutil.rmtree(table_path)
+                pruned_count += 1
+                continue
+            else:
+                log.warn('cached branch %s (from %s) is not in released branches! (pass --prune to remove)' % (branch, cache_path))
+        cached_branches.add(branch)
+    log.info("%s files for %s branches in cache." % (len(index) - pruned_count, len(cached_branches)))
+    return cached_branches, pruned_count
 
 
 def skia_revision_for(branch):
-    args = [
-        'git',
-        'show',
-        'refs/remotes/branch-heads/%s:DEPS' % branch,
-    ]
-    deps = subprocess.check_output(args)
+    deps = git_reader.reader_for('.').blob('refs/remotes/branch-heads/%s:DEPS' % branch)
+    if deps is None:
+        raise KeyError('DEPS not found on branch %s' % branch)
     skia_regexp = re.compile(r'\s*"skia_hash": "(?P<hash>\w+)",')
     for line in deps.split('\n'):
         match = skia_regexp.match(line)
@@ -427,7 +612,7 @@ def update_command(args):
     # FIXME: Instead of updating all branches we happen to have cached
     # it might make more sense to take a --since-branch argument and fetch/update
     # all branches since that one.
-    cached_branches = load_cached_branches(args, branch_release_times)
+    cached_branches, pruned_count = load_cached_branches(args, branch_release_times)
 
     branch_count = min(len(branch_names) - 1, args.branch_count)
     cache_hits = 0
@@ -436,6 +621,15 @@ def update_command(args):
         print "Empty cache, creating: %s" % CACHE_NAME
         os.makedirs(CACHE_NAME)
 
+    # Open before any --jobs threads need it.
+    get_review_store()
+
+    manifest = load_manifest()
+    # Forget files removed by --prune (or by hand).
+    for filename in manifest.keys():
+        if not os.path.exists(os.path.join(CACHE_NAME, filename)):
+            del manifest[filename]
+
     branches = set()
 
     if args.branch:
@@ -457,12 +651,20 @@ def update_command(args):
 
         for repository in REPOSITORIES:
             cache_path = csv_path(branch, repository)
-            commits = commits_new_in_branch(branch, previous_branch, repository)
+            filename = os.path.basename(cache_path)
+
+            if not args.force and manifest_entry_is_current(manifest.get(filename), cache_path, previous_branch):
+                sys.stderr.write('.')
+                sys.stderr.flush()
+                cache_hits += 1
+                continue
+
+            commit_range = commit_range_for_branch(branch, previous_branch, repository)
+            commits = list(commit_log(repository, [commit_range]))
 
             # FIXME: Need more sophisticated validatation:
             # Warn about files which exist but don't have a corresponding branch?
             if not args.force and os.path.exists(cache_path):
-                filename = os.path.basename(cache_path)
                 records = read_csv(cache_path, CSV_FIELD_ORDER)
                 if records is None:
                     log.debug("%s invalid, refetching." % filename)
@@ -474,17 +676,29 @@ def update_command(args):
                     sys.stderr.write('.')
                     sys.stderr.flush()
                     cache_hits += 1
+                    manifest[filename] = manifest_entry(cache_path, branch, previous_branch, repository, commit_range, len(commits), records)
+                    save_manifest(manifest)
                     continue
 
             with open(cache_path, "w") as csv_file:
                 csv_file.write(",".join(CSV_FIELD_ORDER) + "\n")
                 log.info("%s commits between branch %s and %s in %s" %
                     (len(commits), branch, previous_branch, repository['name']))
-                for commit_id in commits:
-                    change = change_times(commit_id, branch, repository, branch_release_times)
-                    if change:
-                        csv_file.write(csv_line(change, CSV_FIELD_ORDER) + "\n")
-    print "\nChecked %s branches, %s were already in cache." % (len(branches) * len(REPOSITORIES), cache_hits)
+                changes = filter(None, harvest_changes(commits, branch, repository, branch_release_times, args.jobs))
+                for change in changes:
+                    csv_file.write(csv_line(change, CSV_FIELD_ORDER) + "\n")
+            manifest[filename] = manifest_entry(cache_path, branch, previous_branch, repository, commit_range, len(commits), changes)
+            save_manifest(manifest)
+    checked_count = len(branches) * len(REPOSITORIES)
+    print "\nChecked %s branches, %s were already in cache." % (checked_count, cache_hits)
+
+    for repository in REPOSITORIES:
+        path = rollups_path(repository['name'])
+        # Rollups count every cached change, including pruned ones.
+        if cache_hits == checked_count and not pruned_count and os.path.exists(path):
+            continue
+        tables = iter_change_columns(repository['name'], show_progress=False)
+        rollups.write_rollups(path, compute_month_rollups(tables))
 
 
 def split_csv_line(csv_line):
@@ -507,18 +721,174 @@ def read_csv(file_path, expected_fields=None):
         return read_csv_lines(list(csv_file), expected_fields)
 
 
-def seconds_between_keys(change, earlier_key, later_key, clamp_values=True):
-    earlier_date = change[earlier_key]
-    later_date = change[later_key]
-    if earlier_date is None or later_date is None:
-        return 0 if clamp_values else None
-    seconds = int((later_date - earlier_date).total_seconds())
-    if clamp_values and later_date < earlier_date:
+class ChangeFilter(object):
+    """Row predicates checked before a cached change is fully parsed.
+
+    since and until bound commit_date (until is exclusive).
+    """
+    AUTHOR_INDEX = CSV_FIELD_ORDER.index('commit_author')
+    COMMIT_DATE_INDEX = CSV_FIELD_ORDER.index('commit_date')
+
+    def __init__(self, excluded_authors=(), since=None, until=None):
+        self.excluded_authors = set(excluded_authors)
+        self.since = since
+        self.until = until
+        # PYTHON_DATE_FORMAT strings sort like the dates they represent.
+        self._since_string = since.strftime(PYTHON_DATE_FORMAT) if since else None
+        self._until_string = until.strftime(PYTHON_DATE_FORMAT) if until else None
+
+    def accepts_csv_values(self, values):
+        if values[self.AUTHOR_INDEX] in self.excluded_authors:
+            return False
+        if self.since or self.until:
+            commit_date = values[self.COMMIT_DATE_INDEX]
+            if commit_date == 'None':
+                return False
+            if self.since and commit_date < self._since_string:
+                return False
+            if self.until and commit_date >= self._until_string:
+                return False
+        return True
+
+    def column_mask(self, columns, dictionaries):
+        authors = columns['commit_author']
+        excluded_codes = [code for code, author in enumerate(dictionaries['commit_author'])
+            if author in self.excluded_authors]
+        mask = ~numpy.in1d(authors, excluded_codes)
+        commit_dates = columns['commit_date']
+        if self.since or self.until:
+            mask &= commit_dates != column_cache.MISSING
+        if self.since:
+            mask &= commit_dates >= _epoch_seconds(self.since)
+        if self.until:
+            mask &= commit_dates < _epoch_seconds(self.until)
+        return mask
+
+
+def _iter_csv_changes(csv_path, change_filter):
+    with open(csv_path) as csv_file:
+        fields = split_csv_line(next(csv_file, ''))
+        if fields != CSV_FIELD_ORDER:
+            return
+        for line in csv_file:
+            values = split_csv_line(line)
+            if change_filter.accepts_csv_values(values):
+                yield dict(map(_convert_dates, zip(fields, values)))
+
+
+# Prefers the columnar copy of a cache file when it's up to date.
+def iter_cached_changes(csv_path, change_filter=None):
+    change_filter = change_filter or ChangeFilter()
+    table_path = column_cache.table_path_for(csv_path)
+    if column_cache.is_current(table_path, csv_path):
+        return column_cache.iter_records(table_path, CSV_FIELD_ORDER, change_filter.column_mask)
+    return _iter_csv_changes(csv_path, change_filter)
+
+
+EPOCH = datetime.datetime(1970, 1, 1)
+# Exactly representable as a float64, which _epoch_seconds returns.
+MISSING_SECONDS = numpy.iinfo(numpy.int64).min
+
+
+def _epoch_seconds(date):
+    return (date - EPOCH).total_seconds() if date else MISSING_SECONDS
+
+
+class ChangeColumns(object):
+    """Changes as one numpy array per CSV_FIELD_ORDER field.
+
+    Dates are int64 seconds since the epoch and counts are int64, with
+    MISSING_SECONDS for None in both; other fields are object arrays.
+    This is how the columnar cache already stores them, so loading from
+    it skips making a datetime per date.
+    """
+    def __init__(self, columns):
+        self.columns = columns
+
+    @classmethod
+    def from_records(cls, records):
+        columns = {}
+        for field in CSV_FIELD_ORDER:
+            values = map(operator.itemgetter(field), records)
+            if column_cache.is_date_field(field):
+                # numpy's own datetime conversion is several times slower than this.
+                seconds = numpy.fromiter(itertools.imap(_epoch_seconds, values), numpy.float64, len(values))
+                columns[field] = seconds.astype(numpy.int64)
+            elif field in column_cache.INT_FIELDS:
+                columns[field] = numpy.array([MISSING_SECONDS if value is None else int(value) for value in values], dtype=numpy.int64)
+            else:
+                columns[field] = numpy.empty(len(values), dtype=object)
+                columns[field][:] = values
+        return cls(columns)
+
+    @classmethod
+    def concatenate(cls, tables):
+        if not tables:
+            return cls.from_records([])
+        return cls(dict((field, numpy.concatenate([table[field] for table in tables])) for field in CSV_FIELD_ORDER))
+
+    def __len__(self):
+        return len(self.columns[CSV_FIELD_ORDER[0]])
+
+    def __getitem__(self, field):
+        return self.columns[field]
+
+    def take(self, selector):
+        """The changes picked by an index array or boolean mask."""
+        return ChangeColumns(dict((field, column[selector]) for field, column in self.columns.items()))
+
+
+def _date_from_seconds(seconds):
+    if seconds == MISSING_SECONDS:
+        return None
+    return EPOCH + datetime.timedelta(seconds=int(seconds))
+
+
+def _column_in(column, values):
+    """Boolean mask of which entries of an object column are in values."""
+    unique, inverse = numpy.unique(column, return_inverse=True)
+    return numpy.array([value in values for value in unique], dtype=bool)[inverse]
+
+
+class EventTimes(object):
+    """Event dates for ChangeColumns as an events x changes matrix.
+
+    Dates are int64 seconds since the epoch, with a parallel mask for
+    missing dates, so interval stats are array operations rather than
+    a datetime subtraction per change per event pair.
+    """
+    def __init__(self, changes, events=ALL_ORDERED_EVENTS):
+        self.events = events
+        self._event_index = dict((event, index) for index, event in enumerate(events))
+        self.seconds = numpy.vstack([changes[event] for event in events])
+        self.missing = self.seconds == MISSING_SECONDS
+
+    def __len__(self):
+        return self.seconds.shape[1]
+
+    def seconds_between(self, earlier_key, later_key):
+        """Returns (seconds, missing) arrays for each change."""
+        earlier = self._event_index[earlier_key]
+        later = self._event_index[later_key]
+        missing = self.missing[earlier] | self.missing[later]
+        seconds = self.seconds[later] - self.seconds[earlier]
+        seconds[missing] = 0
+        return seconds, missing
+
+    def clamped_seconds_between(self, earlier_key, later_key):
+        """Like seconds_between, but missing or negative intervals are 0."""
+        seconds, _ = self.seconds_between(earlier_key, later_key)
+        negative = seconds < 0
         # review_sent_date to commit_date is negative for all manual commits.
-        if earlier_key != 'review_sent_date' or later_key != 'commit_date':
-            log.info("Time between %s and %s in %s is negative (%s), ignoring." % (earlier_key, later_key, change['commit_id'], seconds))
-        return 0
-    return seconds
+        if negative.any() and (earlier_key != 'review_sent_date' or later_key != 'commit_date'):
+            log.info("Time between %s and %s is negative in %s changes, ignoring." % (earlier_key, later_key, negative.sum()))
+        seconds[negative] = 0
+        return seconds
+
+    def filtered_seconds_between(self, earlier_key, later_key):
+        """Returns (seconds, missing_count) leaving out missing or negative intervals."""
+        seconds, missing = self.seconds_between(earlier_key, later_key)
+        return seconds[~missing & (seconds >= 0)], missing.sum()
 
 
 # Maybe this should be a "date trust order"?
@@ -567,10 +937,10 @@ def re_range(lst):
          ranges.append(s)
     return ', '.join(ranges)
 
-def print_long_stats(changes, from_key, to_key):
+def print_long_stats(event_times, from_key, to_key):
     print "From: ", from_key
     print "To: ", to_key
-    times = map(lambda change: seconds_between_keys(change, from_key, to_key), changes)
+    times = event_times.clamped_seconds_between(from_key, to_key)
     print "Commits: ", len(times)
     print "Mean:", datetime.timedelta(seconds=int(numpy.mean(times)))
     print "Precentiles:"
@@ -580,29 +950,30 @@ def print_long_stats(changes, from_key, to_key):
         print "%s%%: %s" % (percentile, time_delta)
 
 
-def print_oneline_stats(changes, from_key, to_key):
-    unfiltered_times = map(lambda change: seconds_between_keys(change, from_key, to_key, clamp_values=False), changes)
-    times = filter(lambda seconds: seconds >= 0, unfiltered_times)
+def print_oneline_stats(event_times, from_key, to_key):
+    times, _ = event_times.filtered_seconds_between(from_key, to_key)
     mean = datetime.timedelta(seconds=int(numpy.mean(times)))
     median = datetime.timedelta(seconds=int(numpy.median(times)))
     # Just mean and median.
-    filtered_count = len(unfiltered_times) - len(times)
-    filtered_percent = int(float(filtered_count) / len(unfiltered_times) * 100)
+    filtered_count = len(event_times) - len(times)
+    filtered_percent = int(float(filtered_count) / len(event_times) * 100)
     print "%14s -> %14s %16s %16s  %s (%s%%)" % (from_key[:-5], to_key[:-5], median, mean, filtered_count, filtered_percent)
 
 
 def _int_values(changes, value_name):
-    values = map(operator.itemgetter(value_name), changes)
-    return [int(value) for value in values if value is not None]
+    values = changes[value_name]
+    return values[values != MISSING_SECONDS]
 
 
 def print_stats(changes):
     # filtered_changes = map(filter_bad_dates, changes)
-    print "Branches: ", re_range(sorted(set(map(lambda change: int(change['branch']), changes))))
-    print "Dates: %s - %s" % (changes[0]['commit_date'], changes[-1]['commit_date'])
-    review_less = filter(lambda change: not change['review_id'], changes)
-    print "Commits: %s (%s w/o reviews)" % (len(changes), len(review_less))
-    # print_long_stats(changes, 'review_sent_date', 'commit_date')
+    print "Branches: ", re_range(sorted(set(map(int, changes['branch']))))
+    commit_dates = changes['commit_date']
+    print "Dates: %s - %s" % (_date_from_seconds(commit_dates[0]), _date_from_seconds(commit_dates[-1]))
+    review_less = (changes['review_id'] == MISSING_SECONDS).sum()
+    print "Commits: %s (%s w/o reviews)" % (len(changes), review_less)
+    event_times = EventTimes(changes)
+    # print_long_stats(event_times, 'review_sent_date', 'commit_date')
     lgtms = _int_values(changes, 'lgtms')
     print "LGTMs (in %s): mean: %.2f median: %s" % (len(lgtms), numpy.mean(lgtms), numpy.median(lgtms))
     cq_starts = _int_values(changes, 'cq_starts')
@@ -610,50 +981,69 @@ def print_stats(changes):
 
     print "%14s -> %14s %16s %16s  %s" % ('from', 'to', 'median', 'mean', 'ignored')
     for from_key, to_key in window(ALL_ORDERED_EVENTS):
-        print_oneline_stats(changes, from_key, to_key)
+        print_oneline_stats(event_times, from_key, to_key)
 
-    print_oneline_stats(changes, 'review_sent_date', 'commit_date')
-    print_oneline_stats(changes, 'last_lgtm_date', 'commit_date')
-    print_oneline_stats(changes, 'first_cq_start_date', 'commit_date')
-    print_oneline_stats(changes, 'last_cq_start_date', 'commit_date')
-    print_oneline_stats(changes, ALL_ORDERED_EVENTS[0], ALL_ORDERED_EVENTS[-1])
+    print_oneline_stats(event_times, 'review_sent_date', 'commit_date')
+    print_oneline_stats(event_times, 'last_lgtm_date', 'commit_date')
+    print_oneline_stats(event_times, 'first_cq_start_date', 'commit_date')
+    print_oneline_stats(event_times, 'last_cq_start_date', 'commit_date')
+    print_oneline_stats(event_times, ALL_ORDERED_EVENTS[0], ALL_ORDERED_EVENTS[-1])
     print "'ignored' means an endpoint was missing (e.g. TBR= change) or time < 0 (e.g. CQ was tried before LGTM)"
 
 
-def load_changes(repository=None, branch_limit=None, show_progress=True):
-    changes = []
-    pattern = '*.csv'
-    if repository:
-        pattern = '*_%s.csv' % repository
+def _entry_in_date_range(entry, since, until):
+    # Entries from before the manifest tracked dates can't be skipped.
+    if not entry or 'rows' not in entry:
+        return True
+    if not entry['rows']:
+        return False
+    if since and entry['last_commit_date'] and entry['last_commit_date'] < since.strftime(PYTHON_DATE_FORMAT):
+        return False
+    if until and entry['first_commit_date'] and entry['first_commit_date'] >= until.strftime(PYTHON_DATE_FORMAT):
+        return False
+    return True
+
 
-    paths = glob.glob(os.path.join(CACHE_NAME, pattern))
-    stray_files = [path for path in paths if not CACHE_FILE_REGEXP.match(os.path.basename(path))]
-    if stray_files:
-        log.warn("Stray files in cache: %s" % stray_files)
+def cache_paths(repository=None, branch_limit=None, branch_range=None, since=None, until=None):
+    index = cache_index(repository)
+
+    if branch_range:
+        first, last = branch_range
+        index = [item for item in index
+            if (first is None or int(item[1]) >= int(first)) and (last is None or int(item[1]) <= int(last))]
 
-    # FIXME: This is probably the least efficent way possible to implement this:
     if branch_limit:
-        def branch_for(path):
-            match = CACHE_FILE_REGEXP.match(os.path.basename(path))
-            if not match:
-                return None
-            return int(match.group('branch'))
-        branches = filter(None, map(branch_for, paths))
-        branches = sorted(set(branches)) # Remove duplicates
-        most_recent_branches = sorted(branches, key=int, reverse=True)[:int(branch_limit)]
-        paths = filter(lambda path: branch_for(path) in most_recent_branches, paths)
+        branches = sorted(set(int(item[1]) for item in index), reverse=True)
+        most_recent_branches = set(branches[:int(branch_limit)])
+        index = [item for item in index if int(item[1]) in most_recent_branches]
 
-    for path in paths:
-        records = read_csv(path, CSV_FIELD_ORDER)
+    if since or until:
+        index = [item for item in index if _entry_in_date_range(item[3], since, until)]
+
+    return [item[0] for item in index]
+
+
+def iter_changes(repository=None, branch_limit=None, branch_range=None,
+        since=None, until=None, excluded_authors=(), show_progress=False):
+    """Lazily yields cached changes matching the given constraints.
+
+    branch_range is an inclusive (first, last) pair, either may be None.
+    since/until bound commit_date.  Rows from excluded_authors are
+    dropped before they're parsed.
+    """
+    change_filter = ChangeFilter(excluded_authors, since, until)
+    for path in cache_paths(repository, branch_limit, branch_range, since, until):
+        for change in iter_cached_changes(path, change_filter):
+            yield change
         if show_progress:
-            #log.debug("%s changes in %s" % (len(records), path))
             sys.stderr.write('.')
             sys.stderr.flush()
-        if records:
-            changes.extend(records)
     if show_progress:
         sys.stderr.write('\n')
-    return changes
+
+
+def load_changes(repository=None, branch_limit=None, show_progress=True, **kwargs):
+    return list(iter_changes(repository, branch_limit, show_progress=show_progress, **kwargs))
 
 
 def filter_bad_changes(changes):
@@ -675,35 +1065,71 @@ def filter_bad_changes(changes):
     return no_bots
 
 
+def cached_change_columns(csv_path, change_filter):
+    table_path = column_cache.table_path_for(csv_path)
+    if column_cache.is_current(table_path, csv_path):
+        return ChangeColumns(column_cache.read_columns(table_path, CSV_FIELD_ORDER, change_filter.column_mask))
+    return ChangeColumns.from_records(list(_iter_csv_changes(csv_path, change_filter)))
+
+
+def iter_change_columns(repository=None, branch_limit=None, show_progress=True):
+    """Yields the changes load_and_filter_changes would, as ChangeColumns per cache file."""
+    change_filter = ChangeFilter(BOT_AUTHORS)
+    late_lgtm_count = 0
+    for path in cache_paths(repository, branch_limit):
+        changes = cached_change_columns(path, change_filter)
+        # LGTMs after commit are common, but can just be ignored for our stats.
+        first_lgtms = changes['first_lgtm_date']
+        commits = changes['commit_date']
+        late_lgtms = (first_lgtms != MISSING_SECONDS) & (commits != MISSING_SECONDS) & (first_lgtms > commits)
+        first_lgtms[late_lgtms] = MISSING_SECONDS
+        late_lgtm_count += late_lgtms.sum()
+        yield changes
+        if show_progress:
+            sys.stderr.write('.')
+            sys.stderr.flush()
+    if show_progress:
+        sys.stderr.write('\n')
+    log.debug("Ignored %d late lgtms." % late_lgtm_count)
+
+
+def load_change_columns(repository=None, branch_limit=None, show_progress=True):
+    """load_and_filter_changes, as ChangeColumns sorted by svn_revision."""
+    changes = ChangeColumns.concatenate(list(iter_change_columns(repository, branch_limit, show_progress)))
+    return changes.take(numpy.argsort(changes['svn_revision'], kind='mergesort'))
+
+
 def load_and_filter_changes(*args, **kwargs):
+    kwargs.setdefault('excluded_authors', BOT_AUTHORS)
     return filter_bad_changes(load_changes(*args, **kwargs))
 
 
 def stats_command(args):
     for repository in REPOSITORIES:
-        changes = load_and_filter_changes(repository['name'], branch_limit=args.branch_limit)
-        changes.sort(key=operator.itemgetter('svn_revision'))
+        changes = load_change_columns(repository['name'], branch_limit=args.branch_limit)
         print "\nRepository: %s" % repository['name']
 
         if args.by_month:
-            for month, values in itertools.groupby(changes, key=lambda change: change['branch_release_date'].strftime('%m/%Y')):
+            for month, indexes in _month_runs(changes):
                 print month
-                print_stats(list(values))
+                print_stats(changes.take(indexes))
         else:
             print_stats(changes)
 
 
 # FIXME: Perhaps this should share code with print_online_stats
-def print_month_oneline_stats(month, changes, from_key, to_key):
-    unfiltered_times = map(lambda change: seconds_between_keys(change, from_key, to_key, clamp_values=False), changes)
-    nones = sum(1 for time in unfiltered_times if time is None)
-    times = filter(lambda seconds: seconds >= 0, unfiltered_times)
-    mean = datetime.timedelta(seconds=int(numpy.mean(times)))
-    median = datetime.timedelta(seconds=int(numpy.median(times)))
+def _print_month_line(month, median, mean, count, filtered_count, nones):
+    mean = datetime.timedelta(seconds=int(mean))
+    median = datetime.timedelta(seconds=int(median))
+    filtered_percent = int(float(filtered_count) / count * 100)
+    print "%6s %16s %16s  %4s %5s (%s%%) %s" % (month, median, mean, count, filtered_count, filtered_percent, nones)
+
+
+def print_month_oneline_stats(month, event_times, from_key, to_key):
+    times, nones = event_times.filtered_seconds_between(from_key, to_key)
     # Just mean and median.
-    filtered_count = len(unfiltered_times) - len(times)
-    filtered_percent = int(float(filtered_count) / len(unfiltered_times) * 100)
-    print "%6s %16s %16s  %4s %5s (%s%%) %s" % (month, median, mean, len(unfiltered_times), filtered_count, filtered_percent, nones)
+    filtered_count = len(event_times) - len(times)
+    _print_month_line(month, numpy.median(times), numpy.mean(times), len(event_times), filtered_count, nones)
 
     # filtered = filter(lambda change: seconds_between_keys(change, from_key, to_key, clamp_values=False) is None, changes)
     # import random
@@ -712,43 +1138,102 @@ def print_month_oneline_stats(month, changes, from_key, to_key):
 
 
 
+def rollups_path(repository_name):
+    return os.path.join(CACHE_NAME, 'rollups_%s.json' % repository_name)
+
+
+def _release_months(changes):
+    """The '%m/%Y' release month of each change."""
+    unique, inverse = numpy.unique(changes['branch_release_date'], return_inverse=True)
+    months = numpy.array([_date_from_seconds(seconds).strftime('%m/%Y') for seconds in unique], dtype=object)
+    return months[inverse]
+
+
+def _month_runs(changes):
+    """Yields (month, indexes) for each run of changes released in the same month."""
+    months = _release_months(changes)
+    for month, indexes in itertools.groupby(xrange(len(changes)), key=months.__getitem__):
+        yield month, list(indexes)
+
+
+# Written by update so by_month doesn't need to load every change.
+# tables is an iterable of ChangeColumns (e.g. iter_change_columns), and
+# rollups merge, so only one of them is in memory at a time.
+def compute_month_rollups(tables):
+    rollups_by_month = {}
+    for changes in tables:
+        changes = changes.take(~_column_in(changes['commit_author'], NO_REVIEW_URL_AUTHORS))
+        months = _release_months(changes)
+        for month in set(months):
+            event_times = EventTimes(changes.take(months == month))
+            pairs = rollups_by_month.setdefault(month, {})
+            for from_key, to_key in itertools.combinations(ALL_ORDERED_EVENTS, 2):
+                times, nones = event_times.filtered_seconds_between(from_key, to_key)
+                rollup = rollups.IntervalRollup.from_times(len(event_times), times, nones)
+                key = rollups.pair_key(from_key, to_key)
+                if key in pairs:
+                    pairs[key].merge(rollup)
+                else:
+                    pairs[key] = rollup
+    return rollups_by_month
+
+
+def print_month_rollups(rollups_by_month, from_key, to_key, months_per_row=1):
+    months = sorted(rollups_by_month.keys(), key=rollups.month_sort_key)
+    for row_months in chunks(months, months_per_row):
+        rollup = rollups.IntervalRollup()
+        for month in row_months:
+            rollup.merge(rollups_by_month[month][rollups.pair_key(from_key, to_key)])
+        _print_month_line(row_months[-1], rollup.median(), rollup.mean(), rollup.count, rollup.ignored, rollup.missing)
+
+
 def by_month_command(args):
     from_key = args.from_prefix + '_date' if args.from_prefix else ALL_ORDERED_EVENTS[0]
     to_key = args.to_prefix + '_date' if args.to_prefix else ALL_ORDERED_EVENTS[-1]
 
     for repository in REPOSITORIES:
-        changes = load_and_filter_changes(repository['name'], branch_limit=args.branch_limit)
-        changes.sort(key=operator.itemgetter('svn_revision'))
+        path = rollups_path(repository['name'])
+        # Rollups cover every cached branch and only forward event pairs.
+        use_rollups = (not args.branch_limit and os.path.exists(path) and
+            ALL_ORDERED_EVENTS.index(from_key) < ALL_ORDERED_EVENTS.index(to_key))
+        if not use_rollups:
+            changes = load_change_columns(repository['name'], branch_limit=args.branch_limit)
         print '\nRepository: %s' % repository['name']
         print '%s -> %s' % (from_key[:-5], to_key[:-5])
         print '%6s %16s %16s  %s %s %s' % ('month', 'median', 'mean', 'count', 'ignored', 'missing')
 
-        for month, month_changes in itertools.groupby(changes, key=lambda change: change['branch_release_date'].strftime('%m/%Y')):
-            month_changes = filter(lambda change: change['commit_author'] not in NO_REVIEW_URL_AUTHORS, month_changes)
-            print_month_oneline_stats(month, list(month_changes), from_key, to_key)
+        if use_rollups:
+            print_month_rollups(rollups.read_rollups(path), from_key, to_key, args.months_per_row)
+            continue
+
+        for month, indexes in _month_runs(changes):
+            month_changes = changes.take(indexes)
+            month_changes = month_changes.take(~_column_in(month_changes['commit_author'], NO_REVIEW_URL_AUTHORS))
+            print_month_oneline_stats(month, EventTimes(month_changes), from_key, to_key)
 
 
-def print_missing_revisions(changes):
-    for first, second in window(changes):
-        first_revision = int(first['svn_revision'])
-        second_revision = int(second['svn_revision'])
+def print_missing_revisions(revisions):
+    for first, second in window(revisions):
+        first_revision = int(first)
+        second_revision = int(second)
         if (second_revision - first_revision) == 1:
             continue
         print 'Missing', range(first_revision + 1, second_revision)
 
 
 def check_repository(args, repository):
-    changes = load_changes(repository['name'], branch_limit=args.branch_limit)
-    changes.sort(key=operator.itemgetter('svn_revision'))
+    # Only the revisions are needed, so don't keep the changes around.
+    changes = iter_changes(repository['name'], branch_limit=args.branch_limit, show_progress=True)
+    revisions = sorted(change['svn_revision'] for change in changes)
     print '\nRepository: %s' % repository['name']
-    first_revision = changes[0]['svn_revision']
-    last_revision = changes[-1]['svn_revision']
-    missing_count = int(last_revision) - int(first_revision) - len(changes)
-    print '%d changes %s:%s (missing %d)' % (len(changes), first_revision, last_revision, missing_count)
+    first_revision = revisions[0]
+    last_revision = revisions[-1]
+    missing_count = int(last_revision) - int(first_revision) - len(revisions)
+    print '%d changes %s:%s (missing %d)' % (len(revisions), first_revision, last_revision, missing_count)
 
     # FIXME: What are these changes we're missing? All branch commits?
     if args.list_missing:
-        print_missing_revisions(changes)
+        print_missing_revisions(revisions)
 
 
 def check_command(args):
@@ -850,6 +1335,22 @@ def graph_command(args):
         print "];"
 
 
+def columnize_command(args):
+    paths = glob.glob(os.path.join(CACHE_NAME, '*.csv'))
+    converted = 0
+    for path in paths:
+        table_path = column_cache.table_path_for(path)
+        if not args.force and column_cache.is_current(table_path, path):
+            continue
+        records = read_csv(path, CSV_FIELD_ORDER)
+        if records is None:
+            log.warn('%s invalid, not converting.' % path)
+            continue
+        column_cache.write_table(table_path, records, CSV_FIELD_ORDER)
+        converted += 1
+    print "Converted %s of %s cache files." % (converted, len(paths))
+
+
 def debug_command(args):
     repository = next(r for r in REPOSITORIES if r['name'] == args.repository_name)
     change = commit_times(args.commit_id, repository)
@@ -865,6 +1366,7 @@ def debug_command(args):
 
 def main(args):
     # CAREFUL: This caches everything, including omaha proxy lookups!
+    # Open reviews are refetched around it, see fetch_review.
     requests_cache.install_cache(CACHE_NAME)
 
     parser = argparse.ArgumentParser()
@@ -877,6 +1379,8 @@ def main(args):
     update_parser.add_argument('--branch-count', default=20, type=int)
     update_parser.add_argument('--branch', action='store')
     update_parser.add_argument('--prune', action='store_true')
+    update_parser.add_argument('--jobs', '-j', default=1, type=int,
+        help='Number of commits to harvest in parallel.')
     update_parser.set_defaults(func=update_command)
 
     stats_parser = subparsers.add_parser('stats')
@@ -889,6 +1393,8 @@ def main(args):
     by_month_parser.add_argument('--branch-limit', default=None, type=int)
     by_month_parser.add_argument('--from', dest='from_prefix', default=None, type=str)
     by_month_parser.add_argument('--to', dest='to_prefix', default=None, type=str)
+    by_month_parser.add_argument('--months-per-row', default=1, type=int,
+        help='Merge this many months into each row (only with update\'s rollups).')
 
     graph_parser = subparsers.add_parser('graph')
     graph_parser.set_defaults(func=graph_command)
@@ -898,6 +1404,10 @@ def main(args):
     check_parser.add_argument('--branch-limit', default=None, type=int)
     check_parser.add_argument('--list-missing', action='store_true')
 
+    columnize_parser = subparsers.add_parser('columnize')
+    columnize_parser.set_defaults(func=columnize_command)
+    columnize_parser.add_argument('--force', action='store_true')
+
     debug_parser = subparsers.add_parser('debug')
     debug_parser.set_defaults(func=debug_command)
     debug_parser.add_argument('repository_name')
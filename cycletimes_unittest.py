@@ -0,0 +1,365 @@
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import StringIO
+import datetime
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+import unittest
+import column_cache
+import cycletimes
+import git_reader
+
+
+def make_git_repository(path, messages, first_timestamp=1400000000):
+    """Makes a repository with a commit per message, a day apart."""
+    subprocess.check_call(['git', 'init', '-q', path])
+    for index, message in enumerate(messages):
+        with open(os.path.join(path, 'file'), 'w') as changed_file:
+            changed_file.write('%d\n' % index)
+        date = '%d +0000' % (first_timestamp + index * 24 * 60 * 60)
+        env = dict(os.environ, GIT_AUTHOR_NAME='Author', GIT_AUTHOR_EMAIL='author@chromium.org',
+            GIT_COMMITTER_NAME='Committer', GIT_COMMITTER_EMAIL='committer@chromium.org',
+            GIT_AUTHOR_DATE=date, GIT_COMMITTER_DATE=date)
+        subprocess.check_call(['git', 'add', 'file'], cwd=path, env=env)
+        subprocess.check_call(['git', 'commit', '-q', '-m', message], cwd=path, env=env)
+
+
+def random_changes(seed, count, first_revision=1000):
+    """Changes as read_csv would return them, with missing and out of order dates."""
+    rand = random.Random(seed)
+    release = datetime.datetime(2014, 5, 1)
+    changes = []
+    for revision in range(first_revision, first_revision + count):
+        commit = release - datetime.timedelta(seconds=rand.randint(3600, 10 * 24 * 3600))
+
+        def event_date():
+            if rand.random() < 0.2:
+                return None
+            return commit - datetime.timedelta(seconds=rand.randint(-3600, 5 * 24 * 3600))
+
+        change = dict((field, None) for field in cycletimes.CSV_FIELD_ORDER)
+        change.update({
+            'repository': 'chrome',
+            'commit_id': '%x' % revision,
+            'svn_revision': str(revision),
+            'commit_author': rand.choice(['a@chromium.org', 'b@chromium.org'] + cycletimes.BOT_AUTHORS),
+            'review_id': None if rand.random() < 0.1 else str(rand.randint(1, 10 ** 9)),
+            'branch': '2000',
+            'lgtms': None if rand.random() < 0.1 else str(rand.randint(0, 3)),
+            'cq_starts': str(rand.randint(0, 3)),
+            'commit_date': commit,
+            'branch_release_date': release,
+        })
+        for event in cycletimes.ALL_ORDERED_EVENTS[:-2]:
+            change[event] = event_date()
+        changes.append(change)
+    return changes
+
+
+def write_csv(path, changes):
+    with open(path, 'w') as csv_file:
+        csv_file.write(','.join(cycletimes.CSV_FIELD_ORDER) + '\n')
+        for change in changes:
+            csv_file.write(cycletimes.csv_line(change, cycletimes.CSV_FIELD_ORDER) + '\n')
+
+
+# How the stats used to be computed, one change at a time.
+def seconds_between_keys(change, earlier_key, later_key, clamp_values=True):
+    earlier_date = change[earlier_key]
+    later_date = change[later_key]
+    if earlier_date is None or later_date is None:
+        return 0 if clamp_values else None
+    seconds = int((later_date - earlier_date).total_seconds())
+    if clamp_values and later_date < earlier_date:
+        return 0
+    return seconds
+
+
+class EventTimesTest(unittest.TestCase):
+    def test_matches_per_change_stats(self):
+        changes = random_changes(5, 500)
+        event_times = cycletimes.EventTimes(cycletimes.ChangeColumns.from_records(changes))
+        self.assertEquals(len(event_times), 500)
+        for from_key, to_key in cycletimes.window(cycletimes.ALL_ORDERED_EVENTS):
+            unfiltered = [seconds_between_keys(change, from_key, to_key, clamp_values=False) for change in changes]
+            times, missing_count = event_times.filtered_seconds_between(from_key, to_key)
+            self.assertEquals(list(times), [seconds for seconds in unfiltered if seconds is not None and seconds >= 0])
+            self.assertEquals(missing_count, unfiltered.count(None))
+
+            clamped = event_times.clamped_seconds_between(from_key, to_key)
+            self.assertEquals(list(clamped), [seconds_between_keys(change, from_key, to_key) for change in changes])
+
+
+class HarvestChangesTest(unittest.TestCase):
+    def setUp(self):
+        self.original_change_times = cycletimes.change_times
+        rand = random.Random(3)
+        delays = dict((revision, rand.random() * 0.01) for revision in range(100))
+
+        # Later commits often finish first, so any reordering would show.
+        def change_times(commit, branch, repository, branch_release_times):
+            time.sleep(delays[commit['svn_revision']])
+            return dict(commit, branch=branch, repository=repository['name'],
+                branch_release_date=branch_release_times.get(branch))
+        cycletimes.change_times = change_times
+
+    def tearDown(self):
+        cycletimes.change_times = self.original_change_times
+
+    def test_jobs_match_serial(self):
+        commits = [{'svn_revision': revision, 'commit_id': '%x' % revision} for revision in range(100)]
+        args = (commits, '2000', {'name': 'chrome'}, {'2000': datetime.datetime(2014, 5, 1)})
+        serial = cycletimes.harvest_changes(*args, jobs=1)
+        self.assertEquals([change['svn_revision'] for change in serial], range(100))
+        self.assertEquals(cycletimes.harvest_changes(*args, jobs=4), serial)
+
+
+class CacheDirectoryTestCase(unittest.TestCase):
+    """Runs each test in a temporary directory with an empty cache directory."""
+    def setUp(self):
+        self.original_cwd = os.getcwd()
+        self.temp_dir = tempfile.mkdtemp()
+        os.chdir(self.temp_dir)
+        os.makedirs(cycletimes.CACHE_NAME)
+
+    def tearDown(self):
+        os.chdir(self.original_cwd)
+        shutil.rmtree(self.temp_dir)
+
+
+class ChangeColumnsTest(CacheDirectoryTestCase):
+    def test_matches_filtered_records(self):
+        # One branch only as csv, one also columnized.
+        csv_path = cycletimes.csv_path('2000', {'name': 'chrome'})
+        write_csv(csv_path, random_changes(1, 200, first_revision=2000))
+        columnized_path = cycletimes.csv_path('2001', {'name': 'chrome'})
+        write_csv(columnized_path, random_changes(2, 200, first_revision=1000))
+        column_cache.write_table(column_cache.table_path_for(columnized_path),
+            cycletimes.read_csv(columnized_path), cycletimes.CSV_FIELD_ORDER)
+
+        changes = cycletimes.load_change_columns('chrome', show_progress=False)
+        expected = cycletimes.load_and_filter_changes('chrome', show_progress=False)
+        expected.sort(key=lambda change: int(change['svn_revision']))
+        self.assertEquals(len(changes), len(expected))
+        self.assertTrue(len(expected) < 400)
+        expected_columns = cycletimes.ChangeColumns.from_records(expected)
+        for field in cycletimes.CSV_FIELD_ORDER:
+            self.assertEquals(list(changes[field]), list(expected_columns[field]), field)
+
+
+class IterChangesTest(CacheDirectoryTestCase):
+    def setUp(self):
+        super(IterChangesTest, self).setUp()
+        self.changes_by_branch = {}
+        for index, branch in enumerate(['2000', '2001', '2002']):
+            changes = random_changes(index, 100, first_revision=1000 * (index + 1))
+            for change in changes:
+                change['branch'] = branch
+                # Some rows without a commit date, which a date range excludes.
+                if int(change['svn_revision']) % 10 == 0:
+                    change['commit_date'] = None
+            path = cycletimes.csv_path(branch, {'name': 'chrome'})
+            write_csv(path, changes)
+            self.changes_by_branch[branch] = cycletimes.read_csv(path)
+
+    def columnize(self):
+        for path, _, _, _ in cycletimes.cache_index():
+            column_cache.write_table(column_cache.table_path_for(path),
+                cycletimes.read_csv(path), cycletimes.CSV_FIELD_ORDER)
+
+    def expected(self, branches, excluded_authors=(), since=None, until=None):
+        changes = []
+        for branch in branches:
+            for change in self.changes_by_branch[branch]:
+                if change['commit_author'] in excluded_authors:
+                    continue
+                if (since or until) and not change['commit_date']:
+                    continue
+                if since and change['commit_date'] < since:
+                    continue
+                if until and change['commit_date'] >= until:
+                    continue
+                changes.append(change)
+        return changes
+
+    def check_queries(self):
+        since = datetime.datetime(2014, 4, 24)
+        until = datetime.datetime(2014, 4, 28, 12)
+        authors = cycletimes.BOT_AUTHORS
+        self.assertEquals(list(cycletimes.iter_changes()), self.expected(['2000', '2001', '2002']))
+        self.assertEquals(list(cycletimes.iter_changes('blink')), [])
+        self.assertEquals(list(cycletimes.iter_changes(branch_limit=2)), self.expected(['2001', '2002']))
+        self.assertEquals(list(cycletimes.iter_changes(branch_range=('2001', None))), self.expected(['2001', '2002']))
+        self.assertEquals(list(cycletimes.iter_changes(branch_range=(None, '2001'))), self.expected(['2000', '2001']))
+        self.assertEquals(list(cycletimes.iter_changes(excluded_authors=authors)),
+            self.expected(['2000', '2001', '2002'], authors))
+        self.assertEquals(list(cycletimes.iter_changes(since=since, until=until)),
+            self.expected(['2000', '2001', '2002'], since=since, until=until))
+        self.assertEquals(list(cycletimes.iter_changes(branch_limit=1, excluded_authors=authors, since=since)),
+            self.expected(['2002'], authors, since=since))
+        # The filters really do remove something.
+        self.assertTrue(0 < len(self.expected(['2000'], authors, since, until)) < len(self.expected(['2000'])))
+
+    def test_csv(self):
+        self.check_queries()
+
+    def test_columns(self):
+        self.columnize()
+        self.check_queries()
+
+    def test_filters_before_parsing(self):
+        change_filter = cycletimes.ChangeFilter(['bot@chromium.org'], since=datetime.datetime(2014, 1, 1))
+        values = ['None'] * len(cycletimes.CSV_FIELD_ORDER)
+        values[change_filter.AUTHOR_INDEX] = 'bot@chromium.org'
+        values[change_filter.COMMIT_DATE_INDEX] = '2014-02-01 00:00:00'
+        self.assertFalse(change_filter.accepts_csv_values(values))
+        values[change_filter.AUTHOR_INDEX] = 'a@chromium.org'
+        self.assertTrue(change_filter.accepts_csv_values(values))
+        values[change_filter.COMMIT_DATE_INDEX] = '2013-12-31 23:59:59'
+        self.assertFalse(change_filter.accepts_csv_values(values))
+        values[change_filter.COMMIT_DATE_INDEX] = 'None'
+        self.assertFalse(change_filter.accepts_csv_values(values))
+
+
+class CacheIndexTest(CacheDirectoryTestCase):
+    def write_cache_file(self, filename):
+        with open(os.path.join(cycletimes.CACHE_NAME, filename), 'w') as cache_file:
+            cache_file.write(','.join(cycletimes.CSV_FIELD_ORDER) + '\n')
+
+    def test_without_manifest(self):
+        self.write_cache_file('2000_chromium.csv')
+        self.write_cache_file('not_a_branch.csv')
+        self.assertEquals(cycletimes.cache_index(), [
+            (os.path.join(cycletimes.CACHE_NAME, '2000_chromium.csv'), '2000', 'chromium', None),
+        ])
+
+    def test_partial_manifest(self):
+        # What update --branch 2100, or an interrupted update, leaves behind.
+        self.write_cache_file('2000_chromium.csv')
+        self.write_cache_file('2100_chromium.csv')
+        self.write_cache_file('2100_blink.csv')
+        entry = {'branch': '2100', 'repository': 'chromium', 'rows': 0}
+        cycletimes.save_manifest({'2100_chromium.csv': entry, '1900_chromium.csv': entry})
+
+        index = cycletimes.cache_index('chromium')
+        self.assertEquals([(branch, manifest_entry) for _, branch, _, manifest_entry in index],
+            [('2000', None), ('2100', entry)])
+        # Files the manifest doesn't know about can't be skipped by date.
+        paths = cycletimes.cache_paths('chromium', since=cycletimes.EPOCH)
+        self.assertEquals(paths, [os.path.join(cycletimes.CACHE_NAME, '2000_chromium.csv')])
+        self.assertEquals(len(cycletimes.cache_paths()), 3)
+
+
+class ManifestEntryTest(CacheDirectoryTestCase):
+    def setUp(self):
+        super(ManifestEntryTest, self).setUp()
+        self.cache_path = cycletimes.csv_path('2001', {'name': 'chrome'})
+        self.write('2001 rows\n')
+        self.entry = cycletimes.manifest_entry(self.cache_path, '2001', '2000', {'name': 'chrome'},
+            'abc..def', 1, [])
+
+    def write(self, text):
+        with open(self.cache_path, 'w') as cache_file:
+            cache_file.write(text)
+
+    def touch(self, seconds_later):
+        # Filesystem mtimes can be too coarse to see a rewrite otherwise.
+        mtime = self.entry['mtime'] + seconds_later
+        os.utime(self.cache_path, (mtime, mtime))
+        return os.stat(self.cache_path).st_mtime
+
+    def is_current(self, previous_branch='2000'):
+        return cycletimes.manifest_entry_is_current(self.entry, self.cache_path, previous_branch)
+
+    def test_unchanged(self):
+        self.assertTrue(self.is_current())
+        self.assertFalse(cycletimes.manifest_entry_is_current(None, self.cache_path, '2000'))
+
+    def test_previous_branch_changed(self):
+        self.assertFalse(self.is_current(previous_branch='1999'))
+
+    def test_missing_file(self):
+        os.remove(self.cache_path)
+        self.assertFalse(self.is_current())
+
+    def test_size_changed(self):
+        self.write('2001 rows, and more\n')
+        self.assertFalse(self.is_current())
+
+    def test_touched_but_unchanged(self):
+        mtime = self.touch(10)
+        self.assertNotEquals(self.entry['mtime'], mtime)
+        self.assertTrue(self.is_current())
+        self.assertEquals(self.entry['mtime'], mtime)
+
+    def test_changed_with_same_size(self):
+        self.write('2002 rows\n')
+        self.touch(10)
+        self.assertEquals(os.path.getsize(self.cache_path), self.entry['size'])
+        self.assertFalse(self.is_current())
+
+
+class CommitLogTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.repository = {
+            'name': 'chrome',
+            'relative_path': self.temp_dir,
+            'svn_url': 'svn://svn.chromium.org/chrome/trunk/src',
+        }
+
+    def tearDown(self):
+        git_reader.reader_for(self.temp_dir).close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_split_stream(self):
+        # Small chunks so records and separators straddle chunk boundaries.
+        stream = StringIO.StringIO('first\nrecord\0\0second\0third')
+        self.assertEquals(list(cycletimes._split_stream(stream, '\0', chunk_size=3)),
+            ['first\nrecord', '', 'second', 'third'])
+        self.assertEquals(list(cycletimes._split_stream(StringIO.StringIO(''), '\0')), [])
+
+    def test_commit_log(self):
+        make_git_repository(self.temp_dir, [
+            'Reviewed change\n\n'
+            'Some description.\n\n'
+            'Review URL: https://codereview.chromium.org/1234\n\n'
+            'git-svn-id: svn://svn.chromium.org/chrome/trunk/src@100 0039d316-1c4b-4281-b951-d872f2087c98',
+            'Unreviewed change\n\n'
+            'git-svn-id: svn://svn.chromium.org/chrome/trunk/src@101 0039d316-1c4b-4281-b951-d872f2087c98',
+        ])
+        commit_ids = [subprocess.check_output(['git', 'rev-parse', '--short', revision], cwd=self.temp_dir).strip()
+            for revision in ('HEAD', 'HEAD~1')]
+        changes = list(cycletimes.commit_log(self.repository, ['HEAD']))
+        self.assertEquals(changes, [{
+            'commit_id': commit_ids[0],
+            'commit_date': datetime.datetime(2014, 5, 14, 16, 53, 20),
+            'commit_author': 'Committer',
+            'svn_revision': 101,
+            'review_base_url': None,
+            'review_id': None,
+        }, {
+            'commit_id': commit_ids[1],
+            'commit_date': datetime.datetime(2014, 5, 13, 16, 53, 20),
+            'commit_author': 'Committer',
+            'svn_revision': 100,
+            'review_base_url': 'https://codereview.chromium.org',
+            'review_id': 1234,
+        }])
+        self.assertEquals(len(list(cycletimes.commit_log(self.repository, ['HEAD~1..HEAD']))), 1)
+
+        # commit_times reads single commits through git_reader instead.
+        for change in changes:
+            expected = dict(change)
+            del expected['commit_id']
+            self.assertEquals(cycletimes.commit_times(change['commit_id'], self.repository), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+# Reads git objects through one long-lived 'git cat-file --batch' process
+# per repository, instead of spawning a 'git show' per object.
+
+import collections
+import re
+import subprocess
+import threading
+
+
+COMMITTER_REGEXP = re.compile(r'^committer (?P<name>.*) <(?P<email>.*)> (?P<timestamp>\d+) (?P<timezone>[+-]\d+)$')
+
+
+class GitObjectReader(object):
+    # Objects are cached by the name they were requested with, so this
+    # assumes refs don't move while the reader is open (call clear() after
+    # a git fetch).  The cache holds at most cache_bytes of object contents,
+    # and objects bigger than that aren't cached at all.
+    def __init__(self, repository_path, cache_bytes=16 * 1024 * 1024):
+        self.repository_path = repository_path
+        self.cache_bytes = cache_bytes
+        self._process = None
+        self._lock = threading.Lock()
+        self._cache = collections.OrderedDict()
+        self._cached_bytes = 0
+
+    def _start(self):
+        args = ['git', 'cat-file', '--batch']
+        self._process = subprocess.Popen(args, cwd=self.repository_path,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def _read_uncached(self, object_name):
+        if not self._process:
+            self._start()
+        self._process.stdin.write(object_name + '\n')
+        self._process.stdin.flush()
+        header = self._process.stdout.readline()
+        if not header:
+            raise IOError('git cat-file exited in %s' % self.repository_path)
+        if header.endswith(' missing\n'):
+            return None
+        _, object_type, size = header.split()
+        contents = self._process.stdout.read(int(size))
+        self._process.stdout.read(1) # Trailing newline.
+        return object_type, contents
+
+    def read(self, object_name):
+        """Returns (type, contents) for object_name, or None if it's missing."""
+        with self._lock:
+            cached = self._cache.pop(object_name, None)
+            if cached is None:
+                cached = self._read_uncached(object_name)
+                if cached is None:
+                    return None
+                size = len(cached[1])
+                if size > self.cache_bytes:
+                    return cached
+                self._cached_bytes += size
+                while self._cached_bytes > self.cache_bytes:
+                    _, (_, evicted_contents) = self._cache.popitem(last=False)
+                    self._cached_bytes -= len(evicted_contents)
+            self._cache[object_name] = cached
+            return cached
+
+    def blob(self, object_name):
+        result = self.read(object_name)
+        return result[1] if result else None
+
+    def commit(self, object_name):
+        result = self.read(object_name)
+        if not result or result[0] != 'commit':
+            return None
+        headers, _, message = result[1].partition('\n\n')
+        commit = {}
+        for line in headers.split('\n'):
+            match = COMMITTER_REGEXP.match(line)
+            if match:
+                commit['committer_name'] = match.group('name')
+                commit['committer_date'] = int(match.group('timestamp'))
+        # Same split as git log's %s/%b: the subject is the first paragraph.
+        _, _, commit['body'] = message.partition('\n\n')
+        return commit
+
+    def tree_paths(self, treeish):
+        """Like 'git ls-tree -r --name-only treeish'."""
+        paths = []
+        pending = [('', '%s^{tree}' % treeish)]
+        while pending:
+            prefix, tree_name = pending.pop()
+            result = self.read(tree_name)
+            if not result:
+                raise KeyError('%s not found in %s' % (tree_name, self.repository_path))
+            for mode, name, sha in _tree_entries(result[1]):
+                path = prefix + name
+                if mode == '40000':
+                    pending.append((path + '/', sha))
+                else:
+                    paths.append(path)
+        return sorted(paths)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._cached_bytes = 0
+
+    def close(self):
+        with self._lock:
+            if self._process:
+                self._process.stdin.close()
+                self._process.wait()
+                self._process = None
+
+
+# Tree objects are a series of '<mode> <name>\0<20 byte sha>'.
+def _tree_entries(tree_contents):
+    offset = 0
+    while offset < len(tree_contents):
+        space = tree_contents.index(' ', offset)
+        nul = tree_contents.index('\0', space)
+        mode = tree_contents[offset:space]
+        name = tree_contents[space + 1:nul]
+        sha = tree_contents[nul + 1:nul + 21].encode('hex')
+        offset = nul + 21
+        yield mode, name, sha
+
+
+_readers = {}
+_readers_lock = threading.Lock()
+
+
+def reader_for(repository_path):
+    with _readers_lock:
+        reader = _readers.get(repository_path)
+        if not reader:
+            reader = GitObjectReader(repository_path)
+            _readers[repository_path] = reader
+        return reader
@@ -0,0 +1,86 @@
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+import git_reader
+
+
+class GitObjectReaderTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        subprocess.check_call(['git', 'init', '-q', self.temp_dir])
+        self.reader = git_reader.GitObjectReader(self.temp_dir)
+
+    def tearDown(self):
+        self.reader.close()
+        shutil.rmtree(self.temp_dir)
+
+    def commit(self, files, message):
+        for path, contents in files.items():
+            full_path = os.path.join(self.temp_dir, path)
+            if not os.path.exists(os.path.dirname(full_path)):
+                os.makedirs(os.path.dirname(full_path))
+            with open(full_path, 'w') as written_file:
+                written_file.write(contents)
+        env = dict(os.environ, GIT_AUTHOR_NAME='Author', GIT_AUTHOR_EMAIL='author@chromium.org',
+            GIT_COMMITTER_NAME='Commit Bot', GIT_COMMITTER_EMAIL='bot@chromium.org',
+            GIT_AUTHOR_DATE='1400000000 +0000', GIT_COMMITTER_DATE='1400000100 -0700')
+        subprocess.check_call(['git', 'add', '.'], cwd=self.temp_dir, env=env)
+        subprocess.check_call(['git', 'commit', '-q', '-m', message], cwd=self.temp_dir, env=env)
+
+    def test_commit(self):
+        self.commit({'a.txt': 'a\n'}, 'Subject line\n\nFirst paragraph.\n\nReview URL: https://codereview.chromium.org/1234')
+        self.assertEquals(self.reader.commit('HEAD'), {
+            'committer_name': 'Commit Bot',
+            'committer_date': 1400000100,
+            'body': 'First paragraph.\n\nReview URL: https://codereview.chromium.org/1234\n',
+        })
+        self.assertEquals(self.reader.commit('HEAD:a.txt'), None)
+        self.assertEquals(self.reader.commit('0' * 40), None)
+
+    def test_blob(self):
+        self.commit({'a.txt': 'a\n', 'dir/b.txt': 'b\n'}, 'Add files')
+        self.assertEquals(self.reader.blob('HEAD:dir/b.txt'), 'b\n')
+        self.assertEquals(self.reader.blob('HEAD:missing.txt'), None)
+        self.commit({'a.txt': 'changed\n'}, 'Change a')
+        self.assertEquals(self.reader.blob('HEAD~1:a.txt'), 'a\n')
+        self.assertEquals(self.reader.blob('HEAD:a.txt'), 'changed\n')
+
+    def test_tree_paths(self):
+        self.commit({
+            'DEPS': '',
+            'a/b/c.idl': '',
+            'a/b/d.idl': '',
+            'a/e.txt': '',
+            'z.txt': '',
+        }, 'Add a tree')
+        expected = subprocess.check_output(['git', 'ls-tree', '-r', '--name-only', 'HEAD'],
+            cwd=self.temp_dir).splitlines()
+        self.assertEquals(self.reader.tree_paths('HEAD'), expected)
+        self.assertEquals(self.reader.tree_paths('HEAD'), ['DEPS', 'a/b/c.idl', 'a/b/d.idl', 'a/e.txt', 'z.txt'])
+        self.assertRaises(KeyError, self.reader.tree_paths, 'no-such-branch')
+
+    def test_cache_is_bounded_by_bytes(self):
+        self.commit({'one': '1' * 100, 'two': '2' * 100, 'three': '3' * 100, 'big': 'b' * 1000}, 'Add files')
+        reader = git_reader.GitObjectReader(self.temp_dir, cache_bytes=250)
+        try:
+            for name in ('HEAD:one', 'HEAD:two', 'HEAD:one', 'HEAD:three'):
+                reader.blob(name)
+            # 'two' was least recently used.
+            self.assertEquals(reader._cache.keys(), ['HEAD:one', 'HEAD:three'])
+            self.assertEquals(reader.blob('HEAD:big'), 'b' * 1000)
+            self.assertEquals(reader._cache.keys(), ['HEAD:one', 'HEAD:three'])
+            reader.clear()
+            self.assertEquals(reader._cache.keys(), [])
+            self.assertEquals(reader.blob('HEAD:two'), '2' * 100)
+        finally:
+            reader.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+# Per-host limits on concurrent requests and request rate, shared by
+# cycletimes.py (Rietveld reviews) and nannybot (buildbot json and logs).
+
+import contextlib
+import requests
+import requests.adapters
+import threading
+import time
+import urlparse
+
+
+class HostThrottle(object):
+    """Bounds in-flight requests and request rate per host.
+
+    Only requests which reach a session's transport adapter wait for a
+    turn, so responses requests_cache answers locally aren't slowed down.
+    """
+    def __init__(self, max_in_flight, min_interval):
+        self.max_in_flight = max_in_flight
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._next_start = {}
+
+    def _semaphore_for(self, host):
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.max_in_flight)
+            return self._semaphores[host]
+
+    def _wait_for_turn(self, host):
+        with self._lock:
+            now = time.time()
+            start = max(now, self._next_start.get(host, now))
+            self._next_start[host] = start + self.min_interval
+        if start > now:
+            time.sleep(start - now)
+
+    @contextlib.contextmanager
+    def turn(self, url):
+        host = urlparse.urlparse(url).netloc
+        with self._semaphore_for(host):
+            self._wait_for_turn(host)
+            yield
+
+    def mount(self, session):
+        """Throttles the requests session sends over the network."""
+        with self._lock:
+            if not isinstance(session.get_adapter('http://'), ThrottledAdapter):
+                adapter = ThrottledAdapter(self)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+        return session
+
+    def get(self, url, session=requests, **kwargs):
+        if session is requests:
+            # What requests.get does, but with our adapter.  When
+            # requests_cache is installed this is a cached session.
+            with self.mount(requests.Session()) as session:
+                return session.get(url, **kwargs)
+        return self.mount(session).get(url, **kwargs)
+
+
+class ThrottledAdapter(requests.adapters.HTTPAdapter):
+    """Waits for a HostThrottle turn before each request it sends."""
+    def __init__(self, throttle, **kwargs):
+        super(ThrottledAdapter, self).__init__(**kwargs)
+        self.throttle = throttle
+
+    def send(self, request, **kwargs):
+        with self.throttle.turn(request.url):
+            return super(ThrottledAdapter, self).send(request, **kwargs)
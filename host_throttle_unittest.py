@@ -0,0 +1,50 @@
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import collections
+import threading
+import time
+import unittest
+import host_throttle
+
+
+class HostThrottleTest(unittest.TestCase):
+    def test_max_in_flight_per_host(self):
+        throttle = host_throttle.HostThrottle(3, 0)
+        lock = threading.Lock()
+        in_flight = collections.Counter()
+        most_in_flight = collections.Counter()
+
+        def request(url, host):
+            with throttle.turn(url):
+                with lock:
+                    in_flight[host] += 1
+                    most_in_flight[host] = max(most_in_flight[host], in_flight[host])
+                time.sleep(0.01)
+                with lock:
+                    in_flight[host] -= 1
+
+        threads = []
+        for index in range(20):
+            for host in ['a.example.com', 'b.example.com']:
+                url = 'https://%s/issue/%d' % (host, index)
+                threads.append(threading.Thread(target=request, args=(url, host)))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Each host gets its own limit, and it is reached but never passed.
+        self.assertEquals(most_in_flight, {'a.example.com': 3, 'b.example.com': 3})
+
+    def test_min_interval(self):
+        throttle = host_throttle.HostThrottle(2, 0.05)
+        start = time.time()
+        for _ in range(3):
+            with throttle.turn('https://codereview.chromium.org/api/1'):
+                pass
+        self.assertTrue(time.time() - start >= 0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,6 +7,8 @@ import itertools
 import argparse
 import tempfile
 
+import git_reader
+
 BLINK_PATH = '/src/chromium/src/third_party/WebKit'
 SOURCE_PATH = os.path.join(BLINK_PATH, 'Source')
 sys.path.insert(0, SOURCE_PATH)
@@ -59,18 +61,15 @@ def load_interfaces(idl_paths):
 
 def paths_on_branch(repository, branch_name):
     branch_path = os.path.join(repository['branch_heads'], branch_name)
-    args = [
-        'git', 'ls-tree', '-r', '--name-only', branch_path
-    ]
-    return subprocess.check_output(args, cwd=repository['relative_path']).splitlines()
+    return git_reader.reader_for(repository['relative_path']).tree_paths(branch_path)
 
 
 def file_contents_from_branch(repository, branch, file_path):
     branch_path = os.path.join(repository['branch_heads'], branch)
-    args = [
-        'git', 'show', '%s:%s' % (branch_path, file_path)
-    ]
-    return subprocess.check_output(args, cwd=repository['relative_path'])
+    contents = git_reader.reader_for(repository['relative_path']).blob('%s:%s' % (branch_path, file_path))
+    if contents is None:
+        raise KeyError('%s not found on %s' % (file_path, branch_path))
+    return contents
 
 
 def load_interfaces_from_branch(repository, branch):
@@ -1,9 +1,11 @@
 import buildbot
+import collections
 import reasons
 import logging
 import sys
 import argparse
 import re
+import requests
 import json
 import urllib
 import string_helpers
@@ -31,16 +33,65 @@ SUCCESS, WARNINGS, FAILURE, SKIPPED, EXCEPTION, RETRY = range(6)
 NON_FAILING_RESULTS = (SUCCESS, WARNINGS, SKIPPED, None)
 
 
-def compute_transition_and_failure_count(failure, failing_build, previous_builds):
+class StepHistory(object):
+  """Every step name in a builder's recent builds, mapped to the steps with
+  that name in each build, newest build first.
+
+  Built once per builder so each alert's transition search is a walk
+  down one list rather than a refetch and rescan of the builder's history.
+  Reasons are looked up lazily and remembered, as several alerts can
+  need the reasons for the same failing step.  reasons_missing is set if
+  any of them couldn't be fetched.
+  """
+  def __init__(self, cache, builds, master_url, builder_name):
+    self.cache = cache
+    self.master_url = master_url
+    self.builder_name = builder_name
+    self._builds = dict((build['number'], build) for build in builds)
+    steps_by_build = []
+    for build in builds:
+      steps_by_name = collections.defaultdict(list)
+      for step in build['steps']:
+        steps_by_name[step['name']].append(step)
+      steps_by_build.append((build, steps_by_name))
+
+    step_names = set()
+    for _, steps_by_name in steps_by_build:
+      step_names.update(steps_by_name)
+    self._history = {}
+    for step_name in step_names:
+      self._history[step_name] = [(build, steps_by_name.get(step_name, []))
+        for build, steps_by_name in steps_by_build]
+    self._reasons = {}
+    self.reasons_missing = False
+
+  def build(self, build_number):
+    return self._builds[build_number]
+
+  def steps_before(self, step_name, build_number):
+    """(build, [steps named step_name]) for builds older than build_number."""
+    return [(build, steps) for build, steps in self._history.get(step_name, [])
+      if build['number'] < build_number]
+
+  def reasons(self, step, build):
+    key = (build['number'], step['name'])
+    if key not in self._reasons:
+      self._reasons[key] = reasons_for_failure(step, build,
+        self.builder_name, self.master_url, self.cache)
+      if self._reasons[key] is None:
+        self.reasons_missing = True
+    return self._reasons[key]
+
+
+def compute_transition_and_failure_count(failure, history):
   step_name = failure['step_name']
   reason = failure['reason']
 
-  first_fail = failing_build
+  first_fail = history.build(failure['last_failing_build'])
   last_pass = None
   fail_count = 1
   builds_missing_steps = []
-  for build in previous_builds:
-    matching_steps = [s for s in build['steps'] if s['name'] == step_name]
+  for build, matching_steps in history.steps_before(step_name, failure['last_failing_build']):
     if len(matching_steps) != 1:
       if not matching_steps:
         # This case is pretty common, so just warn all at once at the end.
@@ -53,8 +104,7 @@ def compute_transition_and_failure_count(failure, failing_build, previous_builds
     step_result = step['results'][0]
     if step_result not in NON_FAILING_RESULTS:
       if reason:
-        reasons = reasons_for_failure(step, build,
-          failure['builder_name'], failure['master_url'])
+        reasons = history.reasons(step, build)
         # This build doesn't seem to have this step reason, ignore it.
         if not reasons:
           continue
@@ -114,15 +164,41 @@ def failing_steps_for_build(build):
   return [step for step in failing_steps if step['name'] not in IGNORED_STEPS]
 
 
-def reasons_for_failure(step, build, builder_name, master_url):
+def reasons_for_failure(step, build, builder_name, master_url, cache=None):
+    """The step's failure reasons, [] if there aren't any to find, or None if
+    they couldn't be worked out this time (e.g. the logs didn't download)."""
+    # Finished steps of finished builds never change, so their reasons
+    # can be kept forever, one {step name: reasons} dict per build.
+    cacheable = cache and build['eta'] is None and step['isFinished']
+    if cacheable:
+      build_key = buildbot.cache_key_for_build(master_url, builder_name, build['number'])
+      reasons_key = buildbot.reasons_key_for_build_key(build_key)
+      reasons_by_step = cache.get(reasons_key) or {}
+      if step['name'] in reasons_by_step:
+        return reasons_by_step[step['name']]
+
     splitter = next((splitter for splitter in reasons.STEP_SPLITTERS if splitter.handles_step(step)), None)
     if not splitter:
-      return None
-    return splitter.split_step(step, build, builder_name, master_url)
-
-
-def alerts_from_step_failure(cache, step_failure, master_url, builder_name):
-  build = buildbot.fetch_build_json(cache, master_url, builder_name, step_failure['build_number'])
+      step_reasons = []
+    else:
+      try:
+        step_reasons = splitter.split_step(step, build, builder_name, master_url)
+      except (requests.exceptions.RequestException, ValueError), e:
+        log.error('Failed to split %s in %s %s: %s' % (step['name'], builder_name, build['number'], e))
+        step_reasons = None
+
+    # None is only a failure to fetch, so is tried again next time.
+    if cacheable and step_reasons is not None:
+      reasons_by_step = dict(reasons_by_step)
+      reasons_by_step[step['name']] = step_reasons
+      cache.set(reasons_key, reasons_by_step)
+    return step_reasons
+
+
+def alerts_from_step_failure(history, step_failure):
+  master_url = history.master_url
+  builder_name = history.builder_name
+  build = history.build(step_failure['build_number'])
   step = next((s for s in build['steps'] if s['name'] == step_failure['step_name']), None)
   step_template = {
     'master_url': master_url,
@@ -133,7 +209,7 @@ def alerts_from_step_failure(cache, step_failure, master_url, builder_name):
     'latest_revisions': buildbot.revisions_from_build(build),
   }
   alerts = []
-  reasons = reasons_for_failure(step, build, builder_name, master_url)
+  reasons = history.reasons(step, build)
   if not reasons:
     alert = dict(step_template)
     alert['reason'] = None
@@ -148,14 +224,9 @@ def alerts_from_step_failure(cache, step_failure, master_url, builder_name):
 
 
 # FIXME: This should merge with compute_transition_and_failure_count.
-def fill_in_transition(cache, alert, recent_build_ids):
-  previous_build_ids = [num for num in recent_build_ids if num < alert['last_failing_build']]
-  fetch_function = lambda num: buildbot.fetch_build_json(cache, alert['master_url'], alert['builder_name'], num)
-  build = fetch_function(alert['last_failing_build'])
-  previous_builds = map(fetch_function, previous_build_ids)
-
+def fill_in_transition(history, alert):
   last_pass_build, first_fail_build, fail_count = \
-    compute_transition_and_failure_count(alert, build, previous_builds)
+    compute_transition_and_failure_count(alert, history)
 
   failing = buildbot.revisions_from_build(first_fail_build)
   passing = buildbot.revisions_from_build(last_pass_build) if last_pass_build else None
@@ -193,40 +264,90 @@ def find_current_step_failures(fetch_function, recent_build_ids):
   return step_failures
 
 
-def alerts_for_builder(cache, master_url, builder_name, recent_build_ids):
+def _alerts_and_history(cache, master_url, builder_name, recent_build_ids):
+  """alerts_for_builder, plus the StepHistory (None if nothing is failing)."""
   recent_build_ids = sorted(recent_build_ids, reverse=True)
   # Limit to 100 to match our current cache-warming logic
   recent_build_ids = recent_build_ids[:100]
 
-  fetch_function = lambda num: buildbot.fetch_build_json(cache, master_url, builder_name, num)
+  fetch_function = lambda num: buildbot.fetch_build_summary(cache, master_url, builder_name, num)
   step_failures = find_current_step_failures(fetch_function, recent_build_ids)
 
   # for failure in step_failures:
   #   print '%s from %s' % (failure['step_name'], failure['build_number'])
 
+  if not step_failures:
+    return [], None
+
+  builds = filter(None, map(fetch_function, recent_build_ids))
+  history = StepHistory(cache, builds, master_url, builder_name)
   alerts = []
   for step_failure in step_failures:
-    alerts += alerts_from_step_failure(cache, step_failure, master_url, builder_name)
-  return [fill_in_transition(cache, alert, recent_build_ids) for alert in alerts]
+    alerts += alerts_from_step_failure(history, step_failure)
+  return [fill_in_transition(history, alert) for alert in alerts], history
 
 
-def alerts_for_master(cache, master_url, master_json, builder_name_filter=None):
+def alerts_for_builder(cache, master_url, builder_name, recent_build_ids):
+  alerts, _ = _alerts_and_history(cache, master_url, builder_name, recent_build_ids)
+  return alerts
+
+
+# One job per builder, so callers can spread builders across threads.
+def builder_jobs_for_master(master_url, master_json, builder_name_filter=None):
   active_builds = []
   for slave in master_json['slaves'].values():
     for build in slave['runningBuilds']:
       active_builds.append(build)
 
-  alerts = []
+  jobs = []
   for builder_name, builder_json in master_json['builders'].items():
     if builder_name_filter and builder_name_filter not in builder_name:
         continue
-    # cachedBuilds will include runningBuilds.
-    recent_build_ids = builder_json['cachedBuilds']
-    master_name = buildbot.master_name_from_url(master_url)
+    jobs.append({
+      'master_url': master_url,
+      'builder_name': builder_name,
+      # cachedBuilds will include runningBuilds.
+      'recent_build_ids': builder_json['cachedBuilds'],
+      'active_builds': active_builds,
+      'state': builder_state(builder_json, builder_name, active_builds),
+    })
+  return jobs
+
+
+# The alerts for a builder only depend on its finished builds and on
+# whatever steps its running builds have finished, so if neither has moved
+# since the last crawl its previous alerts still hold.
+def builder_state(builder_json, builder_name, active_builds):
+  running_steps = []
+  for build in active_builds:
+    if build['builderName'] != builder_name:
+      continue
+    finished_steps = [step for step in build.get('steps', []) if step.get('isFinished')]
+    running_steps.append((build['number'], len(finished_steps)))
+  return buildbot.last_finished_build_id(builder_json), tuple(sorted(running_steps))
+
+
+def alerts_for_builder_job(cache, job):
+  alerts, _ = crawl_builder_job(cache, job)
+  return alerts
 
-    buildbot.warm_build_cache(cache, master_url, builder_name, recent_build_ids, active_builds)
-    alerts.extend(alerts_for_builder(cache, master_url, builder_name, recent_build_ids))
 
+def crawl_builder_job(cache, job):
+  """Returns (alerts, complete) for a job from builder_jobs_for_master.
+
+  complete is False if some failure reasons couldn't be fetched, so the
+  alerts are worth working out again later.
+  """
+  buildbot.warm_build_cache(cache, job['master_url'], job['builder_name'],
+    job['recent_build_ids'], job['active_builds'])
+  alerts, history = _alerts_and_history(cache, job['master_url'], job['builder_name'], job['recent_build_ids'])
+  return alerts, not (history and history.reasons_missing)
+
+
+def alerts_for_master(cache, master_url, master_json, builder_name_filter=None):
+  alerts = []
+  for job in builder_jobs_for_master(master_url, master_json, builder_name_filter):
+    alerts.extend(alerts_for_builder_job(cache, job))
   return alerts
 
 
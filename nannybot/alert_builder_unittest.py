@@ -0,0 +1,191 @@
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import shutil
+import tempfile
+import unittest
+import alert_builder
+import buildbot
+
+
+MASTER_URL = 'http://build.chromium.org/p/chromium.linux'
+BUILDER_NAME = 'Linux Tests'
+STEP_NAME = 'browser_tests'
+
+
+class StubSplitter(object):
+    """Splits every step, with reasons from a dict of build number -> reasons."""
+    def __init__(self, reasons_by_build):
+        self.reasons_by_build = reasons_by_build
+        self.calls = []
+
+    def handles_step(self, step):
+        return True
+
+    def split_step(self, step, build, builder_name, master_url):
+        self.calls.append((build['number'], step['name']))
+        reasons = self.reasons_by_build.get(build['number'])
+        if isinstance(reasons, Exception):
+            raise reasons
+        return reasons
+
+
+def make_build(number, step_result, step_name=STEP_NAME, eta=None, step_finished=True):
+    steps = []
+    if step_name:
+        steps.append({
+            'name': step_name,
+            'results': [step_result, []],
+            'isFinished': step_finished,
+            'times': [number, number + 1],
+        })
+    return {
+        'number': number,
+        'eta': eta,
+        'results': alert_builder.FAILURE,
+        'properties': [['got_revision', str(1000 + number), 'Source']],
+        'steps': steps,
+    }
+
+
+class SplitterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.original_splitters = alert_builder.reasons.STEP_SPLITTERS
+
+    def install_splitter(self, reasons_by_build):
+        self.splitter = StubSplitter(reasons_by_build)
+        alert_builder.reasons.STEP_SPLITTERS = [self.splitter]
+
+    def tearDown(self):
+        alert_builder.reasons.STEP_SPLITTERS = self.original_splitters
+
+
+class StepHistoryTest(SplitterTestCase):
+    def transition(self, builds, reason, reasons_by_build):
+        self.install_splitter(reasons_by_build)
+        history = alert_builder.StepHistory(None, builds, MASTER_URL, BUILDER_NAME)
+        failure = {
+            'step_name': STEP_NAME,
+            'reason': reason,
+            'last_failing_build': builds[0]['number'],
+        }
+        last_pass, first_fail, fail_count = alert_builder.compute_transition_and_failure_count(failure, history)
+        return last_pass and last_pass['number'], first_fail['number'], fail_count
+
+    def test_stops_at_failure_without_reason(self):
+        builds = [
+            make_build(10, alert_builder.FAILURE),
+            make_build(9, alert_builder.FAILURE),
+            make_build(8, alert_builder.FAILURE),
+            make_build(7, alert_builder.SUCCESS),
+        ]
+        # 9 failed for some other reason, so the walk stops before it.
+        reasons_by_build = {10: ['Test.A'], 9: ['Test.B'], 8: ['Test.A']}
+        self.assertEquals(self.transition(builds, 'Test.A', reasons_by_build), (None, 10, 1))
+        self.assertEquals(self.splitter.calls, [(9, STEP_NAME)])
+        # A failure with no reasons at all is passed over.
+        reasons_by_build[9] = []
+        self.assertEquals(self.transition(builds, 'Test.A', reasons_by_build), (7, 8, 2))
+        # Without a reason any failure counts, and nothing is split.
+        self.assertEquals(self.transition(builds, None, reasons_by_build), (7, 8, 3))
+        self.assertEquals(self.splitter.calls, [])
+
+    def test_skips_steps_which_did_not_run(self):
+        builds = [
+            make_build(10, alert_builder.FAILURE),
+            make_build(9, None),
+            make_build(8, alert_builder.FAILURE),
+            make_build(7, alert_builder.SUCCESS),
+        ]
+        self.assertEquals(self.transition(builds, None, {}), (7, 8, 2))
+
+    def test_skips_builds_missing_step(self):
+        builds = [
+            make_build(10, alert_builder.FAILURE),
+            make_build(9, None, step_name=None),
+            make_build(8, alert_builder.SUCCESS, step_name='compile'),
+            make_build(7, alert_builder.FAILURE),
+            make_build(6, alert_builder.SUCCESS),
+        ]
+        self.assertEquals(self.transition(builds, None, {}), (6, 7, 2))
+
+    def test_alerts_share_history(self):
+        builds = [
+            make_build(10, alert_builder.FAILURE),
+            make_build(9, alert_builder.FAILURE),
+            make_build(8, alert_builder.SUCCESS),
+        ]
+        self.install_splitter({10: ['Test.A', 'Test.B'], 9: ['Test.A', 'Test.B']})
+        history = alert_builder.StepHistory(None, builds, MASTER_URL, BUILDER_NAME)
+        alerts = alert_builder.alerts_from_step_failure(history, {'build_number': 10, 'step_name': STEP_NAME})
+        alerts = [alert_builder.fill_in_transition(history, alert) for alert in alerts]
+        self.assertEquals([alert['reason'] for alert in alerts], ['Test.A', 'Test.B'])
+        for alert in alerts:
+            self.assertEquals(alert['passing_build'], 8)
+            self.assertEquals(alert['failing_build'], 9)
+            self.assertEquals(alert['failing_build_count'], 2)
+            self.assertEquals(alert['passing_revisions']['chromium'], '1008')
+        # Each build's reasons are only split once, however many alerts need them.
+        self.assertEquals(self.splitter.calls, [(10, STEP_NAME), (9, STEP_NAME)])
+        self.assertFalse(history.reasons_missing)
+
+
+
+class ReasonsCacheTest(SplitterTestCase):
+    def setUp(self):
+        super(ReasonsCacheTest, self).setUp()
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache = buildbot.BuildCache(self.temp_dir)
+
+    def tearDown(self):
+        super(ReasonsCacheTest, self).tearDown()
+        shutil.rmtree(self.temp_dir)
+
+    def reasons_key(self, build):
+        build_key = buildbot.cache_key_for_build(MASTER_URL, BUILDER_NAME, build['number'])
+        return buildbot.reasons_key_for_build_key(build_key)
+
+    def split_twice(self, build):
+        step = build['steps'][0]
+        return [alert_builder.reasons_for_failure(step, build, BUILDER_NAME, MASTER_URL, self.cache)
+            for _ in range(2)]
+
+    def test_finished_step_is_split_once(self):
+        build = make_build(10, alert_builder.FAILURE)
+        self.install_splitter({10: ['Test.A']})
+        self.assertEquals(self.split_twice(build), [['Test.A'], ['Test.A']])
+        self.assertEquals(self.splitter.calls, [(10, STEP_NAME)])
+        self.assertEquals(self.cache.get(self.reasons_key(build)), {STEP_NAME: ['Test.A']})
+
+        # Another step of the same build goes in the same reasons dict.
+        compile_step = make_build(10, alert_builder.FAILURE, step_name='compile')['steps'][0]
+        alert_builder.reasons_for_failure(compile_step, build, BUILDER_NAME, MASTER_URL, self.cache)
+        self.assertEquals(self.cache.get(self.reasons_key(build)), {STEP_NAME: ['Test.A'], 'compile': ['Test.A']})
+
+    def test_unfinished_builds_and_steps_are_not_cached(self):
+        for build in [make_build(10, alert_builder.FAILURE, eta=60),
+                make_build(10, alert_builder.FAILURE, step_finished=False)]:
+            self.install_splitter({10: ['Test.A']})
+            self.assertEquals(self.split_twice(build), [['Test.A'], ['Test.A']])
+            self.assertEquals(len(self.splitter.calls), 2)
+            self.assertFalse(self.cache.has(self.reasons_key(build)))
+
+    def test_fetch_failures_are_not_cached(self):
+        build = make_build(10, alert_builder.FAILURE)
+        for failure in [None, ValueError('cut short')]:
+            self.install_splitter({10: failure})
+            self.assertEquals(self.split_twice(build), [None, None])
+            self.assertEquals(len(self.splitter.calls), 2)
+            self.assertFalse(self.cache.has(self.reasons_key(build)))
+
+    def test_no_reasons_are_cached(self):
+        build = make_build(10, alert_builder.FAILURE)
+        self.install_splitter({10: []})
+        self.assertEquals(self.split_twice(build), [[], []])
+        self.assertEquals(len(self.splitter.calls), 1)
+        self.assertEquals(self.cache.get(self.reasons_key(build)), {STEP_NAME: []})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,20 +4,10 @@
 
 import json
 import collections
+import heapq
 import operator
 
 
-# Git ready, but only implemented for SVN atm.
-def ids_after_first_including_second(first, second):
-    if not first or not second:
-        return []
-    try:
-        return range(int(first) + 1, int(second) + 1)
-    except ValueError, e:
-        # likely passed a git hash
-        return []
-
-
 # Git ready, but only implemented for SVN atm.
 def is_ancestor_of(older, younger):
     return int(older) < int(younger)
@@ -35,15 +25,92 @@ def commit_compare(one, two):
     return 0 # This is technically not right, since commits can be non-comparable.
 
 
-def flatten_to_commit_list(passing, failing):
-    # Flatten two commit dicts to a list of 'name:commit'
-    if not passing or not failing:
-        return []
-    all_commits = []
-    for name in passing.keys():
-        commits = ids_after_first_including_second(passing[name], failing[name])
-        all_commits.extend(['%s:%s' % (name, commit) for commit in commits])
-    return all_commits
+class RevisionRange(object):
+    """Revisions which might be to blame, as per-repository intervals.
+
+    Each interval is (name, after, last): revisions of repository name
+    after after up to and including last.  Spans of thousands of
+    revisions stay three values until something asks for commits().
+    """
+    def __init__(self, intervals=()):
+        by_name = collections.defaultdict(list)
+        for name, after, last in intervals:
+            if after < last:
+                by_name[name].append((after, last))
+        normalized = []
+        for name in sorted(by_name):
+            for after, last in sorted(by_name[name]):
+                previous = normalized[-1] if normalized else None
+                # Overlapping or adjacent intervals become one.
+                if previous and previous[0] == name and after <= previous[2]:
+                    normalized[-1] = (name, previous[1], max(previous[2], last))
+                else:
+                    normalized.append((name, after, last))
+        self.intervals = tuple(normalized)
+
+    @classmethod
+    def from_revisions(cls, passing, failing):
+        """The revisions after passing up to and including failing."""
+        if not passing or not failing:
+            return cls()
+        intervals = []
+        for name in passing.keys():
+            if not passing[name] or not failing.get(name):
+                continue
+            try:
+                intervals.append((name, int(passing[name]), int(failing[name])))
+            except ValueError, e:
+                # likely passed a git hash
+                pass
+        return cls(intervals)
+
+    @classmethod
+    def from_json(cls, intervals):
+        return cls(map(tuple, intervals))
+
+    def to_json(self):
+        return map(list, self.intervals)
+
+    def intersection(self, other):
+        intervals = []
+        for name, after, last in self.intervals:
+            for other_name, other_after, other_last in other.intervals:
+                if name == other_name:
+                    intervals.append((name, max(after, other_after), min(last, other_last)))
+        return RevisionRange(intervals)
+
+    def union(self, other):
+        return RevisionRange(self.intervals + other.intervals)
+
+    def commits(self):
+        """Yields 'name:commit' for each revision in the range."""
+        for name, after, last in self.intervals:
+            for commit in xrange(after + 1, last + 1):
+                yield '%s:%s' % (name, commit)
+
+    def __len__(self):
+        return sum(last - after for _, after, last in self.intervals)
+
+    def __eq__(self, other):
+        return isinstance(other, RevisionRange) and self.intervals == other.intervals
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.intervals)
+
+    def __str__(self):
+        parts = []
+        for name, after, last in self.intervals:
+            if last == after + 1:
+                parts.append('%s:%s' % (name, last))
+            else:
+                parts.append('%s:%s-%s' % (name, after + 1, last))
+        return ' '.join(parts)
+
+    def __repr__(self):
+        return 'RevisionRange(%r)' % (self.intervals,)
 
 
 # FIXME: Perhaps this should be done by the feeder?
@@ -88,8 +155,8 @@ def merge_regression_ranges(alerts):
 
     # FIXME: Ojan would like us to remove keys from both last and first
     # in the case where last > first.  Unfortunately that's somewhat
-    # tricky to do here.  It happens that flatten_to_commit_list
-    # happens to do this for us since range(5, 3) == [] in python.
+    # tricky to do here.  It happens that RevisionRange does this
+    # for us since it drops intervals where last <= after.
 
     return last_passing, first_failing
 
@@ -113,37 +180,107 @@ def group_by_reason(alerts):
     reason_groups = []
     for reason_key, alerts in by_reason.items():
         last_passing, first_failing = merge_regression_ranges(alerts)
-        blame_list = flatten_to_commit_list(last_passing, first_failing)
-        # FIXME: blame_list isn't filtered yet, but should be.
+        blame_range = RevisionRange.from_revisions(last_passing, first_failing)
+        # FIXME: blame_range isn't filtered yet, but should be.
         reason_groups.append({
             'sort_key': reason_key,
             'merged_last_passing': last_passing,
             'merged_first_failing': first_failing,
-            'likely_revisions': blame_list,
+            # The ui expands this to a list of commits when it's short.
+            'likely_range': blame_range.to_json(),
+            'likely_revision_count': len(blame_range),
             'failure_keys': map(operator.itemgetter('key'), alerts),
         })
     return reason_groups
 
-# http://stackoverflow.com/questions/18715688/find-common-substring-between-two-strings
-def longestSubstringFinder(string1, string2):
-    answer = ""
-    len1, len2 = len(string1), len(string2)
-    for i in range(len1):
-        match = ""
-        for j in range(len2):
-            if (i + j < len1 and string1[i + j] == string2[j]):
-                match += string2[j]
+class SuffixAutomaton(object):
+    """The suffix automaton of a string: a state for each set of its
+    substrings which always end at the same positions."""
+    def __init__(self, string):
+        self.string = string
+        # Per state: longest substring length, suffix link, transitions,
+        # and where in string its substrings first end.
+        self.lengths = [0]
+        self.links = [-1]
+        self.transitions = [{}]
+        self.first_ends = [-1]
+        last = 0
+        for position, char in enumerate(string):
+            current = self._add_state(self.lengths[last] + 1, -1, {}, position)
+            state = last
+            while state != -1 and char not in self.transitions[state]:
+                self.transitions[state][char] = current
+                state = self.links[state]
+            if state == -1:
+                self.links[current] = 0
             else:
-                if (len(match) > len(answer)): answer = match
-                match = ""
-    return answer
+                next_state = self.transitions[state][char]
+                if self.lengths[state] + 1 == self.lengths[next_state]:
+                    self.links[current] = next_state
+                else:
+                    clone = self._add_state(self.lengths[state] + 1, self.links[next_state],
+                        dict(self.transitions[next_state]), self.first_ends[next_state])
+                    while state != -1 and self.transitions[state].get(char) == next_state:
+                        self.transitions[state][char] = clone
+                        state = self.links[state]
+                    self.links[next_state] = clone
+                    self.links[current] = clone
+            last = current
+        # Longest first, so a state is always seen before its suffix link.
+        self.states_by_length = sorted(range(len(self.lengths)), key=self.lengths.__getitem__, reverse=True)
+
+    def _add_state(self, length, link, transitions, first_end):
+        self.lengths.append(length)
+        self.links.append(link)
+        self.transitions.append(transitions)
+        self.first_ends.append(first_end)
+        return len(self.lengths) - 1
+
+    def match_lengths(self, other):
+        """For each state, the longest of its substrings which is also in other."""
+        matches = [0] * len(self.lengths)
+        state, length = 0, 0
+        for char in other:
+            while state and char not in self.transitions[state]:
+                state = self.links[state]
+                length = self.lengths[state]
+            if char in self.transitions[state]:
+                state = self.transitions[state][char]
+                length += 1
+            matches[state] = max(matches[state], length)
+        # Whatever matched a state also matched all of its suffix link.
+        for state in self.states_by_length:
+            link = self.links[state]
+            if matches[state] and link > 0:
+                matches[link] = self.lengths[link]
+        return matches
+
+
+def longest_common_substring(strings):
+    """Longest string found in all of strings, the earliest in strings[0] if there's a tie."""
+    if not strings:
+        return ''
+    # The shortest string has the smallest automaton.
+    automaton = SuffixAutomaton(min(strings, key=len))
+    common = list(automaton.lengths)
+    for other in strings:
+        if other is not automaton.string:
+            common = map(min, common, automaton.match_lengths(other))
+    longest = max(common)
+    candidates = set(automaton.string[end - longest + 1:end + 1]
+        for state, end in enumerate(automaton.first_ends) if common[state] == longest)
+    return min(candidates, key=strings[0].find)
+
+
+def longestSubstringFinder(string1, string2):
+    return longest_common_substring([string1, string2])
 
 
 def range_key_for_group(group):
     last_passing = group['merged_last_passing']
     first_failing = group['merged_first_failing']
     if last_passing:
-        range_key = ' '.join(flatten_to_commit_list(last_passing, first_failing))
+        range_key = str(RevisionRange.from_revisions(last_passing, first_failing))
     else:
         # Even regressions where we don't know when they started can be
         # merged by our earliest known failure.
@@ -159,22 +296,88 @@ def merge_by_range(reason_groups):
     if not reason_groups:
         return []
     expected_keys = sorted(reason_groups[0].keys())
-    by_range = {}
+    by_range = collections.OrderedDict()
     for group in reason_groups:
-        range_key = range_key_for_group(group)
-        existing = by_range.get(range_key)
-        if not existing:
-            # Shallow copy of group.
-            by_range[range_key] = dict(group)
+        by_range.setdefault(range_key_for_group(group), []).append(group)
+
+    merged_groups = []
+    for groups in by_range.values():
+        # Shallow copy of group.
+        merged = dict(groups[0])
+        if len(groups) > 1:
+            # FIXME: It's possible we don't want to merge two keys with nothing in common.
+            # e.g. bot_update and
+            # We only care about these two keys, the rest should be the same between all groups.
+            # I guess we could assert that...
+            failure_keys = [key for group in groups for key in group['failure_keys']]
+            merged.update({
+                'sort_key': longest_common_substring([group['sort_key'] for group in groups]),
+                'failure_keys': sorted(set(failure_keys)),
+            })
+        merged_groups.append(merged)
+
+    return sorted(merged_groups, key=operator.itemgetter('sort_key'))
+
+
+def overlapping_pairs(ranges):
+    """Yields (i, j), i < j, for each pair of ranges sharing a revision.
+
+    Sweeps each repository's intervals in order of where they start,
+    keeping a heap of those still open, so it takes O((n + k) log n)
+    for n intervals and k overlapping pairs.
+    """
+    by_name = collections.defaultdict(list)
+    for index, revision_range in enumerate(ranges):
+        for name, after, last in revision_range.intervals:
+            by_name[name].append((after, last, index))
+
+    seen = set()
+    for intervals in by_name.values():
+        open_intervals = []
+        for after, last, index in sorted(intervals):
+            # Intervals ending at or before after hold none of its revisions.
+            while open_intervals and open_intervals[0][0] <= after:
+                heapq.heappop(open_intervals)
+            for _, other_index in open_intervals:
+                pair = (min(index, other_index), max(index, other_index))
+                # A pair may overlap in several repositories.
+                if pair[0] != pair[1] and pair not in seen:
+                    seen.add(pair)
+                    yield pair
+            heapq.heappush(open_intervals, (last, index))
+
+
+def cluster_by_overlap(reason_groups):
+    """Groups reason_groups whose likely ranges overlap, directly or through
+    other groups.  Only clusters of more than one group are returned."""
+    ranges = [RevisionRange.from_json(group['likely_range']) for group in reason_groups]
+    parents = range(len(reason_groups))
+
+    def find(index):
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    for one, two in overlapping_pairs(ranges):
+        parents[find(one)] = find(two)
+
+    members = collections.OrderedDict()
+    for index in range(len(reason_groups)):
+        members.setdefault(find(index), []).append(index)
+
+    clusters = []
+    for indexes in members.values():
+        if len(indexes) < 2:
             continue
-
-        # FIXME: It's possible we don't want to merge two keys with nothing in common.
-        # e.g. bot_update and
-        # We only care about these two keys, the rest should be the same between all groups.
-        # I guess we could assert that...
-        by_range[range_key].update({
-            'sort_key': longestSubstringFinder(existing['sort_key'], group['sort_key']),
-            'failure_keys': sorted(set(existing['failure_keys'] + group['failure_keys'])),
+        groups = [reason_groups[index] for index in indexes]
+        cluster_ranges = [ranges[index] for index in indexes]
+        clusters.append({
+            'sort_keys': sorted(group['sort_key'] for group in groups),
+            'failure_keys': sorted(set(key for group in groups for key in group['failure_keys'])),
+            'likely_range': reduce(RevisionRange.union, cluster_ranges).to_json(),
+            # Revisions every group in the cluster could blame, often empty
+            # when groups only overlap through each other.
+            'common_range': reduce(RevisionRange.intersection, cluster_ranges).to_json(),
         })
-
-    return sorted(by_range.values(), key=operator.itemgetter('sort_key'))
+    return sorted(clusters, key=operator.itemgetter('sort_keys'))
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+# Times merge_by_range on an outage sized pile of reason groups which all
+# share one regression range, against the pairwise quadratic substring
+# search it used to fold each group in with, and times cluster_by_overlap
+# on groups with scattered ranges against comparing every pair of groups.
+
+import argparse
+import random
+import sys
+import time
+
+import analysis
+
+
+# The old analysis.longestSubstringFinder, from
+# http://stackoverflow.com/questions/18715688/find-common-substring-between-two-strings
+def quadratic_longest_substring(string1, string2):
+    answer = ""
+    len1, len2 = len(string1), len(string2)
+    for i in range(len1):
+        match = ""
+        for j in range(len2):
+            if (i + j < len1 and string1[i + j] == string2[j]):
+                match += string2[j]
+            else:
+                if (len(match) > len(answer)): answer = match
+                match = ""
+    return answer
+
+
+def outage_groups(group_count, seed=0):
+    randomizer = random.Random(seed)
+    directories = ['fast/dom', 'fast/css', 'http/tests/security', 'svg/custom', 'editing/selection']
+    groups = []
+    for index in range(group_count):
+        test_path = '%s/%s-%d.html' % (randomizer.choice(directories),
+            ''.join(randomizer.choice('abcdefghijklmnop') for _ in range(randomizer.randint(8, 30))), index)
+        groups.append({
+            'sort_key': 'webkit_tests:%s' % test_path,
+            'merged_last_passing': { 'chromium': '290000', 'blink': '180000' },
+            'merged_first_failing': { 'chromium': '290004', 'blink': '180002' },
+            'likely_range': [['blink', 180000, 180002], ['chromium', 290000, 290004]],
+            'likely_revision_count': 6,
+            'failure_keys': ['f%d' % index],
+        })
+    return groups
+
+
+def scattered_groups(group_count, seed=0):
+    randomizer = random.Random(seed)
+    groups = []
+    for index in range(group_count):
+        passing = randomizer.randint(290000, 300000)
+        groups.append({
+            'sort_key': 'browser_tests:Suite.Test%d' % index,
+            'likely_range': [['chromium', passing, passing + randomizer.randint(1, 40)]],
+            'failure_keys': ['f%d' % index],
+        })
+    return groups
+
+
+def pairwise_overlaps(groups):
+    ranges = [analysis.RevisionRange.from_json(group['likely_range']) for group in groups]
+    return [(one, two) for one in range(len(ranges)) for two in range(one + 1, len(ranges))
+        if ranges[one].intersection(ranges[two])]
+
+
+def time_it(name, function, repeat):
+    start = time.time()
+    for _ in range(repeat):
+        result = function()
+    print '%-24s %8.2fms' % (name, (time.time() - start) * 1000 / repeat)
+    return result
+
+
+def main(args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--groups', default=500, type=int)
+    parser.add_argument('--repeat', default=5, type=int)
+    args = parser.parse_args(args)
+
+    groups = outage_groups(args.groups)
+    sort_keys = [group['sort_key'] for group in groups]
+    old_key = time_it('pairwise quadratic', lambda: reduce(quadratic_longest_substring, sort_keys), args.repeat)
+    new_key = time_it('suffix automaton', lambda: analysis.longest_common_substring(sort_keys), args.repeat)
+    time_it('merge_by_range', lambda: analysis.merge_by_range(groups), args.repeat)
+    print 'old: %r new: %r %s' % (old_key, new_key, 'same' if old_key == new_key else 'DIFFERENT')
+
+    groups = scattered_groups(args.groups)
+    ranges = [analysis.RevisionRange.from_json(group['likely_range']) for group in groups]
+    old_pairs = time_it('pairwise overlaps', lambda: pairwise_overlaps(groups), args.repeat)
+    new_pairs = time_it('overlapping_pairs', lambda: sorted(analysis.overlapping_pairs(ranges)), args.repeat)
+    clusters = time_it('cluster_by_overlap', lambda: analysis.cluster_by_overlap(groups), args.repeat)
+    print '%d overlapping pairs, %d clusters %s' % (len(new_pairs), len(clusters),
+        'same' if old_pairs == new_pairs else 'DIFFERENT')
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
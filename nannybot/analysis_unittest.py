@@ -76,11 +76,28 @@ class FailureAnalysisTest(unittest.TestCase):
         self.assertEquals(expected_pass, passing)
 
 
-    def test_flatten_to_commit_list(self):
-        passing = { 'v8': '1', 'chromium': '4'}
-        failing = { 'v8': '2', 'chromium': '4'}
-        commit_list = analysis.flatten_to_commit_list(passing, failing)
-        self.assertEquals(commit_list, ['v8:2'])
+    def test_revision_range(self):
+        passing = { 'v8': '1', 'chromium': '4', 'blink': 'abcdef', 'nacl': '7' }
+        failing = { 'v8': '2000', 'chromium': '4', 'blink': 'fedcba' }
+        revisions = analysis.RevisionRange.from_revisions(passing, failing)
+        self.assertEquals(revisions.intervals, (('v8', 1, 2000),))
+        self.assertEquals(len(revisions), 1999)
+        self.assertEquals(str(revisions), 'v8:2-2000')
+        self.assertEquals(list(revisions.commits())[:2], ['v8:2', 'v8:3'])
+        self.assertEquals(analysis.RevisionRange.from_json(revisions.to_json()), revisions)
+        self.assertEquals(hash(analysis.RevisionRange([('v8', 1, 2000)])), hash(revisions))
+        self.assertFalse(analysis.RevisionRange.from_revisions(None, failing))
+
+    def test_revision_range_union_and_intersection(self):
+        one = analysis.RevisionRange([('v8', 1, 5), ('chromium', 10, 20)])
+        two = analysis.RevisionRange([('v8', 5, 8), ('chromium', 30, 40), ('nacl', 1, 2)])
+        self.assertEquals(one.union(two).intervals,
+            (('chromium', 10, 20), ('chromium', 30, 40), ('nacl', 1, 2), ('v8', 1, 8)))
+        self.assertEquals(str(one.union(two)), 'chromium:11-20 chromium:31-40 nacl:2 v8:2-8')
+        self.assertEquals(one.intersection(two).intervals, ())
+        three = analysis.RevisionRange([('v8', 3, 6), ('chromium', 15, 35)])
+        self.assertEquals(one.union(two).intersection(three).intervals,
+            (('chromium', 15, 20), ('chromium', 30, 35), ('v8', 3, 6)))
 
 
     def test_range_key_for_group(self):
@@ -92,6 +109,18 @@ class FailureAnalysisTest(unittest.TestCase):
         }
         range_key = analysis.range_key_for_group(group)
         self.assertEquals(range_key, 'foo<=v8:2 <=chromium:4')
+        group['merged_last_passing'] = { 'v8': '1', 'chromium': '2'}
+        self.assertEquals(analysis.range_key_for_group(group), 'foochromium:3-4 v8:2')
+
+    def test_group_by_reason(self):
+        alerts = json.loads(self.MERGE_REGRESSION_RANGES_JSON)
+        for index, alert in enumerate(alerts):
+            alert.update({'key': 'f%d' % index, 'step_name': 'compile', 'reason': None, 'builder_name': 'Linux'})
+        groups = analysis.group_by_reason(alerts)
+        self.assertEquals(len(groups), 1)
+        self.assertEquals(groups[0]['likely_range'], [['chromium', 281989, 282006]])
+        self.assertEquals(groups[0]['likely_revision_count'], 17)
+        self.assertEquals(groups[0]['failure_keys'], ['f0', 'f1'])
 
     MERGE_BY_RANGE_JSON = """
 [
@@ -119,6 +148,55 @@ class FailureAnalysisTest(unittest.TestCase):
         self.assertEquals(merged[0]['sort_key'], 'dromaeo.')
         self.assertEquals(analysis.merge_by_range([]), [])
 
+    def test_merge_by_range_bucket(self):
+        groups = json.loads(self.MERGE_BY_RANGE_JSON)
+        groups[0]['failure_keys'] = ['f2', 'f1']
+        groups[1]['failure_keys'] = ['f1', 'f3']
+        groups.append(dict(groups[1], sort_key='dromaeo.domcorequery', failure_keys=['f4']))
+        groups.append(dict(groups[1], merged_first_failing={ 'v8': '3' }, sort_key='other', failure_keys=['f6', 'f5']))
+        merged = analysis.merge_by_range(groups)
+        self.assertEquals([group['sort_key'] for group in merged], ['dromaeo.', 'other'])
+        self.assertEquals(merged[0]['failure_keys'], ['f1', 'f2', 'f3', 'f4'])
+        # Groups which didn't merge are left alone.
+        self.assertEquals(merged[1]['failure_keys'], ['f6', 'f5'])
+
+    def test_overlapping_pairs(self):
+        ranges = [
+            analysis.RevisionRange([('v8', 1, 5)]),
+            analysis.RevisionRange([('v8', 5, 8), ('chromium', 10, 20)]),
+            analysis.RevisionRange([('v8', 4, 6), ('chromium', 19, 30)]),
+            analysis.RevisionRange([('nacl', 1, 100)]),
+            analysis.RevisionRange(),
+        ]
+        self.assertEquals(sorted(analysis.overlapping_pairs(ranges)), [(0, 2), (1, 2)])
+
+    def test_cluster_by_overlap(self):
+        groups = [
+            {'sort_key': 'a', 'likely_range': [['v8', 1, 5]], 'failure_keys': ['f1']},
+            {'sort_key': 'b', 'likely_range': [['nacl', 1, 5]], 'failure_keys': ['f2']},
+            {'sort_key': 'c', 'likely_range': [['v8', 7, 9]], 'failure_keys': ['f3']},
+            {'sort_key': 'd', 'likely_range': [['v8', 3, 8]], 'failure_keys': ['f4', 'f1']},
+            {'sort_key': 'e', 'likely_range': [], 'failure_keys': ['f5']},
+        ]
+        clusters = analysis.cluster_by_overlap(groups)
+        self.assertEquals(clusters, [{
+            'sort_keys': ['a', 'c', 'd'],
+            'failure_keys': ['f1', 'f3', 'f4'],
+            'likely_range': [['v8', 1, 9]],
+            'common_range': [],
+        }])
+        self.assertEquals(analysis.cluster_by_overlap([]), [])
+
+    def test_longest_common_substring(self):
+        self.assertEquals(analysis.longest_common_substring([]), '')
+        self.assertEquals(analysis.longest_common_substring(['webkit_tests']), 'webkit_tests')
+        self.assertEquals(analysis.longest_common_substring(['abc', 'def']), '')
+        self.assertEquals(analysis.longest_common_substring(['xabcy', 'abcz', 'zzabc']), 'abc')
+        # Ties go to the earliest in the first string.
+        self.assertEquals(analysis.longest_common_substring(['abxcd', 'cdab']), 'ab')
+        self.assertEquals(analysis.longest_common_substring(['cdxab', 'abcd']), 'cd')
+        self.assertEquals(analysis.longestSubstringFinder('browser_tests:Foo.Bar', 'content_browsertests:Foo.Bar'), 'tests:Foo.Bar')
+
 
 if __name__ == '__main__':
     unittest.main()
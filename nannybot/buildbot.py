@@ -7,10 +7,17 @@ import json
 import logging
 import operator
 import os
-import requests
+import sqlite3
+import threading
+import time
 import urlparse
 import string_helpers
 import datetime
+import sys
+
+# host_throttle is shared with cycletimes.py, one directory up.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import host_throttle
 
 
 # Python logging is stupidly verbose to configure.
@@ -30,6 +37,18 @@ log, logging_handler = setup_logging()
 
 CBE_BASE = 'https://chrome-build-extract.appspot.com'
 
+# Limits for crawling with feeder.py --jobs.
+MAX_REQUESTS_PER_HOST = 8
+MIN_SECONDS_BETWEEN_REQUESTS = 0.0
+
+
+throttle = host_throttle.HostThrottle(MAX_REQUESTS_PER_HOST, MIN_SECONDS_BETWEEN_REQUESTS)
+
+
+# All fetches go through here so concurrent crawls share the per-host limits.
+def http_get(url, **kwargs):
+    return throttle.get(url, **kwargs)
+
 # Unclear if this should be specific to builds.
 class BuildCache(object):
     def __init__(self, root_path):
@@ -46,21 +65,174 @@ class BuildCache(object):
 
     # Could be attr getter.
     def get(self, key):
+        return self.get_with_size(key)[0]
+
+    def get_with_size(self, key):
+        """Returns (json_object, length of its json), or (None, 0)."""
         path = os.path.join(self.root_path, key)
         if not self.has(path):
-            return None
+            return None, 0
         with open(path) as cached:
-            return json.load(cached)
+            text = cached.read()
+        return json.loads(text), len(text)
 
     # Could be attr setter.
     def set(self, key, json_object):
         path = os.path.join(self.root_path, key)
         cache_dir = os.path.dirname(path)
         if not os.path.exists(cache_dir):
-            os.makedirs(cache_dir)
+            try:
+                os.makedirs(cache_dir)
+            except OSError:
+                # Another crawl thread may have just made it.
+                if not os.path.isdir(cache_dir):
+                    raise
         with open(path, 'w') as cached:
             cached.write(json.dumps(json_object))
 
+    def set_many(self, items):
+        for key, json_object in items:
+            self.set(key, json_object)
+
+
+class SQLiteBuildCache(object):
+    """BuildCache in a single sqlite file instead of a file per key.
+
+    Keys are the same 'master/builder/number.kind' paths BuildCache uses,
+    stored split up so the table is indexed by (master, builder, number).
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        # feeder.py --jobs uses one cache from several threads.
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS builds ('
+            'master TEXT, builder TEXT, number INTEGER, kind TEXT, mtime REAL, body TEXT, '
+            'PRIMARY KEY (master, builder, number, kind))')
+        self._connection.commit()
+
+    @staticmethod
+    def _split_key(key):
+        master, rest = key.split('/', 1)
+        builder, filename = rest.rsplit('/', 1)
+        number, kind = filename.split('.', 1)
+        return master, builder, number, kind
+
+    def _select(self, columns, key):
+        with self._lock:
+            return self._connection.execute('SELECT %s FROM builds '
+                'WHERE master = ? AND builder = ? AND number = ? AND kind = ?' % columns,
+                self._split_key(key)).fetchone()
+
+    def has(self, key):
+        return self._select('1', key) is not None
+
+    def key_age(self, key):
+        return datetime.datetime.fromtimestamp(self._select('mtime', key)[0])
+
+    def get(self, key):
+        return self.get_with_size(key)[0]
+
+    def get_with_size(self, key):
+        """Returns (json_object, length of its json), or (None, 0)."""
+        row = self._select('body', key)
+        if not row:
+            return None, 0
+        return json.loads(row[0]), len(row[0])
+
+    def set(self, key, json_object):
+        self.set_many([(key, json_object)])
+
+    def set_many(self, items):
+        now = time.time()
+        rows = [self._split_key(key) + (now, json.dumps(json_object)) for key, json_object in items]
+        with self._lock:
+            with self._connection:
+                self._connection.executemany('INSERT OR REPLACE INTO builds VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+
+class MemoryBuildCache(object):
+    """Keeps the most recently used decoded json in front of another cache.
+
+    Evicts once the json of what it holds adds up to more than max_bytes.
+    The decoded objects take several times as much memory as their json,
+    but in proportion to it, unlike a count of entries which would treat
+    a big build and a small reasons dict the same.
+
+    Callers share the returned objects, so they must not modify them.
+    """
+    def __init__(self, backing_cache, max_bytes=64 * 1024 * 1024):
+        self.backing_cache = backing_cache
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # key -> (json_object, mtime or None if only known to backing_cache, size)
+        self._entries = collections.OrderedDict()
+
+    def _remember(self, key, json_object, mtime, size):
+        old_entry = self._entries.pop(key, None)
+        if old_entry:
+            self.bytes -= old_entry[2]
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (json_object, mtime, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self.bytes -= evicted_size
+
+    def has(self, key):
+        with self._lock:
+            if key in self._entries:
+                return True
+        return self.backing_cache.has(key)
+
+    def key_age(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry and entry[1]:
+            return entry[1]
+        return self.backing_cache.key_age(key)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry:
+                self._entries[key] = entry
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        json_object, size = self.backing_cache.get_with_size(key)
+        if json_object is not None:
+            with self._lock:
+                self._remember(key, json_object, None, size)
+        return json_object
+
+    def set(self, key, json_object):
+        self.set_many([(key, json_object)])
+
+    def set_many(self, items):
+        self.backing_cache.set_many(items)
+        now = datetime.datetime.now()
+        sizes = [len(json.dumps(json_object)) for _, json_object in items]
+        with self._lock:
+            for (key, json_object), size in zip(items, sizes):
+                self._remember(key, json_object, now, size)
+
+    def stats(self):
+        return '%s hits, %s misses, %s entries (%.1fMB of json)' % (
+            self.hits, self.misses, len(self._entries), self.bytes / 1024.0 / 1024)
+
+
+# Paths ending in .sqlite get a SQLiteBuildCache, anything else is a
+# directory for BuildCache.
+def open_build_cache(path):
+    if path.endswith('.sqlite'):
+        return SQLiteBuildCache(path)
+    return BuildCache(path)
+
 
 def master_name_from_url(master_url):
     return urlparse.urlparse(master_url).path.split('/')[-1]
@@ -71,18 +243,106 @@ def cache_key_for_build(master_url, builder_name, build_number):
     return os.path.join(master_name, builder_name, "%s.json" % build_number)
 
 
+def summary_key_for_build_key(cache_key):
+    return os.path.splitext(cache_key)[0] + '.summary.json'
+
+
+def reasons_key_for_build_key(cache_key):
+    return os.path.splitext(cache_key)[0] + '.reasons.json'
+
+
+class _SummaryMapping(object):
+    __slots__ = ()
+
+    # Summaries stand in for the build json dicts, so support the
+    # subscripting the alert code already does.
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+
+class StepSummary(_SummaryMapping):
+    __slots__ = ('name', 'results', 'isFinished', 'times', 'urls')
+
+    def __init__(self, name, results, isFinished, times, urls):
+        self.name = name
+        self.results = results
+        self.isFinished = isFinished
+        self.times = times
+        self.urls = urls
+
+    @classmethod
+    def from_step(cls, step):
+        return cls(step['name'], step.get('results'), step.get('isFinished'),
+            step.get('times'), step.get('urls', {}))
+
+    def to_json(self):
+        return [self.name, self.results, self.isFinished, self.times, self.urls]
+
+
+class BuildSummary(_SummaryMapping):
+    """The parts of a build json the alert code looks at.
+
+    properties only keeps the ones revisions_from_build reads.
+    """
+    __slots__ = ('number', 'eta', 'results', 'properties', 'steps')
+
+    def __init__(self, number, eta, results, properties, steps):
+        self.number = number
+        self.eta = eta
+        self.results = results
+        self.properties = properties
+        self.steps = steps
+
+    @classmethod
+    def from_build(cls, build):
+        properties = [prop_tuple[:2] for prop_tuple in build.get('properties', [])
+            if prop_tuple[0] in SUMMARY_PROPERTIES]
+        steps = map(StepSummary.from_step, build.get('steps', []))
+        return cls(build['number'], build.get('eta'), build.get('results'), properties, steps)
+
+    def to_json(self):
+        return {
+            'number': self.number,
+            'eta': self.eta,
+            'results': self.results,
+            'properties': self.properties,
+            'steps': [step.to_json() for step in self.steps],
+        }
+
+    @classmethod
+    def from_json(cls, summary_json):
+        steps = [StepSummary(*step_json) for step_json in summary_json['steps']]
+        return cls(summary_json['number'], summary_json['eta'], summary_json['results'],
+            summary_json['properties'], steps)
+
+
+# Error placeholders ({'error': status}) don't get a summary.
+def cache_items_for_build(cache_key, build):
+    items = [(cache_key, build)]
+    if 'number' in build:
+        items.append((summary_key_for_build_key(cache_key), BuildSummary.from_build(build).to_json()))
+    return items
+
+
 def fetch_master_json(master_url):
     master_name = master_name_from_url(master_url)
     url = '%s/get_master/%s' % (CBE_BASE, master_name)
-    return requests.get(url).json()
+    return http_get(url).json()
 
 
 def prefill_builds_cache(cache, master_url, builder_name):
     master_name = master_name_from_url(master_url)
     builds_url = '%s/get_builds' % CBE_BASE
     params = { 'master': master_name, 'builder': builder_name }
-    response = requests.get(builds_url, params=params)
+    response = http_get(builds_url, params=params)
     builds = response.json()['builds']
+    items = []
     for build in builds:
         if not build.get('number'):
             index = builds.index(build)
@@ -90,7 +350,8 @@ def prefill_builds_cache(cache, master_url, builder_name):
             continue
         build_number = build['number']
         key = cache_key_for_build(master_url, builder_name, build_number)
-        cache.set(key, build)
+        items.extend(cache_items_for_build(key, build))
+    cache.set_many(items)
     build_numbers = map(operator.itemgetter('number'), builds)
     log.debug('Prefilled (%.1fs) %s for %s %s' %
         (response.elapsed.total_seconds(),
@@ -100,7 +361,7 @@ def prefill_builds_cache(cache, master_url, builder_name):
 
 
 def fetch_and_cache_build(cache, url, cache_key, cache_errors=False):
-  response = requests.get(url)
+  response = http_get(url)
   if response.status_code != 200:
     log.error('Failed (%.1fs, %s) %s' % (response.elapsed.total_seconds(),
         response.status_code, response.url))
@@ -115,23 +376,29 @@ def fetch_and_cache_build(cache, url, cache_key, cache_errors=False):
     return None
 
   log.debug('Fetched (%.1fs) %s' % (response.elapsed.total_seconds(), url))
-  cache.set(cache_key, build)
+  cache.set_many(cache_items_for_build(cache_key, build))
   return build
 
 
+def is_expired(cache, cache_key, build):
+  # We will cache in-progress builds, but only for 2 minutes.
+  if not build.get('eta'):
+    return False
+  cache_age = datetime.datetime.now() - cache.key_age(cache_key)
+  # Round for display.
+  cache_age = datetime.timedelta(seconds=round(cache_age.total_seconds()))
+  if cache_age.total_seconds() < 120:
+    return False
+  log.debug('Expired (%s) %s' % (cache_age, cache_key))
+  return True
+
+
 def fetch_build_json(cache, master_url, builder_name, build_number):
   cache_key = cache_key_for_build(master_url, builder_name, build_number)
   build = cache.get(cache_key)
   master_name = master_name_from_url(master_url)
 
-  # We will cache in-progress builds, but only for 2 minutes.
-  if build and build.get('eta'):
-    cache_age = datetime.datetime.now() - cache.key_age(cache_key)
-    # Round for display.
-    cache_age = datetime.timedelta(seconds=round(cache_age.total_seconds()))
-    if cache_age.total_seconds() < 120:
-      return build
-    log.debug('Expired (%s) %s %s %s' % (cache_age, master_name, builder_name, build_number))
+  if build and is_expired(cache, cache_key, build):
     build = None
 
   if build and build.get('error'):
@@ -151,24 +418,45 @@ def fetch_build_json(cache, master_url, builder_name, build_number):
   return build
 
 
+def fetch_build_summary(cache, master_url, builder_name, build_number):
+  summary_key = summary_key_for_build_key(cache_key_for_build(master_url, builder_name, build_number))
+  summary_json = cache.get(summary_key)
+  if summary_json and not is_expired(cache, summary_key, summary_json):
+    return BuildSummary.from_json(summary_json)
+
+  build = fetch_build_json(cache, master_url, builder_name, build_number)
+  if not build:
+    return None
+  # Fetching will have written the summary, but builds cached before
+  # summaries existed need one written here.
+  summary = BuildSummary.from_build(build)
+  if not summary_json:
+    cache.set(summary_key, summary.to_json())
+  return summary
+
+
 def property_from_build(build_json, property_name):
   for prop_tuple in build_json['properties']:
     if prop_tuple[0] == property_name:
       return prop_tuple[1]
 
 
+REVISION_VARIABLES = [
+  ('chromium', 'got_revision'),
+  ('blink', 'got_webkit_revision'),
+  ('v8', 'got_v8_revision'),
+  ('nacl', 'got_nacl_revision'),
+  # Skia, for whatever reason, isn't exposed in the buildbot properties so
+  # don't bother to include it here.
+]
+
+SUMMARY_PROPERTIES = set([name for _, name in REVISION_VARIABLES] +
+  ['parent_' + name for _, name in REVISION_VARIABLES])
+
+
 # This effectively extracts the 'configuration' of the build
 # we could extend this beyond repo versions in the future.
 def revisions_from_build(build_json):
-  REVISION_VARIABLES = [
-    ('chromium', 'got_revision'),
-    ('blink', 'got_webkit_revision'),
-    ('v8', 'got_v8_revision'),
-    ('nacl', 'got_nacl_revision'),
-    # Skia, for whatever reason, isn't exposed in the buildbot properties so
-    # don't bother to include it here.
-  ]
-
   revisions = {}
   for repo_name, buildbot_property in REVISION_VARIABLES:
     # This is epicly stupid:  'tester' builders have the wrong
@@ -184,15 +472,19 @@ def revisions_from_build(build_json):
   return revisions
 
 
+def last_finished_build_id(builder_json):
+  # recent_builds can include current builds
+  recent_builds = set(builder_json['cachedBuilds'])
+  active_builds = set(builder_json['currentBuilds'])
+  return sorted(recent_builds - active_builds, reverse=True)[0]
+
+
 def latest_revisions_for_master(cache, master_url, master_json):
   latest_revisions = collections.defaultdict(dict)
   master_name = master_name_from_url(master_url)
   for builder_name, builder_json in master_json['builders'].items():
-    # recent_builds can include current builds
-    recent_builds = set(builder_json['cachedBuilds'])
-    active_builds = set(builder_json['currentBuilds'])
-    last_finished_id = sorted(recent_builds - active_builds, reverse=True)[0]
-    last_build = fetch_build_json(cache, master_url, builder_name, last_finished_id)
+    last_finished_id = last_finished_build_id(builder_json)
+    last_build = fetch_build_summary(cache, master_url, builder_name, last_finished_id)
     latest_revisions[master_name][builder_name] = revisions_from_build(last_build)
   return latest_revisions
 
@@ -200,9 +492,11 @@ def latest_revisions_for_master(cache, master_url, master_json):
 def warm_build_cache(cache, master_url, builder_name, recent_build_ids, active_builds):
   # Cache active (in-progress) builds:
   actives = filter(lambda build: build['builderName'] == builder_name, active_builds)
+  items = []
   for build in actives:
     key = cache_key_for_build(master_url, builder_name, build['number'])
-    cache.set(key, build)
+    items.extend(cache_items_for_build(key, build))
+  cache.set_many(items)
 
   active_build_ids = [b['number'] for b in active_builds]
   # recent_build_ids includes active ones.
@@ -211,7 +505,9 @@ def warm_build_cache(cache, master_url, builder_name, recent_build_ids, active_b
 
   # We cache in-progress builds, so if the first finished build has a non-None
   # eta, then it's just the cached version from when it was in progress.
-  cached_build = cache.get(cache_key)
+  # The summary is much cheaper to load, builds cached before summaries
+  # existed only have the full json.
+  cached_build = cache.get(summary_key_for_build_key(cache_key)) or cache.get(cache_key)
   if not cached_build or cached_build.get('eta') is not None:
     # reason = 'in progress' if cached_build else 'missing'
     # log.debug('prefill reason: %s %s' % (max(finished_build_ids), reason))
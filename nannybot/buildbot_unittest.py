@@ -0,0 +1,146 @@
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import buildbot
+
+
+class SQLiteBuildCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache = buildbot.SQLiteBuildCache(os.path.join(self.temp_dir, 'builds.sqlite'))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_get_and_set(self):
+        key = buildbot.cache_key_for_build('http://build.chromium.org/p/chromium.win', 'Win Builder', 10)
+        self.assertFalse(self.cache.has(key))
+        self.assertEquals(self.cache.get(key), None)
+        self.cache.set(key, {'number': 10})
+        self.assertTrue(self.cache.has(key))
+        self.assertEquals(self.cache.get(key), {'number': 10})
+        # Build numbers parsed out of urls are strings.
+        self.assertEquals(self.cache.get('chromium.win/Win Builder/10.json'), {'number': 10})
+        self.assertTrue(datetime.datetime.now() - self.cache.key_age(key) < datetime.timedelta(minutes=1))
+
+    def test_set_many(self):
+        self.cache.set_many([
+            ('chromium.win/Win Builder/1.json', {'number': 1}),
+            ('chromium.win/Win Builder/2.json', {'number': 2}),
+            ('chromium.win/Win Builder/1.other.json', {'other': True}),
+        ])
+        self.assertEquals(self.cache.get('chromium.win/Win Builder/1.json'), {'number': 1})
+        self.assertEquals(self.cache.get('chromium.win/Win Builder/2.json'), {'number': 2})
+        self.assertEquals(self.cache.get('chromium.win/Win Builder/1.other.json'), {'other': True})
+        self.cache.set('chromium.win/Win Builder/1.json', {'number': 1, 'eta': None})
+        self.assertEquals(self.cache.get('chromium.win/Win Builder/1.json'), {'number': 1, 'eta': None})
+
+
+class MemoryBuildCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.backing_cache = buildbot.BuildCache(self.temp_dir)
+        # Room for two of the {"number": N} builds these tests use.
+        self.cache = buildbot.MemoryBuildCache(self.backing_cache, max_bytes=30)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_reuses_decoded_json(self):
+        self.backing_cache.set('master/builder/1.json', {'number': 1})
+        build = self.cache.get('master/builder/1.json')
+        self.assertEquals(build, {'number': 1})
+        self.assertTrue(self.cache.get('master/builder/1.json') is build)
+        self.assertEquals((self.cache.hits, self.cache.misses), (1, 1))
+        self.assertEquals(self.cache.get('master/builder/2.json'), None)
+        self.assertEquals(self.cache.misses, 2)
+
+    def test_evicts_least_recently_used(self):
+        self.cache.set('master/builder/1.json', {'number': 1})
+        self.cache.set('master/builder/2.json', {'number': 2})
+        self.cache.get('master/builder/1.json')
+        self.cache.set('master/builder/3.json', {'number': 3})
+        self.assertEquals(self.cache.hits, 1)
+        self.cache.get('master/builder/1.json')
+        self.cache.get('master/builder/3.json')
+        self.assertEquals(self.cache.hits, 3)
+        # 2 was evicted but is still in the backing cache.
+        self.assertEquals(self.cache.get('master/builder/2.json'), {'number': 2})
+        self.assertEquals(self.cache.misses, 1)
+
+    def test_evicts_by_size(self):
+        self.cache.set('master/builder/1.json', {'number': 1})
+        self.cache.set('master/builder/2.json', {'number': 2})
+        self.assertEquals(self.cache.bytes, 26)
+        # Too big to keep at all, and doesn't push anything else out.
+        self.cache.set('master/builder/3.json', {'number': 3, 'text': 'x' * 100})
+        self.cache.get('master/builder/1.json')
+        self.cache.get('master/builder/2.json')
+        self.assertEquals((self.cache.hits, self.cache.misses), (2, 0))
+        # Too big to fit next to either of the others.
+        self.cache.set('master/builder/4.json', {'number': 4, 'x': 1})
+        self.assertEquals(self.cache.bytes, 21)
+        self.cache.get('master/builder/1.json')
+        self.assertEquals(self.cache.misses, 1)
+
+
+class BuildSummaryTest(unittest.TestCase):
+    BUILD = {
+        'number': 12,
+        'eta': None,
+        'results': 2,
+        'text': ['failed', 'browser_tests'],
+        'properties': [
+            ['got_revision', '290000', 'Source'],
+            ['got_v8_revision', '23000', 'Source'],
+            ['slavename', 'vm123-m1', 'BuildSlave'],
+        ],
+        'steps': [
+            {'name': 'compile', 'results': [0, []], 'isFinished': True, 'times': [1, 2], 'urls': {}, 'logs': [['stdio', 'url']]},
+            {'name': 'browser_tests', 'results': [2, ['failed']], 'isFinished': True, 'times': [2, 3], 'urls': {}},
+        ],
+    }
+
+    def test_from_build(self):
+        summary = buildbot.BuildSummary.from_build(self.BUILD)
+        self.assertEquals(summary['number'], 12)
+        self.assertEquals(summary.get('eta'), None)
+        self.assertEquals(summary.get('currentStep', {}), {})
+        self.assertRaises(KeyError, lambda: summary['text'])
+        self.assertEquals([step['name'] for step in summary['steps']], ['compile', 'browser_tests'])
+        self.assertEquals(summary['steps'][1]['results'][0], 2)
+        self.assertEquals(buildbot.revisions_from_build(summary), buildbot.revisions_from_build(self.BUILD))
+        self.assertEquals(buildbot.property_from_build(summary, 'slavename'), None)
+
+    def test_json_round_trip(self):
+        summary_json = buildbot.BuildSummary.from_build(self.BUILD).to_json()
+        summary = buildbot.BuildSummary.from_json(json.loads(json.dumps(summary_json)))
+        self.assertEquals(summary.to_json(), summary_json)
+
+    def test_fetch_build_summary(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            cache = buildbot.BuildCache(temp_dir)
+            master_url = 'http://build.chromium.org/p/chromium.win'
+            cache_key = buildbot.cache_key_for_build(master_url, 'Win Builder', 12)
+            # Cached before summaries existed, so one gets written.
+            cache.set(cache_key, self.BUILD)
+            summary = buildbot.fetch_build_summary(cache, master_url, 'Win Builder', 12)
+            self.assertEquals(summary['number'], 12)
+            self.assertTrue(cache.has(buildbot.summary_key_for_build_key(cache_key)))
+            cache.set(cache_key, {})
+            summary = buildbot.fetch_build_summary(cache, master_url, 'Win Builder', 12)
+            self.assertEquals(summary['steps'][0]['name'], 'compile')
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -82,7 +82,7 @@ def main(args):
     }
 
     for step in failing:
-      reasons = alert_builder.reasons_for_failure(step, build, builder_name, master_url)
+      reasons = alert_builder.reasons_for_failure(step, build, builder_name, master_url, cache)
       # Hack to make alert creation simpler:
       if not reasons:
         reasons = [None]
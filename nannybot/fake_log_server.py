@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+# Serves stdio logs from a directory, with the same urls as buildbot
+# (<master_url>/builders/<builder>/builds/<number>/steps/<step>/logs/stdio/text
+# is just a path under the directory), and supports Range requests.
+# Used by log_tail_unittest.py, or run it to point reasons.py at local logs.
+
+import argparse
+import BaseHTTPServer
+import os
+import re
+import sys
+import threading
+import urllib
+
+
+RANGE_REGEXP = re.compile(r'bytes=(?P<start>\d*)-(?P<end>\d*)$')
+
+
+class LogRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+  def log_message(self, format, *args):
+    pass
+
+  def do_GET(self):
+    path = os.path.join(self.server.root_path, urllib.unquote(self.path.lstrip('/')))
+    if not os.path.isfile(path):
+      self.send_error(404)
+      return
+    with open(path, 'rb') as log_file:
+      contents = log_file.read()
+
+    self.server.requests.append((self.path, self.headers.get('Range')))
+    range_match = RANGE_REGEXP.match(self.headers.get('Range', ''))
+    if not self.server.supports_ranges or not range_match:
+      self.send_contents(200, contents)
+      return
+
+    start, end = range_match.group('start'), range_match.group('end')
+    if not start:
+      # Suffix range: the last <end> bytes.
+      start = max(0, len(contents) - int(end))
+      end = len(contents) - 1
+    else:
+      start = int(start)
+      end = min(int(end), len(contents) - 1) if end else len(contents) - 1
+    if start >= len(contents):
+      self.send_error(416)
+      return
+    self.send_contents(206, contents[start:end + 1],
+      {'Content-Range': 'bytes %s-%s/%s' % (start, end, len(contents))})
+
+  def send_contents(self, status, contents, headers={}):
+    self.send_response(status)
+    self.send_header('Content-Type', 'text/plain')
+    self.send_header('Content-Length', str(len(contents)))
+    for name, value in headers.items():
+      self.send_header(name, value)
+    self.end_headers()
+    self.wfile.write(contents)
+
+
+class LogServer(BaseHTTPServer.HTTPServer):
+  def __init__(self, root_path, port=0, supports_ranges=True):
+    BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', port), LogRequestHandler)
+    self.root_path = root_path
+    self.supports_ranges = supports_ranges
+    # (path, Range header) for each request served, for tests.
+    self.requests = []
+
+  @property
+  def url(self):
+    return 'http://127.0.0.1:%s' % self.server_address[1]
+
+  def start(self):
+    thread = threading.Thread(target=self.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+  def stop(self):
+    self.shutdown()
+    self.server_close()
+
+
+def main(args):
+  parser = argparse.ArgumentParser()
+  parser.add_argument('root_path', action='store')
+  parser.add_argument('--port', default=8090, type=int)
+  parser.add_argument('--no-ranges', action='store_true')
+  args = parser.parse_args(args)
+
+  server = LogServer(args.root_path, args.port, not args.no_ranges)
+  print 'Serving %s on %s' % (args.root_path, server.url)
+  server.serve_forever()
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
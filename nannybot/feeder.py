@@ -4,11 +4,16 @@
 # found in the LICENSE file.
 
 import argparse
+import collections
+import copy
 import datetime
 import json
 import logging
 import os.path
 import sys
+import time
+
+from multiprocessing.pool import ThreadPool
 
 import requests
 import requests_cache
@@ -79,59 +84,193 @@ def fetch_master_urls(gatekeeper, args):
   return master_urls
 
 
-def main(args):
-  parser = argparse.ArgumentParser()
-  parser.add_argument('data_url', action='store', nargs='*')
-  parser.add_argument('--use-cache', action='store_true')
-  parser.add_argument('--master-filter', action='store')
-  args = parser.parse_args(args)
+class AlertCrawler(object):
+  """Crawls masters for alerts, remembering each builder's results.
 
-  if not args.data_url:
-    log.warn("No /data url passed, won't do anything")
+  A builder is only re-crawled when its alert_builder.builder_state
+  changes, so with --daemon a tick costs the master json fetches plus
+  whatever builders actually moved.  Builders whose failure reasons
+  couldn't all be fetched are re-crawled next time too.
 
-  if args.use_cache:
-    requests_cache.install_cache('failure_stats')
-  else:
-    requests_cache.install_cache(backend='memory')
+  A builder which can't be fetched is skipped (and retried next crawl).
+  Other errors are raised, unless keep_going is set, when they're
+  logged and handled the same way.
+  """
+  def __init__(self, cache, pool=None, keep_going=False):
+    self.cache = cache
+    self.pool = pool
+    self.keep_going = keep_going
+    # (master_url, builder_name) -> (state, alerts, latest revisions)
+    self._builders = {}
 
-  gatekeeper = gatekeeper_ng_config.load_gatekeeper_config(CONFIG_PATH)
-  master_urls = fetch_master_urls(gatekeeper, args)
-  start_time = datetime.datetime.now()
+  def _map(self, function, items):
+    return self.pool.map(function, items) if self.pool else map(function, items)
 
-  latest_revisions = {}
+  def _crawl_builder(self, job):
+    """Returns (alerts, revisions, complete), or None if the builder couldn't be crawled."""
+    try:
+      alerts, complete = alert_builder.crawl_builder_job(self.cache, job)
+      # FIXME: This doesn't really belong here. garden-o-matic wants
+      # this data and we happen to have the builder json cached at
+      # this point so it's cheap to compute.
+      last_build = buildbot.fetch_build_summary(self.cache, job['master_url'],
+        job['builder_name'], job['state'][0])
+      return alerts, buildbot.revisions_from_build(last_build), complete
+    except (requests.exceptions.RequestException, ValueError), e:
+      log.error('Failed to crawl %s on %s: %s' % (job['builder_name'], job['master_url'], e))
+      return None
+    except Exception:
+      if not self.keep_going:
+        raise
+      # One odd builder shouldn't stop the daemon posting the rest.
+      log.exception('Failed to crawl %s on %s' % (job['builder_name'], job['master_url']))
+      return None
 
-  cache = buildbot.BuildCache(CACHE_PATH)
+  def _fetch_master_json(self, master_url):
+    """Returns the master's json, or None if it couldn't be fetched."""
+    try:
+      return buildbot.fetch_master_json(master_url)
+    except (requests.exceptions.RequestException, ValueError), e:
+      log.error('Failed to fetch %s: %s' % (master_url, e))
+      return None
 
-  alerts = []
-  for master_url in master_urls:
-    master_json = buildbot.fetch_master_json(master_url)
-    master_alerts = alert_builder.alerts_for_master(cache, master_url, master_json)
-    alerts.extend(master_alerts)
+  def crawl(self, master_urls):
+    """Returns alerts, latest_revisions and how many builders were crawled."""
+    master_jsons = self._map(self._fetch_master_json, master_urls)
 
-    # FIXME: This doesn't really belong here. garden-o-matic wants
-    # this data and we happen to have the builder json cached at
-    # this point so it's cheap to compute.
-    revisions = buildbot.latest_revisions_for_master(cache, master_url, master_json)
-    latest_revisions.update(revisions)
+    # Flatten every builder of every master into one list of jobs, in the
+    # same order the serial crawl walks them, so the alerts come out the same.
+    jobs = []
+    # Masters we couldn't fetch or make sense of keep their last results.
+    failed_master_urls = set()
+    for master_url, master_json in zip(master_urls, master_jsons):
+      if master_json is None:
+        failed_master_urls.add(master_url)
+        continue
+      try:
+        jobs.extend(alert_builder.builder_jobs_for_master(master_url, master_json))
+      except Exception:
+        log.exception('Failed to read builders from %s' % master_url)
+        failed_master_urls.add(master_url)
 
+    job_key = lambda job: (job['master_url'], job['builder_name'])
+    changed_jobs = [job for job in jobs
+      if self._builders.get(job_key(job), (None,))[0] != job['state']]
+    results = self._map(self._crawl_builder, changed_jobs)
+    for job, result in zip(changed_jobs, results):
+      # A failed builder keeps its old state, so it's crawled again next time.
+      if result:
+        alerts, revisions, complete = result
+        # Missing reasons (e.g. a log which didn't download) are looked
+        # for again next time, by not remembering the state they go with.
+        state = job['state'] if complete else None
+        self._builders[job_key(job)] = (state, alerts, revisions)
 
-  print "Fetch took: %s" % (datetime.datetime.now() - start_time)
+    # Forget builders which are no longer on any master.
+    current_keys = map(job_key, jobs)
+    stale_keys = sorted(key for key in self._builders if key[0] in failed_master_urls)
+    for key in set(self._builders.keys()) - set(current_keys) - set(stale_keys):
+      del self._builders[key]
+
+    alerts = []
+    latest_revisions = collections.defaultdict(dict)
+    for key in current_keys + stale_keys:
+      # Builders which have never been crawled successfully have nothing to say.
+      if key not in self._builders:
+        continue
+      master_url, builder_name = key
+      _, builder_alerts, revisions = self._builders[key]
+      # The caller adds to the alerts, which mustn't leak into the next crawl.
+      alerts.extend(copy.deepcopy(builder_alerts))
+      master_name = buildbot.master_name_from_url(master_url)
+      latest_revisions[master_name][builder_name] = revisions
+    return alerts, latest_revisions, len(changed_jobs)
+
+
+def crawl_and_post(crawler, master_urls, gatekeeper, data_urls):
+  start_time = datetime.datetime.now()
+  alerts, latest_revisions, crawled_count = crawler.crawl(master_urls)
+  print "Fetch took: %s (%s builders changed, build cache: %s)" % (
+    datetime.datetime.now() - start_time, crawled_count, crawler.cache.stats())
 
   alerts = apply_gatekeeper_rules(alerts, gatekeeper)
 
   alerts = analysis.assign_keys(alerts)
   reason_groups = analysis.group_by_reason(alerts)
   range_groups = analysis.merge_by_range(reason_groups)
+  overlap_clusters = analysis.cluster_by_overlap(reason_groups)
   data = { 'content': json.dumps({
       'alerts': alerts,
       'reason_groups': reason_groups,
       'range_groups': range_groups,
+      'overlap_clusters': overlap_clusters,
       'latest_revisions': latest_revisions,
   })}
-  for url in args.data_url:
+  for url in data_urls:
     log.info('POST %s alerts to %s' % (len(alerts), url))
     requests.post(url, data=data)
 
 
+def main(args):
+  parser = argparse.ArgumentParser()
+  parser.add_argument('data_url', action='store', nargs='*')
+  parser.add_argument('--use-cache', action='store_true')
+  parser.add_argument('--master-filter', action='store')
+  parser.add_argument('--jobs', '-j', default=1, type=int,
+      help='Number of builders to crawl in parallel.')
+  parser.add_argument('--daemon', action='store_true',
+      help='Keep running, only re-crawling builders which changed.')
+  parser.add_argument('--interval', default=30, type=float,
+      help='Seconds to wait between crawls with --daemon.')
+  parser.add_argument('--build-cache', default=CACHE_PATH,
+      help='Directory of cached build json, or a .sqlite file to keep them in.')
+  parser.add_argument('--memory-cache-mb', default=64, type=int,
+      help='Megabytes of build json to keep decoded in memory.')
+  args = parser.parse_args(args)
+
+  if args.daemon and args.use_cache:
+    # --use-cache would replay the same master json every tick.
+    parser.error('--use-cache can not be used with --daemon')
+
+  if not args.data_url:
+    log.warn("No /data url passed, won't do anything")
+
+  if args.use_cache:
+    requests_cache.install_cache('failure_stats')
+  else:
+    requests_cache.install_cache(backend='memory')
+
+  gatekeeper = gatekeeper_ng_config.load_gatekeeper_config(CONFIG_PATH)
+  master_urls = fetch_master_urls(gatekeeper, args)
+
+  cache = buildbot.MemoryBuildCache(buildbot.open_build_cache(args.build_cache),
+    args.memory_cache_mb * 1024 * 1024)
+  pool = ThreadPool(args.jobs) if args.jobs > 1 else None
+  crawler = AlertCrawler(cache, pool, keep_going=args.daemon)
+  try:
+    if not args.daemon:
+      crawl_and_post(crawler, master_urls, gatekeeper, args.data_url)
+      return
+
+    while True:
+      start_time = time.time()
+      # Responses are only cached in memory for the length of one crawl,
+      # master json has to be fresh each time and builds live in the BuildCache.
+      requests_cache.clear()
+      try:
+        crawl_and_post(crawler, master_urls, gatekeeper, args.data_url)
+      except requests.exceptions.RequestException, e:
+        log.error('Crawl failed, will retry: %s' % e)
+      except Exception:
+        # Anything else (odd json from a master, a bug) is logged and the
+        # next tick tries again, rather than stopping the daemon.
+        log.exception('Crawl failed, will retry')
+      time.sleep(max(0, args.interval - (time.time() - start_time)))
+  finally:
+    if pool:
+      pool.close()
+      pool.join()
+
+
 if __name__ == '__main__':
   sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,163 @@
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import json
+import random
+import requests
+import time
+import unittest
+import alert_builder
+import buildbot
+import feeder
+
+from multiprocessing.pool import ThreadPool
+
+
+LINUX_URL = 'https://build.chromium.org/p/chromium.linux'
+WIN_URL = 'https://build.chromium.org/p/chromium.win'
+
+
+def builder_json(last_build):
+    return {'cachedBuilds': range(last_build - 4, last_build + 1), 'currentBuilds': []}
+
+
+class AlertCrawlerTest(unittest.TestCase):
+    def setUp(self):
+        # master_url -> master json, or None when fetching it fails.
+        self.master_jsons = {
+            LINUX_URL: {'slaves': {}, 'builders': {
+                'Linux Builder': builder_json(100),
+                'Linux Tests': builder_json(200),
+            }},
+            WIN_URL: {'slaves': {}, 'builders': {
+                'Win Builder': builder_json(300),
+            }},
+        }
+        # Builder names whose reasons can't all be fetched.
+        self.incomplete = set()
+        # Seconds each builder takes to crawl.
+        self.delays = {}
+        self.crawled = []
+
+        self.original_fetch_master_json = buildbot.fetch_master_json
+        self.original_fetch_build_summary = buildbot.fetch_build_summary
+        self.original_crawl_builder_job = alert_builder.crawl_builder_job
+        buildbot.fetch_master_json = self.fetch_master_json
+        buildbot.fetch_build_summary = self.fetch_build_summary
+        alert_builder.crawl_builder_job = self.crawl_builder_job
+
+    def tearDown(self):
+        buildbot.fetch_master_json = self.original_fetch_master_json
+        buildbot.fetch_build_summary = self.original_fetch_build_summary
+        alert_builder.crawl_builder_job = self.original_crawl_builder_job
+
+    def fetch_master_json(self, master_url):
+        master_json = self.master_jsons[master_url]
+        if master_json is None:
+            raise requests.exceptions.ConnectionError('%s is down' % master_url)
+        return master_json
+
+    def fetch_build_summary(self, cache, master_url, builder_name, build_number):
+        return {'properties': [['got_revision', str(build_number), 'Source']]}
+
+    def crawl_builder_job(self, cache, job):
+        time.sleep(self.delays.get(job['builder_name'], 0))
+        self.crawled.append(job['builder_name'])
+        alerts = [{
+            'master_url': job['master_url'],
+            'builder_name': job['builder_name'],
+            'last_failing_build': job['state'][0],
+            'step_name': 'compile',
+        }]
+        return alerts, job['builder_name'] not in self.incomplete
+
+    def crawl(self, crawler):
+        self.crawled = []
+        alerts, latest_revisions, crawled_count = crawler.crawl([LINUX_URL, WIN_URL])
+        self.assertEquals(crawled_count, len(self.crawled))
+        return alerts, latest_revisions
+
+    def alerted_builders(self, alerts):
+        return sorted((alert['builder_name'], alert['last_failing_build']) for alert in alerts)
+
+    def test_unchanged_builders_are_not_crawled(self):
+        crawler = feeder.AlertCrawler(cache=None)
+        alerts, latest_revisions = self.crawl(crawler)
+        self.assertEquals(sorted(self.crawled), ['Linux Builder', 'Linux Tests', 'Win Builder'])
+        self.assertEquals(latest_revisions['chromium.linux']['Linux Tests'], buildbot.revisions_from_build(
+            self.fetch_build_summary(None, LINUX_URL, 'Linux Tests', 200)))
+
+        self.assertEquals(self.crawl(crawler), (alerts, latest_revisions))
+        self.assertEquals(self.crawled, [])
+
+        self.master_jsons[LINUX_URL]['builders']['Linux Tests'] = builder_json(201)
+        alerts, _ = self.crawl(crawler)
+        self.assertEquals(self.crawled, ['Linux Tests'])
+        self.assertEquals(self.alerted_builders(alerts),
+            [('Linux Builder', 100), ('Linux Tests', 201), ('Win Builder', 300)])
+
+    def test_incomplete_builders_are_crawled_again(self):
+        crawler = feeder.AlertCrawler(cache=None)
+        self.incomplete.add('Win Builder')
+        alerts, _ = self.crawl(crawler)
+        self.assertEquals(len(self.crawled), 3)
+        # Its alerts are still posted meanwhile.
+        self.assertEquals(self.crawl(crawler)[0], alerts)
+        self.assertEquals(self.crawled, ['Win Builder'])
+
+        self.incomplete.clear()
+        self.crawl(crawler)
+        self.assertEquals(self.crawled, ['Win Builder'])
+        self.crawl(crawler)
+        self.assertEquals(self.crawled, [])
+
+    def test_failed_master_keeps_alerts(self):
+        crawler = feeder.AlertCrawler(cache=None)
+        alerts, latest_revisions = self.crawl(crawler)
+
+        self.master_jsons[WIN_URL] = None
+        self.assertEquals(self.crawl(crawler), (alerts, latest_revisions))
+        self.assertEquals(self.crawled, [])
+        self.assertTrue(('Win Builder', 300) in self.alerted_builders(alerts))
+
+    def test_removed_builder_is_forgotten(self):
+        crawler = feeder.AlertCrawler(cache=None)
+        self.crawl(crawler)
+
+        del self.master_jsons[LINUX_URL]['builders']['Linux Builder']
+        alerts, latest_revisions = self.crawl(crawler)
+        self.assertEquals(self.alerted_builders(alerts), [('Linux Tests', 200), ('Win Builder', 300)])
+        self.assertEquals(latest_revisions['chromium.linux'].keys(), ['Linux Tests'])
+        self.assertFalse((LINUX_URL, 'Linux Builder') in crawler._builders)
+
+        # Coming back, it's a new builder to crawl.
+        self.master_jsons[LINUX_URL]['builders']['Linux Builder'] = builder_json(100)
+        self.crawl(crawler)
+        self.assertEquals(self.crawled, ['Linux Builder'])
+
+    def test_pool_matches_serial(self):
+        rand = random.Random(4)
+        for master_url in [LINUX_URL, WIN_URL]:
+            builders = self.master_jsons[master_url]['builders']
+            for index in range(20):
+                builder_name = '%s Tests (%d)' % (buildbot.master_name_from_url(master_url), index)
+                builders[builder_name] = builder_json(rand.randint(10, 1000))
+                # Builders finish out of order on the pool.
+                self.delays[builder_name] = rand.random() * 0.01
+
+        serial = self.crawl(feeder.AlertCrawler(cache=None))
+        pool = ThreadPool(4)
+        try:
+            parallel = self.crawl(feeder.AlertCrawler(cache=None, pool=pool))
+        finally:
+            pool.close()
+            pool.join()
+        self.assertEquals(len(serial[0]), 43)
+        self.assertEquals(parallel, serial)
+        # What gets posted, in the same order too.
+        self.assertEquals(json.dumps(parallel), json.dumps(serial))
+
+
+if __name__ == '__main__':
+    unittest.main()
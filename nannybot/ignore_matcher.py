@@ -0,0 +1,115 @@
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+# Matches alerts against all the ignore rules at once.  A rule is a
+# 'key=value' pattern which matches alerts whose key field contains value,
+# so the rules for each key are compiled into one Aho-Corasick automaton
+# and each alert field is read once however many rules there are.
+
+import collections
+
+
+# IgnoreMatchers live across requests, and field values change with the alerts.
+MAX_FIELD_MATCHES = 20000
+
+
+def parse_pattern(pattern):
+    """Returns (key, value) for a 'key=value' pattern, or None if it can't match."""
+    pieces = pattern.split('=')
+    if len(pieces) != 2:
+        return None
+    key, value = pieces
+    if not key or not value:
+        return None
+    return key, value
+
+
+class AhoCorasick(object):
+    """Finds which of several strings occur in a text in one pass over it."""
+    def __init__(self, needles):
+        self.transitions = [{}]
+        self.fallbacks = [0]
+        # Indexes into needles of the needles ending at each state.
+        self.outputs = [[]]
+        for index, needle in enumerate(needles):
+            state = 0
+            for char in needle:
+                if char not in self.transitions[state]:
+                    self.transitions.append({})
+                    self.fallbacks.append(0)
+                    self.outputs.append([])
+                    self.transitions[state][char] = len(self.transitions) - 1
+                state = self.transitions[state][char]
+            self.outputs[state].append(index)
+
+        # Breadth first, so a state's fallback is always done before it.
+        queue = collections.deque(self.transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.transitions[state].items():
+                fallback = self.fallbacks[state]
+                while fallback and char not in self.transitions[fallback]:
+                    fallback = self.fallbacks[fallback]
+                self.fallbacks[next_state] = self.transitions[fallback].get(char, 0)
+                self.outputs[next_state] = self.outputs[next_state] + self.outputs[self.fallbacks[next_state]]
+                queue.append(next_state)
+
+    def search(self, text):
+        """Returns the set of indexes of the needles found in text."""
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in self.transitions[state]:
+                state = self.fallbacks[state]
+            state = self.transitions[state].get(char, 0)
+            found.update(self.outputs[state])
+        return found
+
+
+class IgnoreMatcher(object):
+    """All of a list of ignore rules, compiled.
+
+    rules is a list of (rule_id, pattern).  Matches the same alerts as
+    checking each pattern with parse_pattern and 'value in alert[key]'.
+    """
+    def __init__(self, rules):
+        by_key = collections.defaultdict(list)
+        for order, (rule_id, pattern) in enumerate(rules):
+            parsed = parse_pattern(pattern)
+            if parsed:
+                key, value = parsed
+                by_key[key].append((order, rule_id, value))
+        # key -> (automaton, [(order, rule_id, value)])
+        self.matchers = {}
+        for key, key_rules in by_key.items():
+            automaton = AhoCorasick([value for _, _, value in key_rules])
+            self.matchers[key] = (automaton, key_rules)
+        # Alerts share a lot of field values (master urls, step names), so
+        # remember what each (key, value) matched.
+        self.field_matches = {}
+
+    def matching_ids(self, alert):
+        """The ids of the rules matching alert, in the order they were given."""
+        matches = []
+        for key, (automaton, key_rules) in self.matchers.items():
+            field = alert.get(key, '')
+            if isinstance(field, basestring):
+                field_matches = self.field_matches.get((key, field))
+                if field_matches is None:
+                    field_matches = [key_rules[index] for index in automaton.search(field)]
+                    # Requests on other threads share this, so start a new
+                    # dict rather than emptying one they may be reading.
+                    if len(self.field_matches) >= MAX_FIELD_MATCHES:
+                        self.field_matches = {}
+                    self.field_matches[(key, field)] = field_matches
+                matches.extend(field_matches)
+                continue
+            # Lists and the like still get 'in', which isn't a substring test.
+            for rule in key_rules:
+                try:
+                    if rule[2] in field:
+                        matches.append(rule)
+                except TypeError:
+                    pass
+        return [rule_id for _, rule_id, _ in sorted(matches)]
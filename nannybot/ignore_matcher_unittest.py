@@ -0,0 +1,41 @@
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import unittest
+import ignore_matcher
+
+
+class IgnoreMatcherTest(unittest.TestCase):
+    def test_parse_pattern(self):
+        self.assertEquals(ignore_matcher.parse_pattern('builder_name=Linux'), ('builder_name', 'Linux'))
+        self.assertEquals(ignore_matcher.parse_pattern('builder_name'), None)
+        self.assertEquals(ignore_matcher.parse_pattern('a=b=c'), None)
+        self.assertEquals(ignore_matcher.parse_pattern('=Linux'), None)
+        self.assertEquals(ignore_matcher.parse_pattern('builder_name='), None)
+
+    def test_aho_corasick(self):
+        automaton = ignore_matcher.AhoCorasick(['he', 'she', 'his', 'hers', 'x'])
+        self.assertEquals(automaton.search('ushers'), set([0, 1, 3]))
+        self.assertEquals(automaton.search('this'), set([2]))
+        self.assertEquals(automaton.search(''), set())
+        self.assertEquals(ignore_matcher.AhoCorasick([]).search('anything'), set())
+
+    def test_matching_ids(self):
+        matcher = ignore_matcher.IgnoreMatcher([
+            (10, 'builder_name=Linux'),
+            (11, 'step_name=tests'),
+            (12, 'builder_name=Linux Tests'),
+            (13, 'bogus'),
+            (14, 'reason=Foo.Bar'),
+        ])
+        alert = {'builder_name': 'Linux Tests (dbg)', 'step_name': 'browser_tests', 'reason': None}
+        self.assertEquals(matcher.matching_ids(alert), [10, 11, 12])
+        self.assertEquals(matcher.matching_ids({'builder_name': 'Mac'}), [])
+        # Non-string fields get 'in' as before, and don't blow up on None.
+        self.assertEquals(matcher.matching_ids({'reason': ['Foo.Bar']}), [14])
+        self.assertEquals(ignore_matcher.IgnoreMatcher([]).matching_ids(alert), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
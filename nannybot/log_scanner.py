@@ -0,0 +1,102 @@
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+# Prefilters a log for the lines a line matcher wants.
+#
+# A matcher lists the lines it wants as (literal, regexp) pairs, where
+# literal is a plain string any line matching regexp must contain.  The
+# log is read in large chunks and only lines containing one of the
+# literals (found with str.find, which is much faster than any regexp)
+# are checked against the regexps, so the many uninteresting lines in a
+# log never reach python code.
+#
+# Each step is split by one splitter, so a log is scanned for one matcher.
+
+import re
+
+
+NAMED_GROUP_REGEXP = re.compile(r'\(\?P<\w+>')
+
+class LineMatcher(object):
+  """Base for things fed lines by scan_log.
+
+  Subclasses set PATTERNS, override consume() and result(), and set
+  self.done once they've seen all the lines they need.
+  """
+  PATTERNS = []
+
+  def __init__(self):
+    self.done = False
+
+  def consume(self, line_number, line):
+    pass
+
+  def result(self):
+    return None
+
+
+class LogScanner(object):
+  """Finds the lines of a log matching any of a list of (literal, regexp).
+
+  Like re.search on each line: ^ and $ match at the start and end of
+  lines, and patterns shouldn't match across newlines.
+  """
+  def __init__(self, patterns):
+    self.literals = sorted(set(literal for literal, _ in patterns))
+    # Patterns may use the same group names, and only whether a line
+    # matches matters here.
+    patterns = [NAMED_GROUP_REGEXP.sub('(?:', pattern) for _, pattern in patterns]
+    self.regexp = re.compile('|'.join('(?:%s)' % pattern for pattern in patterns), re.MULTILINE)
+
+  def _lines(self, text, line_number):
+    """Yields (line_number, line) for the matching lines in text."""
+    position = 0
+    next_hits = dict((literal, text.find(literal)) for literal in self.literals)
+    while True:
+      hits = [hit for hit in next_hits.values() if hit >= 0]
+      if not hits:
+        return
+      hit = min(hits)
+      line_start = text.rfind('\n', 0, hit) + 1
+      line_end = text.find('\n', hit)
+      if line_end < 0:
+        line_end = len(text)
+      if self.regexp.search(text, line_start, line_end):
+        line_number += text.count('\n', position, line_start)
+        position = line_start
+        yield line_number, text[line_start:line_end]
+      # Each line is only looked at once, however many literals it has.
+      for literal, literal_hit in next_hits.items():
+        if 0 <= literal_hit <= line_end:
+          next_hits[literal] = text.find(literal, line_end + 1)
+
+  def scan(self, chunks):
+    """Yields (line_number, line) for each matching line of the log in chunks."""
+    pending = ''
+    line_number = 0
+    for chunk in chunks:
+      pending += chunk
+      # The last, partial line waits for the next chunk.
+      end = pending.rfind('\n') + 1
+      if not end:
+        continue
+      for matching_line in self._lines(pending[:end], line_number):
+        yield matching_line
+      line_number += pending.count('\n', 0, end)
+      pending = pending[end:]
+    if pending:
+      for matching_line in self._lines(pending, line_number):
+        yield matching_line
+
+
+def scan_log(chunks, matcher):
+  """Feeds matcher the lines it matches from the log in chunks.
+
+  Stops reading once matcher is done.  Returns matcher.result().
+  """
+  for line_number, line in LogScanner(matcher.PATTERNS).scan(chunks):
+    matcher.consume(line_number, line)
+    if matcher.done:
+      break
+  return matcher.result()
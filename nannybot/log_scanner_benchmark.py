@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+# Compares finding JUnit-style failures and compile errors in a synthetic
+# gtest log with a python loop per splitter over every line (how reasons.py
+# used to work) against a log_scanner.scan_log pass per splitter.  Only one
+# splitter handles a step, so each log is only ever scanned once.
+
+import argparse
+import random
+import re
+import sys
+import time
+
+import log_scanner
+import reasons
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+def synthetic_gtest_log(size_in_mb, seed=0):
+  randomizer = random.Random(seed)
+  lines = []
+  size = 0
+  test_number = 0
+  while size < size_in_mb * 1024 * 1024:
+    test_name = 'Suite%d.Test%d' % (test_number / 50, test_number)
+    test_number += 1
+    first_line = len(lines)
+    lines.append('[ RUN      ] %s' % test_name)
+    for _ in range(randomizer.randint(0, 8)):
+      lines.append('[%d:%d:0709/112233:INFO:some_file.cc(%d)] Doing something unremarkable with a fairly long line of output'
+        % (randomizer.randint(1000, 9999), randomizer.randint(1000, 9999), randomizer.randint(1, 999)))
+    if randomizer.random() < 0.001:
+      lines.append('[  FAILED  ] %s (%d ms)' % (test_name, randomizer.randint(1, 5000)))
+    else:
+      lines.append('[       OK ] %s (%d ms)' % (test_name, randomizer.randint(1, 5000)))
+    size += sum(len(line) + 1 for line in lines[first_line:])
+  lines.append('FAILED: /b/build/goma/gomacc ../../base/time.cc')
+  lines.append('../../base/time.cc:590:7: error: use of undeclared identifier')
+  return '\n'.join(lines) + '\n'
+
+
+def chunks_of(text):
+  for start in xrange(0, len(text), CHUNK_SIZE):
+    yield text[start:start + CHUNK_SIZE]
+
+
+# What the splitters did before, each over its own pass of the log.
+def per_line_junit(lines):
+  failed_regexp = re.compile('\[\s+FAILED\s+\] (?P<test_name>\S+)( \(.*\))?$')
+  return [match.group('test_name') for match in map(failed_regexp.search, lines) if match]
+
+
+def per_line_compile(lines):
+  compile_regexp = re.compile(r'(?P<path>.*):(?P<line>\d+):(?P<column>\d+): error:')
+  next_line_is_failure = False
+  for line in lines:
+    if not next_line_is_failure:
+      if line.startswith('FAILED: '):
+        next_line_is_failure = True
+      continue
+    match = compile_regexp.match(line)
+    if match:
+      return ['%s:%s' % (match.group('path'), match.group('line'))]
+    break
+  return None
+
+
+def time_it(name, function):
+  start = time.time()
+  result = function()
+  print '%-12s %6.2fs' % (name, time.time() - start)
+  return result
+
+
+def main(args):
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--size', default=200, type=int, help='Log size in MB.')
+  args = parser.parse_args(args)
+
+  text = time_it('generate', lambda: synthetic_gtest_log(args.size))
+  print '%.1fMB, %d lines' % (len(text) / 1024.0 / 1024, text.count('\n'))
+
+  def per_line():
+    # Each splitter used to split the whole log into lines itself.
+    return per_line_junit(text.split('\n')), per_line_compile(text.split('\n'))
+  expected = time_it('per-line', per_line)
+
+  def scanned():
+    return (log_scanner.scan_log(chunks_of(text), reasons.FailedTestLines()),
+        log_scanner.scan_log(chunks_of(text), reasons.CompileFailureLines()))
+  results = time_it('scan_log', scanned)
+  assert results == expected, (results, expected)
+  print '%d failed tests, compile failure: %s' % (len(results[0]), results[1])
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,65 @@
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import unittest
+import log_scanner
+
+
+class ErrorLines(log_scanner.LineMatcher):
+    PATTERNS = [('ERROR', '^ERROR (?P<message>.*)$')]
+
+    def __init__(self, limit=None):
+        super(ErrorLines, self).__init__()
+        self.limit = limit
+        self.lines = []
+
+    def consume(self, line_number, line):
+        self.lines.append((line_number, line))
+        self.done = len(self.lines) == self.limit
+
+    def result(self):
+        return self.lines
+
+
+class WarningLines(ErrorLines):
+    PATTERNS = [('WARN', 'WARN(?P<message>ING)?:'), ('deprecated', 'is deprecated$')]
+
+
+class LogScannerTest(unittest.TestCase):
+    LOG = """starting
+ERROR one
+not an ERROR
+WARNING: two
+x is deprecated
+ERROR three WARN:
+done"""
+
+    def chunked(self, text, size):
+        return [text[start:start + size] for start in range(0, len(text), size)]
+
+    def test_scan(self):
+        scanner = log_scanner.LogScanner([('ERROR', '^ERROR'), ('deprecated', 'deprecated$')])
+        expected = [(1, 'ERROR one'), (4, 'x is deprecated'), (5, 'ERROR three WARN:')]
+        self.assertEquals(list(scanner.scan([self.LOG])), expected)
+        for size in range(1, 12):
+            self.assertEquals(list(scanner.scan(self.chunked(self.LOG, size))), expected)
+
+    def test_scan_log(self):
+        errors = log_scanner.scan_log(self.chunked(self.LOG, 5), ErrorLines())
+        warnings = log_scanner.scan_log(self.chunked(self.LOG, 5), WarningLines())
+        self.assertEquals(errors, [(1, 'ERROR one'), (5, 'ERROR three WARN:')])
+        self.assertEquals(warnings, [(3, 'WARNING: two'), (4, 'x is deprecated'), (5, 'ERROR three WARN:')])
+
+    def test_stops_when_done(self):
+        chunks_read = []
+        def chunks():
+            for chunk in self.chunked(self.LOG, 10):
+                chunks_read.append(chunk)
+                yield chunk
+        self.assertEquals(log_scanner.scan_log(chunks(), ErrorLines(limit=1)), [(1, 'ERROR one')])
+        self.assertEquals(len(chunks_read), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+# Searches the end of a log without reading the rest of it.  Some step
+# results (the runtest.py exit code, the gtest summary) are only printed
+# at the end of logs which can be hundreds of megabytes.
+
+import os
+import re
+import requests
+
+import buildbot
+
+
+INITIAL_TAIL_BYTES = 64 * 1024
+MAX_TAIL_BYTES = 16 * 1024 * 1024
+
+CONTENT_RANGE_REGEXP = re.compile(r'bytes (?P<start>\d+)-(?P<end>\d+)/(?P<total>\d+|\*)')
+
+
+class RangesNotSupported(IOError):
+  pass
+
+
+def url_tail_reader(url, session=requests):
+  """Returns read_tail(size) for url, see search_tail."""
+  def read_tail(size):
+    # A range of a gzipped response couldn't be decoded on its own.
+    headers = {'Range': 'bytes=-%d' % size, 'Accept-Encoding': 'identity'}
+    response = buildbot.http_get(url, session=session, headers=headers, stream=True)
+    if response.status_code == 200:
+      # Don't read what could be the whole of a huge log.
+      response.close()
+      raise RangesNotSupported(url)
+    if response.status_code == 416:
+      # Some servers refuse suffix ranges on empty files.
+      response.close()
+      return '', True
+    if response.status_code != 206:
+      response.close()
+      raise IOError('Failed (%s) %s' % (response.status_code, url))
+    match = CONTENT_RANGE_REGEXP.match(response.headers.get('Content-Range', ''))
+    return response.content, bool(match) and int(match.group('start')) == 0
+  return read_tail
+
+
+def file_tail_reader(path):
+  """Returns read_tail(size) for a local file, see search_tail."""
+  def read_tail(size):
+    with open(path, 'rb') as log_file:
+      log_file.seek(0, os.SEEK_END)
+      start = max(0, log_file.tell() - size)
+      log_file.seek(start)
+      return log_file.read(), start == 0
+  return read_tail
+
+
+def tail_lines(tail, complete):
+  lines = tail.decode('utf-8', 'replace').split('\n')
+  # Unless we have the whole log the first line is probably partial.
+  return lines if complete else lines[1:]
+
+
+def search_tail(read_tail, find, initial_bytes=INITIAL_TAIL_BYTES, max_bytes=MAX_TAIL_BYTES):
+  """Calls find(lines) on ever larger tails of a log until it finds something.
+
+  read_tail(size) returns the last size bytes of the log and whether that
+  was the whole log.  Returns find's answer, or None if it found nothing
+  in the whole log or the last max_bytes of it.
+  """
+  size = initial_bytes
+  while True:
+    tail, complete = read_tail(size)
+    result = find(tail_lines(tail, complete))
+    if result is not None or complete or size >= max_bytes:
+      return result
+    size = min(size * 4, max_bytes)
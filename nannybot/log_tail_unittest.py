@@ -0,0 +1,84 @@
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import os
+import shutil
+import tempfile
+import unittest
+import fake_log_server
+import log_tail
+
+
+def find_marker(lines):
+    for line in lines:
+        if line.startswith('MARKER'):
+            return line
+    return None
+
+
+class LogTailTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.log_path = os.path.join(self.temp_dir, 'stdio')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write_log(self, contents):
+        with open(self.log_path, 'wb') as log_file:
+            log_file.write(contents)
+
+    def test_tail_lines(self):
+        self.assertEquals(log_tail.tail_lines('ial\nlast\n', False), ['last', ''])
+        self.assertEquals(log_tail.tail_lines('first\nlast', True), ['first', 'last'])
+
+    def test_file_tail(self):
+        self.write_log('MARKER 1\n' + 'x' * 1000 + '\nMARKER 2\n' + 'y' * 100)
+        read_tail = log_tail.file_tail_reader(self.log_path)
+        self.assertEquals(log_tail.search_tail(read_tail, find_marker, initial_bytes=200), 'MARKER 2')
+        self.assertEquals(read_tail(5), ('y' * 5, False))
+        self.assertEquals(read_tail(5000)[1], True)
+
+    def test_widens_until_found(self):
+        self.write_log('MARKER 1\n' + 'x\n' * 1000)
+        read_sizes = []
+        read_tail = log_tail.file_tail_reader(self.log_path)
+        def recording_read_tail(size):
+            read_sizes.append(size)
+            return read_tail(size)
+        self.assertEquals(log_tail.search_tail(recording_read_tail, find_marker, initial_bytes=100), 'MARKER 1')
+        self.assertEquals(read_sizes, [100, 400, 1600, 6400])
+
+    def test_gives_up(self):
+        self.write_log('MARKER 1\n' + 'x\n' * 1000)
+        read_tail = log_tail.file_tail_reader(self.log_path)
+        self.assertEquals(log_tail.search_tail(read_tail, find_marker, initial_bytes=100, max_bytes=500), None)
+        self.assertEquals(log_tail.search_tail(read_tail, lambda lines: None), None)
+
+    def test_url_tail(self):
+        self.write_log('start\n' + 'x\n' * 10000 + 'MARKER end\ntrailing\n')
+        server = fake_log_server.LogServer(self.temp_dir)
+        server.start()
+        try:
+            read_tail = log_tail.url_tail_reader(server.url + '/stdio')
+            self.assertEquals(log_tail.search_tail(read_tail, find_marker, initial_bytes=100), 'MARKER end')
+            self.assertEquals(server.requests, [('/stdio', 'bytes=-100')])
+            self.assertEquals(read_tail(100000), (open(self.log_path).read(), True))
+            self.assertRaises(IOError, log_tail.url_tail_reader(server.url + '/missing'), 100)
+        finally:
+            server.stop()
+
+    def test_url_without_ranges(self):
+        self.write_log('MARKER\n')
+        server = fake_log_server.LogServer(self.temp_dir, supports_ranges=False)
+        server.start()
+        try:
+            read_tail = log_tail.url_tail_reader(server.url + '/stdio')
+            self.assertRaises(log_tail.RangesNotSupported, log_tail.search_tail, read_tail, find_marker)
+        finally:
+            server.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,12 @@
 import webapp2
+from google.appengine.api import memcache
 from google.appengine.ext import ndb
 import json
 import calendar
 import datetime
+import logging
+
+import ignore_matcher
 
 
 class DateTimeEncoder(json.JSONEncoder):
@@ -29,59 +33,146 @@ class IgnoreRule(ndb.Model):
         return failure_dict
 
     def matches(self, failure_dict):
-        pieces = self.pattern.split('=')
-        if len(pieces) != 2:
-            return False
-        key, value = pieces
-        if not key or not value:
+        parsed = ignore_matcher.parse_pattern(self.pattern)
+        if not parsed:
             return False
+        key, value = parsed
         return value in failure_dict.get(key, '')
 
 
+class IgnoreRuleIndex(ndb.Model):
+    # Queries over IgnoreRule are only eventually consistent, so /data reads
+    # the rules by key from here and could otherwise cache a body rendered
+    # without a rule that was just added.  version names the current rules.
+    rule_ids = ndb.IntegerProperty(repeated=True, indexed=False)
+    version = ndb.IntegerProperty(default=0, indexed=False)
+
+
+IGNORE_RULE_INDEX_KEY = ndb.Key(IgnoreRuleIndex, 'default')
+
+def ignore_rule_index():
+    index = IGNORE_RULE_INDEX_KEY.get()
+    if index:
+        return index
+    # First use, so start with the rules made before there was an index.
+    rule_ids = [key.id() for key in IgnoreRule.query().fetch(keys_only=True)]
+    return IgnoreRuleIndex.get_or_insert(IGNORE_RULE_INDEX_KEY.id(), rule_ids=rule_ids)
+
+
+@ndb.transactional
+def update_ignore_rule_index(added_id=None, removed_id=None):
+    index = IGNORE_RULE_INDEX_KEY.get()
+    if added_id is not None:
+        index.rule_ids.append(added_id)
+    if removed_id in index.rule_ids:
+        index.rule_ids.remove(removed_id)
+    index.version += 1
+    index.put()
+
+
+def fetch_ignore_rules(index):
+    keys = [ndb.Key(IgnoreRule, rule_id) for rule_id in index.rule_ids]
+    return [ignore for ignore in ndb.get_multi(keys) if ignore]
+
+
+# The last rules compiled by this instance, as (rules, matcher).  Requests
+# run on several threads, so this is only ever replaced whole and read once.
+_ignore_matcher_cache = (None, None)
+
+def ignore_matcher_for(ignores):
+    global _ignore_matcher_cache
+    rules = tuple((ignore.key.id(), ignore.pattern) for ignore in ignores)
+    cached_rules, matcher = _ignore_matcher_cache
+    if cached_rules != rules:
+        matcher = ignore_matcher.IgnoreMatcher(rules)
+        _ignore_matcher_cache = (rules, matcher)
+    return matcher
+
+
 class IgnoreHandler(webapp2.RequestHandler):
     def get(self):
-        query = IgnoreRule.query()
-        ignore_dicts = map(IgnoreRule.dict_with_key, query.fetch())
+        ignores = fetch_ignore_rules(ignore_rule_index())
+        ignore_dicts = map(IgnoreRule.dict_with_key, ignores)
         self.response.headers.add_header("Access-Control-Allow-Origin", "*")
         self.response.headers['Content-Type'] = 'application/json'
         self.response.write(json.dumps(ignore_dicts, cls=DateTimeEncoder))
 
     def post(self):
+        global _ignore_matcher_cache
+        # Make sure the index exists before the rules change under it.
+        ignore_rule_index()
         # FIXME: For whatever reason I can't get <form method='delete'> to work.
         if self.request.get('action') == 'delete':
             # FIXME: It's lame that this constructor is type-sensitive.
             key = ndb.Key(IgnoreRule, int(self.request.get('key')))
+            update_ignore_rule_index(removed_id=key.id())
             key.delete()
         else:
             ignore = IgnoreRule()
             ignore.pattern = self.request.get('pattern')
-            ignore.put()
+            key = ignore.put()
+            update_ignore_rule_index(added_id=key.id())
+        # The next /data recompiles the rules and renders a new body.
+        _ignore_matcher_cache = (None, None)
         self.redirect('/')
 
 
+# The last body rendered by this instance, as (etag, body).  Like
+# _ignore_matcher_cache this is only ever replaced whole and read once.
+_rendered_data = (None, None)
+
+def render_data(latest_key, index):
+    response_json = {}
+    if latest_key:
+        entry = latest_key.get()
+        response_json = entry.content
+        ignores = fetch_ignore_rules(index)
+        matcher = ignore_matcher_for(ignores)
+
+        def add_ignores(alert):
+            alert['ignored_by'] = matcher.matching_ids(alert)
+            return alert
+
+        response_json.update({
+            'date': entry.date,
+            # FIXME: We should take an ignores param instead of always applying.
+            'alerts': map(add_ignores, response_json['alerts']),
+            'ignores': map(IgnoreRule.dict_with_key, ignores),
+        })
+    return json.dumps(response_json, cls=DateTimeEncoder, separators=(',', ':'))
+
+
 class DataHandler(webapp2.RequestHandler):
     def get(self):
-        query = AlertBlob.query().order(-AlertBlob.date)
-        entries = query.fetch(1)
-        response_json = {}
-        if entries:
-            response_json = entries[0].content
-            ignores = IgnoreRule.query().fetch()
-
-            def add_ignores(alert):
-                alert['ignored_by'] = [ignore.key.id() for ignore in ignores if ignore.matches(alert)]
-                return alert
-
-            response_json.update({
-                'date': entries[0].date,
-                # FIXME: We should take an ignores param instead of always applying.
-                'alerts': map(add_ignores, response_json['alerts']),
-                'ignores': map(IgnoreRule.dict_with_key, ignores),
-            })
+        global _rendered_data
+        # The body only changes with a new AlertBlob or ignore rule, so
+        # those name it and most polls don't need to render anything.
+        latest_key = AlertBlob.query().order(-AlertBlob.date).get(keys_only=True)
+        index = ignore_rule_index()
+        etag = '%s-%s' % (latest_key.id() if latest_key else 'none', index.version)
 
         self.response.headers.add_header("Access-Control-Allow-Origin", "*")
+        self.response.headers['Cache-Control'] = 'no-cache'
+        self.response.etag = etag
+        if etag in self.request.if_none_match:
+            self.response.status = 304
+            return
+
+        rendered_etag, body = _rendered_data
+        if rendered_etag != etag:
+            memcache_key = 'data:%s' % etag
+            body = memcache.get(memcache_key)
+            if body is None:
+                body = render_data(latest_key, index)
+                try:
+                    memcache.set(memcache_key, body)
+                except ValueError, e:
+                    # Too big for memcache, other instances render their own.
+                    logging.warn('Not caching /data: %s' % e)
+            _rendered_data = (etag, body)
+
         self.response.headers['Content-Type'] = 'application/json'
-        self.response.write(json.dumps(response_json, cls=DateTimeEncoder, indent=1))
+        self.response.write(body)
 
     def post(self):
         alert = AlertBlob()
@@ -0,0 +1,141 @@
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import json
+import unittest
+
+import webapp2
+from google.appengine.datastore import datastore_stub_util
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+
+import main
+
+
+ALERTS = {
+    'alerts': [
+        {'builder_name': 'Linux Tests', 'step_name': 'browser_tests'},
+        {'builder_name': 'Mac Builder', 'step_name': 'compile'},
+    ],
+}
+
+
+class DataHandlerTest(unittest.TestCase):
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        # Queries see every write, so only the index makes rules consistent.
+        policy = datastore_stub_util.PseudoRandomHRConsistencyPolicy(probability=1)
+        self.testbed.init_datastore_v3_stub(consistency_policy=policy)
+        self.testbed.init_memcache_stub()
+        main._rendered_data = (None, None)
+        main._ignore_matcher_cache = (None, None)
+
+        self.render_calls = 0
+        self.real_render_data = main.render_data
+        def counting_render_data(latest_key, index):
+            self.render_calls += 1
+            return self.real_render_data(latest_key, index)
+        main.render_data = counting_render_data
+
+    def tearDown(self):
+        main.render_data = self.real_render_data
+        self.testbed.deactivate()
+
+    def request(self, path, headers=None, POST=None):
+        # Each request on App Engine starts with an empty ndb context cache.
+        ndb.get_context().clear_cache()
+        return webapp2.Request.blank(path, headers=headers, POST=POST).get_response(main.app)
+
+    def post_alerts(self, content=ALERTS):
+        self.assertEquals(self.request('/data', POST={'content': json.dumps(content)}).status_int, 200)
+
+    def add_rule(self, pattern):
+        self.assertEquals(self.request('/ignore', POST={'pattern': pattern}).status_int, 302)
+        return json.loads(self.request('/ignore').body)[-1]['key']
+
+    def delete_rule(self, rule_id):
+        response = self.request('/ignore', POST={'action': 'delete', 'key': str(rule_id)})
+        self.assertEquals(response.status_int, 302)
+
+    def get_data(self):
+        response = self.request('/data')
+        self.assertEquals(response.status_int, 200)
+        return response.etag, json.loads(response.body)
+
+    def test_matching_etag_is_not_modified(self):
+        self.post_alerts()
+        response = self.request('/data')
+        self.assertEquals(response.status_int, 200)
+        self.assertTrue(response.etag)
+
+        response = self.request('/data', headers={'If-None-Match': '"%s"' % response.etag})
+        self.assertEquals(response.status_int, 304)
+        self.assertEquals(response.body, '')
+
+        response = self.request('/data', headers={'If-None-Match': '"stale"'})
+        self.assertEquals(response.status_int, 200)
+        self.assertTrue(response.body)
+
+    def test_repeat_gets_are_not_rendered(self):
+        self.post_alerts()
+        first = self.request('/data').body
+        self.assertEquals(self.render_calls, 1)
+
+        # Served from this instance's last render.
+        self.assertEquals(self.request('/data').body, first)
+        self.assertEquals(self.render_calls, 1)
+
+        # Served from memcache, as for another instance.
+        main._rendered_data = (None, None)
+        self.assertEquals(self.request('/data').body, first)
+        self.assertEquals(self.render_calls, 1)
+
+    def test_ignore_rules_change_etag(self):
+        self.post_alerts()
+        etag, data = self.get_data()
+        self.assertEquals([alert['ignored_by'] for alert in data['alerts']], [[], []])
+        version = main.ignore_rule_index().version
+
+        rule_id = self.add_rule('builder_name=Linux')
+        self.assertEquals(main.ignore_rule_index().version, version + 1)
+        added_etag, data = self.get_data()
+        self.assertNotEquals(added_etag, etag)
+        self.assertEquals([alert['ignored_by'] for alert in data['alerts']], [[rule_id], []])
+        self.assertEquals([ignore['key'] for ignore in data['ignores']], [rule_id])
+
+        self.delete_rule(rule_id)
+        self.assertEquals(main.ignore_rule_index().version, version + 2)
+        deleted_etag, data = self.get_data()
+        self.assertNotEquals(deleted_etag, added_etag)
+        self.assertNotEquals(deleted_etag, etag)
+        self.assertEquals([alert['ignored_by'] for alert in data['alerts']], [[], []])
+        self.assertEquals(data['ignores'], [])
+        self.assertEquals(self.render_calls, 3)
+
+    def test_new_alerts_change_etag(self):
+        self.post_alerts()
+        etag, data = self.get_data()
+        self.assertEquals(len(data['alerts']), 2)
+
+        self.post_alerts({'alerts': ALERTS['alerts'][:1]})
+        new_etag, data = self.get_data()
+        self.assertNotEquals(new_etag, etag)
+        self.assertEquals(len(data['alerts']), 1)
+
+    def test_index_starts_with_existing_rules(self):
+        old_rule_key = main.IgnoreRule(pattern='step_name=compile').put()
+        self.assertEquals(main.IGNORE_RULE_INDEX_KEY.get(), None)
+
+        index = main.ignore_rule_index()
+        self.assertEquals(index.rule_ids, [old_rule_key.id()])
+        self.assertEquals(index.version, 0)
+
+        self.post_alerts()
+        etag, data = self.get_data()
+        self.assertEquals([alert['ignored_by'] for alert in data['alerts']], [[], [old_rule_key.id()]])
+
+
+if __name__ == '__main__':
+    unittest.main()
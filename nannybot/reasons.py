@@ -11,11 +11,19 @@ import urlparse
 import argparse
 import re
 import buildbot
+import log_scanner
+import log_tail
 
 import requests_cache
 
+# stdio logs are streamed rather than held in memory, which requests_cache
+# can't do, so they're fetched with a session made before it's installed.
+stdio_session = buildbot.throttle.mount(requests.Session())
+
 requests_cache.install_cache('reasons')
 
+STDIO_CHUNK_SIZE = 64 * 1024
+
 
 # This is relative to build/scripts:
 # https://chromium.googlesource.com/chromium/tools/build/+/master/scripts
@@ -44,17 +52,119 @@ def build_url(master_url, builder_name, build_number):
   return "%s/builders/%s/builds/%s" % args
 
 
-def stdio_for_step(master_url, builder_name, build, step):
+def stdio_url_for_step(master_url, builder_name, build, step):
 # FIXME: Should get this from the step in some way?
   base_url = build_url(master_url, builder_name, build['number'])
-  stdio_url = "%s/steps/%s/logs/stdio/text" % (base_url, step['name'])
+  return "%s/steps/%s/logs/stdio/text" % (base_url, step['name'])
 
+
+def _read_response(stdio_url, response, read):
+  try:
+    for piece in read(response):
+      yield piece
+  except requests.exceptions.RequestException, e:
+    # A log cut short can't be split, the caller tries again another time.
+    log.error('Failed reading %s: %s' % (stdio_url, e))
+    raise
+  finally:
+    # Splitters stop reading once they have an answer.
+    response.close()
+
+
+def _stream_stdio(master_url, builder_name, build, step, read):
+  stdio_url = stdio_url_for_step(master_url, builder_name, build, step)
   try:
-    return requests.get(stdio_url).text
+    response = buildbot.http_get(stdio_url, session=stdio_session, stream=True)
   except requests.exceptions.ConnectionError, e:
     # Some builders don't save logs for whatever reason.
     log.error('Failed to fetch %s: %s' % (stdio_url, e))
     return None
+  if response.status_code != 200:
+    log.error('Failed (%s) %s' % (response.status_code, stdio_url))
+    response.close()
+    return None
+  return _read_response(stdio_url, response, read)
+
+
+def stdio_lines_for_step(master_url, builder_name, build, step):
+  """Iterates over the lines of a step's stdio as they download.
+
+  Returns None if the log can't be fetched.
+  """
+  read = lambda response: response.iter_lines(chunk_size=STDIO_CHUNK_SIZE, decode_unicode=True)
+  return _stream_stdio(master_url, builder_name, build, step, read)
+
+
+def stdio_chunks_for_step(master_url, builder_name, build, step):
+  """Like stdio_lines_for_step, for log_scanner."""
+  read = lambda response: response.iter_content(chunk_size=STDIO_CHUNK_SIZE, decode_unicode=True)
+  return _stream_stdio(master_url, builder_name, build, step, read)
+
+
+def search_stdio_tail(master_url, builder_name, build, step, find,
+    max_bytes=log_tail.MAX_TAIL_BYTES, stream_without_ranges=True):
+  """find(lines) over the end of a step's stdio, see log_tail.search_tail.
+
+  If the server doesn't do ranges find gets all the lines as they stream,
+  unless stream_without_ranges is False (when the caller has a fallback
+  which reads the whole log anyway).
+  """
+  stdio_url = stdio_url_for_step(master_url, builder_name, build, step)
+  try:
+    return log_tail.search_tail(log_tail.url_tail_reader(stdio_url, stdio_session), find,
+      max_bytes=max_bytes)
+  except log_tail.RangesNotSupported:
+    if not stream_without_ranges:
+      return None
+    stdio_lines = stdio_lines_for_step(master_url, builder_name, build, step)
+    return find(stdio_lines) if stdio_lines is not None else None
+  except IOError, e:
+    # Includes requests' ConnectionError.
+    log.error('Failed to fetch %s: %s' % (stdio_url, e))
+    return None
+
+
+# The summary is a line per failed test, so unlike the runtest.py exit code
+# a missing one (e.g. the test binary crashed) isn't worth looking further
+# back than this for: GTestSplitter reads the whole log next anyway.
+GTEST_SUMMARY_MAX_BYTES = 4 * log_tail.INITIAL_TAIL_BYTES
+
+# The list of failures gtest prints at the very end, e.g.:
+# [==========] 1432 tests from 212 test cases ran. (182563 ms total)
+# [  PASSED  ] 1430 tests.
+# [  FAILED  ] 2 tests, listed below:
+# [  FAILED  ] ExtensionApiTest.TabUpdate, where TypeParam =  and GetParam() =
+# [  FAILED  ] WebViewTest.Shim
+GTEST_SUMMARY_START_REGEXP = re.compile(r'\[==========\] \d+ tests? from \d+ test cases? ran')
+GTEST_SUMMARY_FAILED_REGEXP = re.compile(r'\[  FAILED  \] (?P<test_name>[^\s,]+)')
+GTEST_SUMMARY_COUNT_REGEXP = re.compile(r'\[  FAILED  \] \d+ tests?, listed below')
+
+
+def gtest_summary_failures(lines):
+  """Failed tests from the last gtest summary in lines, None if there isn't one."""
+  failures = None
+  for line in lines:
+    if GTEST_SUMMARY_START_REGEXP.search(line):
+      failures = []
+      continue
+    if failures is None or GTEST_SUMMARY_COUNT_REGEXP.search(line):
+      continue
+    match = GTEST_SUMMARY_FAILED_REGEXP.search(line)
+    if match:
+      failures.append(match.group('test_name'))
+  return failures
+
+
+RUNTEST_EXIT_CODE_PREFIX = 'exit code (as seen by runtest.py):'
+
+
+def line_before_runtest_exit_code(lines):
+  last_line = None
+  for line in lines:
+    if last_line and line.startswith(RUNTEST_EXIT_CODE_PREFIX):
+      return [last_line]
+    last_line = line
+  return None
 
 
 def fancy_case_master_name(master_url):
@@ -62,7 +172,33 @@ def fancy_case_master_name(master_url):
   return master_name.title().replace('.', '')
 
 
+class GTestLines(log_scanner.LineMatcher):
+  """Feeds log_parser only the lines its FailedTests() depends on.
+
+  GTestLogParser keeps state across lines, so it still sees every status
+  line in order, but the test output in between never reaches python.
+  """
+  # A test starting, passing or failing, and the timeout and retry lines
+  # which change the status of a test already started.
+  LITERALS = ['[ RUN      ]', '[       OK ]', '[  FAILED  ]', 'Test timeout (', 'RETRYING FAILED TESTS:']
+  PATTERNS = [(literal, re.escape(literal)) for literal in LITERALS]
+
+  def __init__(self, log_parser):
+    super(GTestLines, self).__init__()
+    self.log_parser = log_parser
+
+  def consume(self, line_number, line):
+    self.log_parser.ProcessLine(line)
+
+  def result(self):
+    return self.log_parser.FailedTests()
+
+
 # These are reason finders, more than splitters?
+#
+# split_step returns the failure reasons for a step, [] if it couldn't
+# find any, or None if the logs or results it needed couldn't be fetched
+# (so there's no answer yet, rather than no reasons).
 class GTestSplitter(object):
   def handles_step(self, step):
     step_name = step['name']
@@ -85,36 +221,54 @@ class GTestSplitter(object):
       'testtype': step['name'],
     }
     base_url = 'http://test-results.appspot.com/testfile'
-    response = requests.get(base_url, params=params)
+    response = buildbot.http_get(base_url, params=params)
     if response.status_code == 200:
       test_results = response.json()['tests']
       return [name for name, results in test_results.items() if results['expected'] != results['actual']]
 
+    # The summary at the end of the log is usually enough, and is
+    # much less to download than the whole log.
+    failed_tests = search_stdio_tail(master_url, builder_name, build, step, gtest_summary_failures,
+      max_bytes=GTEST_SUMMARY_MAX_BYTES, stream_without_ranges=False)
+    if failed_tests:
+      return failed_tests
+
     log.warn('test-results missing %s %s %s, using GTestLogParser.' % (builder_name, build['number'], step['name']))
-    stdio_log = stdio_for_step(master_url, builder_name, build, step)
+    stdio_chunks = stdio_chunks_for_step(master_url, builder_name, build, step)
     # Can't split if we can't get the logs.
-    if not stdio_log:
+    if stdio_chunks is None:
       return None
 
     # Lines this fails for:
     #[  FAILED  ] ExtensionApiTest.TabUpdate, where TypeParam =  and GetParam() =  (10907 ms)
 
-    log_parser = gtest_utils.GTestLogParser()
-    for line in stdio_log.split('\n'):
-      log_parser.ProcessLine(line)
-
-    failed_tests = log_parser.FailedTests()
+    failed_tests = log_scanner.scan_log(stdio_chunks, GTestLines(gtest_utils.GTestLogParser()))
     if failed_tests:
       return failed_tests
     # Failed to split, just group with the general failures.
-    log.debug('First Line: %s' % stdio_log.split('\n')[0])
-    return None
+    log.debug('GTestLogParser found no failures in %s %s %s' % (builder_name, build['number'], step['name']))
+    return []
 
 
 # Our Android tests produce very gtest-like output, but not
 # quite GTestLogParser-compatible (it parse the name of the
 # test as org.chromium).
 
+class FailedTestLines(log_scanner.LineMatcher):
+  FAILED_REGEXP = re.compile('\[\s+FAILED\s+\] (?P<test_name>\S+)( \(.*\))?$')
+  PATTERNS = [('FAILED', FAILED_REGEXP.pattern)]
+
+  def __init__(self):
+    super(FailedTestLines, self).__init__()
+    self.failed_tests = []
+
+  def consume(self, line_number, line):
+    self.failed_tests.append(self.FAILED_REGEXP.search(line).group('test_name'))
+
+  def result(self):
+    return self.failed_tests
+
+
 class JUnitSplitter(object):
   def handles_step(self, step):
     KNOWN_STEPS = [
@@ -123,28 +277,21 @@ class JUnitSplitter(object):
     ]
     return step['name'] in KNOWN_STEPS
 
-  FAILED_REGEXP = re.compile('\[\s+FAILED\s+\] (?P<test_name>\S+)( \(.*\))?$')
-
   def failed_tests_from_stdio(self, stdio):
-    failed_tests = []
-    for line in stdio.split('\n'):
-      match = self.FAILED_REGEXP.search(line)
-      if match:
-        failed_tests.append(match.group('test_name'))
-    return failed_tests
+    return log_scanner.scan_log([stdio], FailedTestLines())
 
   def split_step(self, step, build, builder_name, master_url):
-    stdio_log = stdio_for_step(master_url, builder_name, build, step)
+    stdio_chunks = stdio_chunks_for_step(master_url, builder_name, build, step)
     # Can't split if we can't get the logs.
-    if not stdio_log:
+    if stdio_chunks is None:
       return None
 
-    failed_tests = self.failed_tests_from_stdio(stdio_log)
+    failed_tests = log_scanner.scan_log(stdio_chunks, FailedTestLines())
     if failed_tests:
       return failed_tests
     # Failed to split, just group with the general failures.
-    log.debug('First Line: %s' % stdio_log.split('\n')[0])
-    return None
+    log.debug('No [  FAILED  ] lines in %s %s %s' % (builder_name, build['number'], step['name']))
+    return []
 
 
 def decode_results(results, include_expected=False):
@@ -200,7 +347,7 @@ class LayoutTestsSplitter(object):
     if not archive_step:
       log.warn('No archive step in %s' % url_to_build)
       # print json.dumps(build['steps'], indent=1)
-      return None
+      return []
 
     html_results_url = archive_step['urls'].get('layout test results')
     # FIXME: Here again, Android is a special snowflake.
@@ -213,17 +360,17 @@ class LayoutTestsSplitter(object):
       if webkit_tests_step['results'][0] != 5:
         log.warn('No results url for archive step in %s' % url_to_build)
       # print json.dumps(archive_step, indent=1)
-      return None
+      return []
 
     # !@?#!$^&$% WTF HOW DO URLS HAVE \r in them!?!
     html_results_url = html_results_url.replace('\r', '')
 
     jsonp_url = urlparse.urljoin(html_results_url, 'failing_results.json')
     # FIXME: Silly that this is still JSONP.
-    jsonp_string = requests.get(jsonp_url).text
+    jsonp_string = buildbot.http_get(jsonp_url).text
     if "The specified key does not exist" in jsonp_string:
       log.warn('%s %s %s missing failing_results.json' % (builder_name, build['number'], step['name']))
-      return None
+      return []
 
     json_string = jsonp_string[len('ADD_RESULTS('):-len(');')]
     try:
@@ -235,9 +382,35 @@ class LayoutTestsSplitter(object):
       print archive_step['urls']
       print html_results_url
       print "Failed %s, %s at decode of: %s" % (jsonp_url, e, jsonp_string)
+      # Probably cut short, so worth fetching again.
+      return None
 
     # Failed to split, just group with the general failures.
-    return None
+    return []
+
+
+class CompileFailureLines(log_scanner.LineMatcher):
+  """The error on the line after the first 'FAILED: ' line, if there is one."""
+  ERROR_REGEXP = re.compile(r'(?P<path>.*):(?P<line>\d+):(?P<column>\d+): error:')
+  PATTERNS = [('FAILED: ', '^FAILED: '), (': error:', ERROR_REGEXP.pattern)]
+
+  def __init__(self):
+    super(CompileFailureLines, self).__init__()
+    self.failed_line_number = None
+    self.failure = None
+
+  def consume(self, line_number, line):
+    if self.failed_line_number is None:
+      if line.startswith('FAILED: '):
+        self.failed_line_number = line_number
+      return
+    match = self.ERROR_REGEXP.match(line)
+    if match and line_number == self.failed_line_number + 1:
+      self.failure = ['%s:%s' % (match.group('path'), match.group('line'))]
+    self.done = True
+
+  def result(self):
+    return self.failure
 
 
 class CompileSplitter(object):
@@ -253,27 +426,12 @@ class CompileSplitter(object):
 # obj/chrome/browser/extensions/interactive_ui_tests.extension_commands_global_registry_apitest.o:extension_commands_global_registry_apitest.cc:function extensions::SendNativeKeyEventToXDisplay(ui::KeyboardCode, bool, bool, bool): error: undefined reference to 'gfx::GetXDisplay()'
 
   def split_step(self, step, build, builder_name, master_url):
-    stdio = stdio_for_step(master_url, builder_name, build, step)
+    stdio_chunks = stdio_chunks_for_step(master_url, builder_name, build, step)
     # Can't split if we can't get the logs.
-    if not stdio:
+    if stdio_chunks is None:
       return None
 
-    compile_regexp = re.compile(r'(?P<path>.*):(?P<line>\d+):(?P<column>\d+): error:')
-
-    # FIXME: I'm sure there is a cleaner way to do this.
-    next_line_is_failure = False
-    for line in stdio.split('\n'):
-      if not next_line_is_failure:
-        if line.startswith('FAILED: '):
-          next_line_is_failure = True
-        continue
-
-      match = compile_regexp.match(line)
-      if match:
-        return ['%s:%s' % (match.group('path'), match.group('line'))]
-      break
-
-    return None
+    return log_scanner.scan_log(stdio_chunks, CompileFailureLines()) or []
 
 
 # This is a hack I wrote because all the perf bots are failing with:
@@ -287,16 +445,8 @@ class GenericRunTests(object):
     return True
 
   def split_step(self, step, build, builder_name, master_url):
-    stdio = stdio_for_step(master_url, builder_name, build, step)
-    # Can't split if we can't get the logs.
-    if not stdio:
-      return None
-
-    last_line = None
-    for line in stdio.split('\n'):
-      if last_line and line.startswith('exit code (as seen by runtest.py):'):
-        return [last_line]
-      last_line = line
+    # runtest.py prints this at the very end, so only read the end.
+    return search_stdio_tail(master_url, builder_name, build, step, line_before_runtest_exit_code)
 
 
 STEP_SPLITTERS = [
@@ -2,7 +2,11 @@
 # Use of this source code is governed by a BSD-style license that can be
 # found in the LICENSE file.
 
+import os
+import shutil
+import tempfile
 import unittest
+import fake_log_server
 import reasons
 
 
@@ -21,5 +25,101 @@ C   59.798s Main  [  FAILED  ] org.chromium.mojo.system.impl.CoreImplTest#testAs
         self.assertEquals(splitter.failed_tests_from_stdio(stdio), expected)
 
 
+class GTestLinesTest(unittest.TestCase):
+    def test_matches_unfiltered_parse(self):
+        stdio = """Note: Google Test filter = *
+[==========] Running 4 tests from 2 test cases.
+[----------] 2 tests from ExtensionApiTest
+[ RUN      ] ExtensionApiTest.TabUpdate
+[1234:5678:0709/112233:INFO:tab_updater.cc(12)] Updating tab
+../../chrome/browser/extensions/tab_test.cc:40: Failure
+Value of: tab.url
+[  FAILED  ] ExtensionApiTest.TabUpdate (10907 ms)
+[ RUN      ] ExtensionApiTest.Hangs
+[1234:5678:0709/112233:INFO:hang.cc(3)] Waiting forever
+[ RUN      ] WebViewTest.Shim
+[       OK ] WebViewTest.Shim (12 ms)
+[ RUN      ] WebViewTest.Slow
+Test timeout (45000 ms) exceeded for WebViewTest.Slow
+[----------] 2 tests from WebViewTest (57 ms total)
+[==========] 4 tests from 2 test cases ran. (182563 ms total)
+[  PASSED  ] 1 test.
+[  FAILED  ] 3 tests, listed below:
+[  FAILED  ] ExtensionApiTest.TabUpdate
+[  FAILED  ] ExtensionApiTest.Hangs
+[  FAILED  ] WebViewTest.Slow
+"""
+        unfiltered = reasons.gtest_utils.GTestLogParser()
+        for line in stdio.split('\n'):
+            unfiltered.ProcessLine(line)
+        filtered = reasons.log_scanner.scan_log([stdio], reasons.GTestLines(reasons.gtest_utils.GTestLogParser()))
+        self.assertTrue(unfiltered.FailedTests())
+        self.assertEquals(sorted(filtered), sorted(unfiltered.FailedTests()))
+
+
+class CompileFailureLinesTest(unittest.TestCase):
+    def compile_failure(self, stdio):
+        return reasons.log_scanner.scan_log([stdio], reasons.CompileFailureLines())
+
+    def test_compile_failure(self):
+        stdio = """ninja: Entering directory `out/Release'
+../../v8/src/base/platform/time.cc:10:1: error: not after a FAILED line
+FAILED: /mnt/data/b/build/goma/gomacc ...
+../../v8/src/base/platform/time.cc:590:7: error: use of undeclared identifier 'close'
+FAILED: /mnt/data/b/build/goma/gomacc ...
+../../v8/src/other.cc:1:1: error: only the first failure is used
+"""
+        self.assertEquals(self.compile_failure(stdio), ['../../v8/src/base/platform/time.cc:590'])
+
+    def test_linker_failure(self):
+        stdio = """FAILED: /b/build/goma/gomacc ...
+obj/chrome/browser/foo.o:foo.cc:function Foo(): error: undefined reference to 'Bar()'
+../../v8/src/base/platform/time.cc:590:7: error: not on the line after
+"""
+        self.assertEquals(self.compile_failure(stdio), None)
+
+
+class StdioTailTest(unittest.TestCase):
+    def test_gtest_summary_failures(self):
+        stdio = """
+[  FAILED  ] ExtensionApiTest.TabUpdate, where TypeParam =  and GetParam() =  (10907 ms)
+[==========] 1432 tests from 212 test cases ran. (182563 ms total)
+[  PASSED  ] 1430 tests.
+[  FAILED  ] 2 tests, listed below:
+[  FAILED  ] ExtensionApiTest.TabUpdate, where TypeParam =  and GetParam() =
+[  FAILED  ] WebViewTest.Shim
+
+ 2 FAILED TESTS
+"""
+        self.assertEquals(reasons.gtest_summary_failures(stdio.split('\n')),
+            ['ExtensionApiTest.TabUpdate', 'WebViewTest.Shim'])
+        self.assertEquals(reasons.gtest_summary_failures(['[  FAILED  ] WebViewTest.Shim (10 ms)']), None)
+
+    def test_line_before_runtest_exit_code(self):
+        lines = ['E    0.009s Main  File not found', 'exit code (as seen by runtest.py): 1', '']
+        self.assertEquals(reasons.line_before_runtest_exit_code(lines), ['E    0.009s Main  File not found'])
+        self.assertEquals(reasons.line_before_runtest_exit_code(lines[:1]), None)
+
+    def test_gtest_summary_search_is_short(self):
+        temp_dir = tempfile.mkdtemp()
+        server = fake_log_server.LogServer(temp_dir)
+        server.start()
+        try:
+            build, step = {'number': 1}, {'name': 'browser_tests'}
+            stdio_url = reasons.stdio_url_for_step(server.url, 'Linux', build, step)
+            stdio_path = os.path.join(temp_dir, stdio_url[len(server.url) + 1:])
+            os.makedirs(os.path.dirname(stdio_path))
+            # A crash: lots of output and no summary.
+            with open(stdio_path, 'w') as stdio_file:
+                stdio_file.write('[ RUN      ] Suite.Test\n' * 100000)
+            failures = reasons.search_stdio_tail(server.url, 'Linux', build, step, reasons.gtest_summary_failures,
+                max_bytes=reasons.GTEST_SUMMARY_MAX_BYTES, stream_without_ranges=False)
+            self.assertEquals(failures, None)
+            self.assertEquals([header for _, header in server.requests], ['bytes=-65536', 'bytes=-262144'])
+        finally:
+            server.stop()
+            shutil.rmtree(temp_dir)
+
+
 if __name__ == '__main__':
     unittest.main()
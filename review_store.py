@@ -0,0 +1,62 @@
+# Compact store of the Rietveld review fields cycletimes uses.
+#
+# Keyed by (review_base_url, review_id).  Closed reviews don't change
+# so are kept forever, open reviews are only trusted for a while.
+
+import datetime
+import json
+import sqlite3
+import threading
+import time
+
+
+CQ_START_PREFIX = 'CQ is trying da patch.'
+
+
+def compact_review(review):
+    """Reduces a Rietveld api/<id>?messages=true response to what review_times needs."""
+    messages = review['messages']
+    return {
+        'created': review['created'],
+        'closed': bool(review.get('closed')),
+        'message_count': len(messages),
+        'sent': messages[0]['date'] if messages else None,
+        'lgtms': [m['date'] for m in messages if m['approval']],
+        # We could also look for "The CQ bit was checked by" instead
+        # but I'm not sure how long rietveld has been adding that.
+        'cq_starts': [m['date'] for m in messages if m['text'].startswith(CQ_START_PREFIX)],
+    }
+
+
+class ReviewStore(object):
+    def __init__(self, path, open_review_ttl=datetime.timedelta(days=1)):
+        self.open_review_ttl = open_review_ttl
+        self._lock = threading.Lock()
+        # update --jobs reads and writes from several threads.
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS reviews ('
+            'review_base_url TEXT, review_id INTEGER, fetched REAL, closed INTEGER, review TEXT, '
+            'PRIMARY KEY (review_base_url, review_id))')
+        self._connection.commit()
+
+    def get(self, review_base_url, review_id):
+        """Returns the compact review, or None if missing or expired."""
+        with self._lock:
+            row = self._connection.execute('SELECT fetched, closed, review FROM reviews '
+                'WHERE review_base_url = ? AND review_id = ?', (review_base_url, review_id)).fetchone()
+        if not row:
+            return None
+        fetched, closed, review = row
+        if not closed and time.time() - fetched > self.open_review_ttl.total_seconds():
+            return None
+        return json.loads(review)
+
+    def set(self, review_base_url, review_id, review):
+        """Stores a full review response, returns its compact form."""
+        compact = compact_review(review)
+        with self._lock:
+            self._connection.execute('INSERT OR REPLACE INTO reviews VALUES (?, ?, ?, ?, ?)',
+                (review_base_url, review_id, time.time(), compact['closed'],
+                json.dumps(compact, separators=(',', ':'))))
+            self._connection.commit()
+        return compact
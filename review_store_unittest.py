@@ -0,0 +1,90 @@
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+import review_store
+
+
+class FakeTime(object):
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+def rietveld_review(closed=False):
+    return {
+        'created': '2014-05-01 10:00:00.123456',
+        'closed': closed,
+        'subject': 'Not kept',
+        'messages': [
+            {'date': '2014-05-01 10:05:00.000000', 'approval': False, 'text': 'PTAL'},
+            {'date': '2014-05-01 11:00:00.000000', 'approval': True, 'text': 'lgtm'},
+            {'date': '2014-05-01 11:01:00.000000', 'approval': False, 'text': 'CQ is trying da patch. Follow status at'},
+            {'date': '2014-05-01 12:00:00.000000', 'approval': True, 'text': 'lgtm again'},
+        ],
+    }
+
+
+class ReviewStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.original_time = review_store.time
+        self.fake_time = FakeTime(1400000000)
+        review_store.time = self.fake_time
+        self.store = review_store.ReviewStore(os.path.join(self.temp_dir, 'reviews.sqlite'),
+            open_review_ttl=datetime.timedelta(hours=1))
+
+    def tearDown(self):
+        review_store.time = self.original_time
+        shutil.rmtree(self.temp_dir)
+
+    def test_compact_review(self):
+        self.assertEquals(review_store.compact_review(rietveld_review()), {
+            'created': '2014-05-01 10:00:00.123456',
+            'closed': False,
+            'message_count': 4,
+            'sent': '2014-05-01 10:05:00.000000',
+            'lgtms': ['2014-05-01 11:00:00.000000', '2014-05-01 12:00:00.000000'],
+            'cq_starts': ['2014-05-01 11:01:00.000000'],
+        })
+        review = rietveld_review()
+        review['messages'] = []
+        self.assertEquals(review_store.compact_review(review)['sent'], None)
+
+    def test_open_reviews_expire(self):
+        url = 'https://codereview.chromium.org'
+        self.assertEquals(self.store.get(url, 1234), None)
+        compact = self.store.set(url, 1234, rietveld_review())
+        self.assertEquals(self.store.get(url, 1234), compact)
+        self.assertEquals(self.store.get('https://chromiumcodereview.appspot.com', 1234), None)
+
+        self.fake_time.now += 60 * 60
+        self.assertEquals(self.store.get(url, 1234), compact)
+        self.fake_time.now += 1
+        self.assertEquals(self.store.get(url, 1234), None)
+
+        # Refetching starts the clock again.
+        self.store.set(url, 1234, rietveld_review())
+        self.assertEquals(self.store.get(url, 1234), compact)
+
+    def test_closed_reviews_never_expire(self):
+        url = 'https://codereview.chromium.org'
+        compact = self.store.set(url, 1234, rietveld_review(closed=True))
+        self.assertTrue(compact['closed'])
+        self.fake_time.now += 365 * 24 * 60 * 60
+        self.assertEquals(self.store.get(url, 1234), compact)
+
+        # The store is on disk, so other runs see it too.
+        store = review_store.ReviewStore(os.path.join(self.temp_dir, 'reviews.sqlite'))
+        self.assertEquals(store.get(url, 1234), compact)
+
+
+if __name__ == '__main__':
+    unittest.main()
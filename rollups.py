@@ -0,0 +1,138 @@
+# Per-month summaries of the time between each pair of events, so
+# by_month doesn't have to reload the whole history.
+#
+# Each summary keeps counts, a sum and a quantile sketch, all of which
+# can be merged, so months can be combined after the fact.
+
+import json
+import math
+import numpy
+
+
+class QuantileSketch(object):
+    """Mergeable histogram of non-negative values in log-spaced buckets.
+
+    Quantiles are accurate to within about (GAMMA - 1) / 2 of the true value.
+    """
+    GAMMA = 1.02
+    ZERO_BUCKET = -1
+
+    def __init__(self, buckets=None):
+        self.buckets = buckets or {}
+
+    def add_values(self, values):
+        values = numpy.asarray(values)
+        indexes = numpy.full(len(values), self.ZERO_BUCKET, dtype=numpy.int64)
+        positive = values > 0
+        indexes[positive] = numpy.ceil(numpy.log(values[positive]) / math.log(self.GAMMA))
+        for index, count in zip(*numpy.unique(indexes, return_counts=True)):
+            self.buckets[int(index)] = self.buckets.get(int(index), 0) + int(count)
+
+    def merge(self, other):
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+
+    def _bucket_value(self, index):
+        if index == self.ZERO_BUCKET:
+            return 0
+        # Bucket index i holds (GAMMA^(i-1), GAMMA^i].
+        return 2 * self.GAMMA ** index / (self.GAMMA + 1)
+
+    def quantile(self, fraction):
+        total = sum(self.buckets.values())
+        if not total:
+            return float('nan')
+        rank = fraction * (total - 1)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                return self._bucket_value(index)
+
+    # Serialized densely as [first_index, count, count, ...] which is
+    # much smaller than a dict since most buckets in range are used.
+    def to_json(self):
+        if not self.buckets:
+            return []
+        first = min(self.buckets)
+        return [first] + [self.buckets.get(index, 0) for index in range(first, max(self.buckets) + 1)]
+
+    @classmethod
+    def from_json(cls, buckets_json):
+        if not buckets_json:
+            return cls()
+        first = buckets_json[0]
+        return cls(dict((first + offset, count) for offset, count in enumerate(buckets_json[1:]) if count))
+
+
+class IntervalRollup(object):
+    """Time between two events over a set of changes.
+
+    count is every change, ignored those with a missing or negative
+    interval and missing those with a missing endpoint.
+    """
+    def __init__(self, count=0, ignored=0, missing=0, total_seconds=0, sketch=None):
+        self.count = count
+        self.ignored = ignored
+        self.missing = missing
+        self.total_seconds = total_seconds
+        self.sketch = sketch or QuantileSketch()
+
+    @classmethod
+    def from_times(cls, count, times, missing):
+        rollup = cls(count, count - len(times), int(missing), int(numpy.sum(times)))
+        rollup.sketch.add_values(times)
+        return rollup
+
+    def merge(self, other):
+        self.count += other.count
+        self.ignored += other.ignored
+        self.missing += other.missing
+        self.total_seconds += other.total_seconds
+        self.sketch.merge(other.sketch)
+
+    def mean(self):
+        kept = self.count - self.ignored
+        return float(self.total_seconds) / kept if kept else float('nan')
+
+    def median(self):
+        return self.sketch.quantile(0.5)
+
+    def to_json(self):
+        return {
+            'count': self.count,
+            'ignored': self.ignored,
+            'missing': self.missing,
+            'total_seconds': self.total_seconds,
+            'sketch': self.sketch.to_json(),
+        }
+
+    @classmethod
+    def from_json(cls, rollup_json):
+        return cls(rollup_json['count'], rollup_json['ignored'], rollup_json['missing'],
+            rollup_json['total_seconds'], QuantileSketch.from_json(rollup_json['sketch']))
+
+
+def pair_key(from_key, to_key):
+    return '%s:%s' % (from_key, to_key)
+
+
+def month_sort_key(month):
+    # Months are '%m/%Y' to match by_month's output.
+    month_number, year = month.split('/')
+    return int(year), int(month_number)
+
+
+def write_rollups(path, rollups_by_month):
+    """rollups_by_month is {month: {pair_key: IntervalRollup}}."""
+    rollups_json = dict((month, dict((key, rollup.to_json()) for key, rollup in pairs.items()))
+        for month, pairs in rollups_by_month.items())
+    with open(path, 'w') as rollups_file:
+        json.dump(rollups_json, rollups_file, separators=(',', ':'), sort_keys=True)
+
+
+def read_rollups(path):
+    with open(path) as rollups_file:
+        rollups_json = json.load(rollups_file)
+    return dict((month, dict((key, IntervalRollup.from_json(rollup)) for key, rollup in pairs.items()))
+        for month, pairs in rollups_json.items())
@@ -0,0 +1,95 @@
+# Copyright 2014 The Chromium Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+import math
+import os
+import random
+import shutil
+import tempfile
+import unittest
+import numpy
+import rollups
+
+
+def exact_quantile(values, fraction):
+    # The value QuantileSketch.quantile approximates.
+    return sorted(values)[int(math.floor(fraction * (len(values) - 1)))]
+
+
+class QuantileSketchTest(unittest.TestCase):
+    FRACTIONS = [0, 0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99, 1]
+
+    def assert_within_error(self, sketch, values):
+        max_error = (rollups.QuantileSketch.GAMMA - 1) / 2
+        for fraction in self.FRACTIONS:
+            exact = exact_quantile(values, fraction)
+            estimate = sketch.quantile(fraction)
+            if exact == 0:
+                self.assertEquals(estimate, 0)
+            else:
+                self.assertTrue(abs(estimate - exact) / exact <= max_error,
+                    '%s quantile: %s is not within %s of %s' % (fraction, estimate, max_error, exact))
+
+    def test_error_bound(self):
+        rand = random.Random(10)
+        # Interval lengths in seconds, from a few seconds to months.
+        values = [int(rand.lognormvariate(10, 2)) for _ in range(5000)] + [0] * 100 + [1, 2, 3]
+        sketch = rollups.QuantileSketch()
+        sketch.add_values(numpy.array(values))
+        self.assert_within_error(sketch, values)
+
+    def test_merge(self):
+        rand = random.Random(11)
+        first = [rand.randint(0, 100000) for _ in range(1000)]
+        second = [rand.randint(50000, 10000000) for _ in range(3000)]
+        merged = rollups.QuantileSketch()
+        merged.add_values(first)
+        other = rollups.QuantileSketch()
+        other.add_values(second)
+        merged.merge(other)
+
+        whole = rollups.QuantileSketch()
+        whole.add_values(first + second)
+        self.assertEquals(merged.buckets, whole.buckets)
+        self.assert_within_error(merged, first + second)
+
+    def test_json(self):
+        sketch = rollups.QuantileSketch()
+        self.assertEquals(sketch.to_json(), [])
+        self.assertTrue(math.isnan(sketch.quantile(0.5)))
+        self.assertEquals(rollups.QuantileSketch.from_json([]).buckets, {})
+        sketch.add_values([0, 0, 5, 5000, 5100])
+        self.assertEquals(rollups.QuantileSketch.from_json(sketch.to_json()).buckets, sketch.buckets)
+
+
+class IntervalRollupTest(unittest.TestCase):
+    def test_merge_and_json(self):
+        first = rollups.IntervalRollup.from_times(5, numpy.array([10, 20, 30]), 1)
+        second = rollups.IntervalRollup.from_times(3, numpy.array([40]), 2)
+        self.assertEquals((first.count, first.ignored, first.missing, first.total_seconds), (5, 2, 1, 60))
+        self.assertEquals(first.mean(), 20)
+        first.merge(second)
+        self.assertEquals((first.count, first.ignored, first.missing, first.total_seconds), (8, 4, 3, 100))
+        self.assertEquals(first.mean(), 25)
+
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, 'rollups.json')
+            pair = rollups.pair_key('review_sent_date', 'commit_date')
+            rollups.write_rollups(path, {'05/2014': {pair: first}})
+            read = rollups.read_rollups(path)['05/2014'][pair]
+            self.assertEquals(read.to_json(), first.to_json())
+            self.assertEquals(read.median(), first.median())
+        finally:
+            shutil.rmtree(temp_dir)
+
+        self.assertTrue(math.isnan(rollups.IntervalRollup.from_times(2, numpy.array([]), 2).mean()))
+
+    def test_month_sort_key(self):
+        months = ['01/2015', '12/2014', '02/2014']
+        self.assertEquals(sorted(months, key=rollups.month_sort_key), ['02/2014', '12/2014', '01/2015'])
+
+
+if __name__ == '__main__':
+    unittest.main()